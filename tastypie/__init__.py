@@ -1,4 +1,5 @@
 import inspect
+import threading
 from tastypie.exceptions import URLReverseError
 
 
@@ -22,7 +23,11 @@ __version__ = (0, 6, 0)
 #             'representations': {
 #                 # Note - ``NoteRepresentation.__name__``, NOT ``NoteRepresentation`` the class.
 #                 'NoteRepresentation': 'notes',
-#             }
+#             },
+#             'canonicals': {
+#                 # The index actually used to build URIs, by class.
+#                 <class 'NoteRepresentation'>: 'notes',
+#             },
 #         },
 #         'v2': {
 #             'class': <Api object>,
@@ -34,72 +39,101 @@ __version__ = (0, 6, 0)
 #                 # Note - ``CustomNoteRepresentation.__name__``, NOT ``CustomNoteRepresentation`` the class.
 #                 'CustomNoteRepresentation': 'notes',
 #                 'UserRepresentation': 'users',
-#             }
+#             },
+#             'canonicals': {
+#                 <class 'CustomNoteRepresentation'>: 'notes',
+#                 <class 'UserRepresentation'>: 'users',
+#             },
 #         },
 #     }
 available_apis = {}
 
+# Requests only ever read from ``available_apis``. Changes to it are
+# serialized so that a registration happening in one thread can't interleave
+# with another one.
+_registry_lock = threading.RLock()
 
-def _add_resource(api, resource, canonical=True):
-    if not api.api_name in available_apis:
-        available_apis[api.api_name] = {
-            'class': api,
-            'resources': [],
-            'representations': {},
-        }
+
+def _get_representation_class(representation):
+    if inspect.isclass(representation):
+        return representation
     
-    if not resource.resource_name in available_apis[api.api_name]['resources']:
-        available_apis[api.api_name]['resources'].append(resource.resource_name)
+    return representation.__class__
+
+
+def _add_resource(api, resource, canonical=True):
+    _registry_lock.acquire()
     
-    if canonical is True:
-        repr_name = resource.detail_representation.__name__
-        available_apis[api.api_name]['representations'][repr_name] = resource.resource_name
+    try:
+        if not api.api_name in available_apis:
+            available_apis[api.api_name] = {
+                'class': api,
+                'resources': [],
+                'representations': {},
+                'canonicals': {},
+            }
+        
+        if not resource.resource_name in available_apis[api.api_name]['resources']:
+            available_apis[api.api_name]['resources'].append(resource.resource_name)
+        
+        if canonical is True:
+            representation_class = _get_representation_class(resource.detail_representation)
+            available_apis[api.api_name]['representations'][representation_class.__name__] = resource.resource_name
+            available_apis[api.api_name]['canonicals'][representation_class] = resource.resource_name
+    finally:
+        _registry_lock.release()
 
 
 def _remove_resource(api, resource):
-    if not api.api_name in available_apis:
-        return False
+    _registry_lock.acquire()
     
     try:
-        resource_offset = available_apis[api.api_name]['resources'].index(resource.resource_name)
-        del(available_apis[api.api_name]['resources'][resource_offset])
-    except (ValueError, IndexError):
-        return False
-    
-    if inspect.isclass(resource.detail_representation):
-        representation_name = resource.detail_representation.__name__
-    else:
-        representation_name = resource.detail_representation.__class__.__name__
-    
-    if representation_name in available_apis[api.api_name]['representations']:
-        if available_apis[api.api_name]['representations'][representation_name] == resource.resource_name:
-            del(available_apis[api.api_name]['representations'][representation_name])
-    
-    return True
+        if not api.api_name in available_apis:
+            return False
+        
+        try:
+            resource_offset = available_apis[api.api_name]['resources'].index(resource.resource_name)
+            del(available_apis[api.api_name]['resources'][resource_offset])
+        except (ValueError, IndexError):
+            return False
+        
+        representation_name = _get_representation_class(resource.detail_representation).__name__
+        
+        if representation_name in available_apis[api.api_name]['representations']:
+            if available_apis[api.api_name]['representations'][representation_name] == resource.resource_name:
+                del(available_apis[api.api_name]['representations'][representation_name])
+        
+        # Whichever representations pointed at the resource can't anymore.
+        canonicals = available_apis[api.api_name]['canonicals']
+        
+        for representation_class, resource_name in canonicals.items():
+            if resource_name == resource.resource_name:
+                del(canonicals[representation_class])
+        
+        return True
+    finally:
+        _registry_lock.release()
 
 
 def _get_canonical_resource_name(api_name, representation):
-    if inspect.isclass(representation) and getattr(representation, '__name__', None):
-        representation_name = representation.__name__
-    else:
-        representation_name = representation.__class__.__name__
-    
-    if not api_name in available_apis:
-        raise URLReverseError("The api_name '%s' does not appear to have been instantiated." % api_name)
+    """
+    Returns the name of the canonical resource for the ``representation``
+    (either a class or an instance) within the ``api_name``.
     
-    if not 'representations' in available_apis[api_name]:
-        raise URLReverseError("The api_name '%s' does not appear to have any representations registered." % api_name)
-    
-    if not 'resources' in available_apis[api_name]:
-        raise URLReverseError("The api_name '%s' does not appear to have any resources registered." % api_name)
+    Raises ``URLReverseError`` if there isn't one.
+    """
+    try:
+        return available_apis[api_name]['canonicals'][representation]
+    except KeyError:
+        pass
     
-    if not representation_name in available_apis[api_name]['representations']:
-        raise URLReverseError("The api '%s' does not have a '%s' representation registered." % (api_name, representation_name))
+    # Either an instance, which is looked up by its class, or a miss.
+    representation_class = _get_representation_class(representation)
     
-    desired_resource_name = available_apis[api_name]['representations'][representation_name]
+    if not api_name in available_apis:
+        raise URLReverseError("The api_name '%s' does not appear to have been instantiated." % api_name)
     
-    # Now verify the resource is in the list.
-    if not desired_resource_name in available_apis[api_name]['resources']:
-        raise URLReverseError("The api '%s' does not have a canonical resource named '%s' registered." % (api_name, desired_resource_name))
+    if representation_class is representation or not representation_class in available_apis[api_name]['canonicals']:
+        raise URLReverseError("The api '%s' does not have a '%s' representation registered." % (api_name, representation_class.__name__))
     
-    return desired_resource_name
+    return available_apis[api_name]['canonicals'][representation_class]
@@ -1,22 +1,25 @@
-import re
+from copy import copy
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse, resolve
-from django.utils import datetime_safe
+from django.db.models.fields import FieldDoesNotExist
 from tastypie.exceptions import ApiFieldError
+from tastypie.utils import parse_date, parse_datetime
 
 
 class NOT_PROVIDED:
     pass
 
 
-DATE_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2}).*?$')
-DATETIME_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})(T|\s+)(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}).*?$')
-
-
 # All the ApiField variants.
 
 class ApiField(object):
-    """The base implementation of a field used by the representations."""
+    """
+    The base implementation of a field used by the representations.
+    
+    Fields are definitions only. They hold no per-object data, so a single
+    instance is shared by every ``Representation`` (and thread) that uses it.
+    The dehydrated/hydrated values live on the ``Representation`` itself.
+    """
     dehydrated_type = 'string'
     
     def __init__(self, attribute=None, default=NOT_PROVIDED, null=False, readonly=False):
@@ -45,7 +48,20 @@ class ApiField(object):
         self._default = default
         self.null = null
         self.readonly = readonly
-        self.value = None
+    
+    def _get_attribute(self):
+        return self._attribute
+    
+    def _set_attribute(self, attribute):
+        # Split the lookup (ex. ``author__username``) once, up front, rather
+        # than every time an object is dehydrated.
+        self._attribute = attribute
+        self._attrs = None
+        
+        if attribute is not None:
+            self._attrs = tuple(attribute.split('__'))
+    
+    attribute = property(_get_attribute, _set_attribute)
     
     def has_default(self):
         """Returns a boolean of whether this field has a default value."""
@@ -64,27 +80,16 @@ class ApiField(object):
         Takes data from the provided object and prepares it for the
         representation.
         """
-        if self.attribute is not None:
-            # Check for `__` in the field for looking through the relation.
-            attrs = self.attribute.split('__')
+        if self._attrs is not None:
+            # Look through the relation(s), if there are any.
             current_object = obj
             
-            for attr in attrs:
+            for attr in self._attrs:
                 current_object = getattr(current_object, attr, None)
                 
                 if current_object is None:
-                    if self.has_default():
-                        current_object = self._default
-                        # Fall out of the loop, given any further attempts at
-                        # accesses will fail misreably.
-                        break
-                    elif self.null:
-                        current_object = None
-                        # Fall out of the loop, given any further attempts at
-                        # accesses will fail misreably.
-                        break
-                    else:
-                        raise ApiFieldError("The model '%r' has an empty attribute '%s' and doesn't allow a default or null value." % (current_object, attr))
+                    # Any further attempts at accesses would fail miserably.
+                    return self.dehydrate_missing(attr, obj)
             
             if callable(current_object):
                 return current_object()
@@ -96,6 +101,18 @@ class ApiField(object):
         else:
             return None
     
+    def dehydrate_missing(self, attr, obj=None):
+        """
+        Handles the ``attribute`` being empty (or missing) on the object,
+        falling back to the ``default``, then ``null``.
+        """
+        if self.has_default():
+            return self.default
+        elif self.null:
+            return None
+        
+        raise ApiFieldError("The model '%r' has an empty attribute '%s' and doesn't allow a default or null value." % (obj, attr))
+    
     def convert(self, value):
         """
         Handles conversion between the data found and the type of the field.
@@ -105,15 +122,15 @@ class ApiField(object):
         """
         return value
     
-    def hydrate(self):
+    def hydrate(self, value=None):
         """
-        Takes data stored on the field and returns it. Used for taking simple
-        data and building a instance object.
+        Takes the data provided for the field and returns it. Used for taking
+        simple data and building a instance object.
         """
         if self.readonly:
             return None
         
-        if self.value is None:
+        if value is None:
             if self.has_default():
                 if callable(self._default):
                     return self._default()
@@ -124,7 +141,7 @@ class ApiField(object):
             else:
                 raise ApiFieldError("The '%s' field has no data and doesn't allow a default or null value." % self.instance_name)
         
-        return self.value
+        return value
 
 
 class CharField(ApiField):
@@ -212,12 +229,9 @@ class DateField(ApiField):
             return None
         
         if isinstance(value, basestring):
-            match = DATE_REGEX.search(value)
-            
-            if match:
-                data = match.groupdict()
-                return datetime_safe.date(int(data['year']), int(data['month']), int(data['day']))
-            else:
+            try:
+                return parse_date(value)
+            except ValueError:
                 raise ApiFieldError("Date provided to '%s' field doesn't appear to be a valid date string: '%s'" % (self.instance_name, value))
         
         return value
@@ -237,12 +251,9 @@ class DateTimeField(ApiField):
             return None
         
         if isinstance(value, basestring):
-            match = DATETIME_REGEX.search(value)
-            
-            if match:
-                data = match.groupdict()
-                return datetime_safe.datetime(int(data['year']), int(data['month']), int(data['day']), int(data['hour']), int(data['minute']), int(data['second']))
-            else:
+            try:
+                return parse_datetime(value)
+            except ValueError:
                 raise ApiFieldError("Datetime provided to '%s' field doesn't appear to be a valid datetime string: '%s'" % (self.instance_name, value))
         
         return value
@@ -295,10 +306,8 @@ class RelatedField(ApiField):
         self.attribute = attribute
         self.related_name = related_name
         self.null = null
+        self.readonly = False
         self.full_repr = full_repr
-        self.value = None
-        self.api_name = None
-        self.resource_name = None
     
     def has_default(self):
         """
@@ -314,15 +323,82 @@ class RelatedField(ApiField):
         """
         raise ApiFieldError("%r fields do not have default data." % self)
     
-    def get_related_representation(self, related_instance):
+    def dehydrate(self, obj, representation=None):
+        """
+        Takes data from the provided object and prepares it for the
+        representation.
+        
+        Optionally accepts the ``representation`` being dehydrated, which
+        is used to build the related representation(s) within the same API.
+        """
+        raise NotImplementedError()
+    
+    def get_related_representation(self, related_instance, representation=None):
         """
         Instaniates the related representation.
+        
+        The ``api_name``/``resource_name`` are taken from the (optional)
+        ``representation`` that contains this field.
         """
-        related_repr = self.to(api_name=self.api_name, resource_name=self.resource_name)
+        api_name = getattr(representation, 'api_name', None)
+        resource_name = getattr(representation, 'resource_name', None)
+        related_repr = self.to(api_name=api_name, resource_name=resource_name)
         # Try to be efficient about DB queries.
         related_repr.instance = related_instance
+        related_repr.identity_map = getattr(representation, 'identity_map', None)
         return related_repr
     
+    def get_link_field(self):
+        """
+        Returns a field like this one, but that always dehydrates to the
+        related URIs, whatever the ``full_repr``.
+        
+        Used for the relations sideloaded via ``?include``, where the related
+        objects are sent alongside the rest rather than nested within them.
+        """
+        if not self.full_repr:
+            return self
+        
+        if getattr(self, '_link_field', None) is None:
+            link_field = copy(self)
+            link_field.full_repr = False
+            self._link_field = link_field
+        
+        return self._link_field
+    
+    def get_identity_key(self, pk):
+        """
+        Returns the key for the related object with the given ``pk`` in the
+        ``identity_map`` of a representation.
+        
+        The ``full_repr`` is part of the key, as it changes what's stored.
+        """
+        return (self.to, self.full_repr, pk)
+    
+    def dehydrate_related_instance(self, related_instance, representation=None):
+        """
+        Builds the related representation for the ``related_instance`` &
+        passes it through ``dehydrate_related``.
+        
+        If the containing ``representation`` has an ``identity_map`` (one
+        shared across the whole response), a related object that was already
+        dehydrated is reused rather than dehydrated again.
+        """
+        identity_map = getattr(representation, 'identity_map', None)
+        pk = getattr(related_instance, 'pk', None)
+        
+        if identity_map is None or pk is None:
+            related_repr = self.get_related_representation(related_instance, representation)
+            return self.dehydrate_related(related_repr)
+        
+        key = self.get_identity_key(pk)
+        
+        if not key in identity_map:
+            related_repr = self.get_related_representation(related_instance, representation)
+            identity_map[key] = self.dehydrate_related(related_repr)
+        
+        return identity_map[key]
+    
     def dehydrate_related(self, related_repr):
         """
         Based on the ``full_repr``, returns either the endpoint or the data
@@ -336,6 +412,25 @@ class RelatedField(ApiField):
             related_repr.full_dehydrate(related_repr.instance)
             return related_repr
     
+    def uses_pk_uris(self):
+        """
+        Returns whether the related URIs can be built from the related pk
+        alone (see ``build_related_uri``), without loading the object.
+        """
+        return bool(getattr(self.to, 'uses_stock_resource_uri', None) and self.to.uses_stock_resource_uri())
+    
+    def build_related_uri(self, pk, representation=None):
+        """
+        Builds the related URI from the related object's ``pk``.
+        
+        The ``api_name``/``resource_name`` are taken from the (optional)
+        ``representation`` that contains this field, to match what
+        ``get_related_representation`` would hand over.
+        """
+        api_name = getattr(representation, 'api_name', None) or ''
+        resource_name = getattr(representation, 'resource_name', None) or ''
+        return self.to.build_resource_uri(pk, api_name, resource_name)
+    
     def build_related_representation(self, value):
         """
         Used to ``hydrate`` the data provided. If just a URL is provided,
@@ -345,17 +440,16 @@ class RelatedField(ApiField):
         """
         if isinstance(value, basestring):
             # We got a URI. Load the object and assign it.
-            self.fk_repr = self.to()
+            related_repr = self.to()
             
             try:
-                self.fk_repr.get_via_uri(value)
-                return self.fk_repr
+                related_repr.get_via_uri(value)
+                return related_repr
             except ObjectDoesNotExist:
                 raise ApiFieldError("Could not find the provided object via resource URI '%s'." % value)
         elif hasattr(value, 'items'):
             # Try to hydrate the data provided.
-            self.fk_repr = self.to(data=value)
-            return self.fk_repr
+            return self.to(data=value)
         else:
             raise ApiFieldError("The '%s' field has was given data that was not a URI and not a dictionary-alike: %s." % (self.instance_name, value))
 
@@ -366,28 +460,94 @@ class ToOneField(RelatedField):
     
     This subclass requires Django's ORM layer to work properly.
     """
-    def __init__(self, to, attribute, related_name=None, null=False, full_repr=False):
-        super(ToOneField, self).__init__(to, attribute, related_name, null=null, full_repr=full_repr)
-        self.fk_repr = None
+    def __init__(self, *args, **kwargs):
+        super(ToOneField, self).__init__(*args, **kwargs)
+        # Cache of model class -> foreign key column (see ``get_pk_attname``).
+        self._pk_attnames = {}
     
-    def dehydrate(self, obj):
-        if not getattr(obj, self.attribute):
+    def get_pk_attname(self, model):
+        """
+        Returns the attribute holding the related object's pk on instances of
+        the ``model`` (ex. ``user_id``), if the ``attribute`` is a (forward)
+        foreign key pointing at the related pk. Otherwise, returns ``None``.
+        """
+        if not model in self._pk_attnames:
+            attname = None
+            
+            try:
+                field = model._meta.get_field(self.attribute)
+            except FieldDoesNotExist:
+                field = None
+            
+            rel = getattr(field, 'rel', None)
+            
+            if rel is not None and field.attname != field.name and rel.field_name == rel.to._meta.pk.name:
+                attname = field.attname
+            
+            self._pk_attnames[model] = attname
+        
+        return self._pk_attnames[model]
+    
+    def get_uri_attname(self, model):
+        """
+        Returns the attribute holding the related object's pk on instances of
+        the ``model`` (see ``get_pk_attname``), if the related URI can be
+        built from that alone. Otherwise, returns ``None``.
+        """
+        if not self.uses_pk_uris():
+            return None
+        
+        return self.get_pk_attname(model)
+    
+    def dehydrate(self, obj, representation=None):
+        if hasattr(obj, '_meta'):
+            if not self.full_repr:
+                attname = self.get_uri_attname(obj.__class__)
+                
+                if attname is not None:
+                    return self.dehydrate_uri(getattr(obj, attname), obj, representation)
+            
+            # Don't even load a related object that's been dehydrated before.
+            identity_map = getattr(representation, 'identity_map', None)
+            attname = self.get_pk_attname(obj.__class__)
+            
+            if identity_map is not None and attname is not None:
+                key = self.get_identity_key(getattr(obj, attname))
+                
+                if key in identity_map:
+                    return identity_map[key]
+        
+        related_instance = getattr(obj, self.attribute)
+        
+        if not related_instance:
+            if not self.null:
+                raise ApiFieldError("The model '%r' has an empty attribute '%s' and doesn't allow a null value." % (obj, self.attribute))
+            
+            return None
+        
+        return self.dehydrate_related_instance(related_instance, representation)
+    
+    def dehydrate_uri(self, pk, obj, representation=None):
+        """
+        Builds the related URI from the related object's ``pk`` (ex. the
+        foreign key column), without loading the related object.
+        """
+        if pk is None:
             if not self.null:
                 raise ApiFieldError("The model '%r' has an empty attribute '%s' and doesn't allow a null value." % (obj, self.attribute))
             
             return None
         
-        self.fk_repr = self.get_related_representation(getattr(obj, self.attribute))
-        return self.dehydrate_related(self.fk_repr)
+        return self.build_related_uri(pk, representation)
     
-    def hydrate(self):
-        if self.value is None:
+    def hydrate(self, value=None):
+        if value is None:
             if self.null:
                 return None
             else:
                 raise ApiFieldError("The '%s' field has no data and doesn't allow a null value." % self.instance_name)
         
-        return self.build_related_representation(self.value)
+        return self.build_related_representation(value)
 
 
 class ForeignKey(ToOneField):
@@ -410,11 +570,7 @@ class ToManyField(RelatedField):
     """
     is_m2m = True
     
-    def __init__(self, to, attribute, related_name=None, null=False, full_repr=False):
-        super(ToManyField, self).__init__(to, attribute, related_name, null=null, full_repr=full_repr)
-        self.m2m_reprs = []
-    
-    def dehydrate(self, obj):
+    def dehydrate(self, obj, representation=None):
         if not obj.pk:
             if not self.null:
                 raise ApiFieldError("The model '%r' does not have a primary key and can not be used in a ToMany context." % obj)
@@ -427,23 +583,34 @@ class ToManyField(RelatedField):
             
             return []
         
-        self.m2m_reprs = []
+        # Use the pks or objects loaded for the whole page (see
+        # ``ModelRepresentation.prefetch``) if they're there.
+        if not self.full_repr and self.uses_pk_uris():
+            prefetched_pks = getattr(obj, '_tastypie_prefetched_pks', {})
+            
+            if self.attribute in prefetched_pks:
+                return [self.build_related_uri(pk, representation) for pk in prefetched_pks[self.attribute]]
+        
         m2m_dehydrated = []
+        prefetched = getattr(obj, '_tastypie_prefetched', {})
         
-        # TODO: Also model-specific and leaky. Relies on there being a
-        #       ``Manager`` there.
-        for m2m in getattr(obj, self.attribute).all():
-            m2m_repr = self.get_related_representation(m2m)
-            self.m2m_reprs.append(m2m_repr)
-            m2m_dehydrated.append(self.dehydrate_related(m2m_repr))
+        if self.attribute in prefetched:
+            related_objects = prefetched[self.attribute]
+        else:
+            # TODO: Also model-specific and leaky. Relies on there being a
+            #       ``Manager`` there.
+            related_objects = getattr(obj, self.attribute).all()
+        
+        for m2m in related_objects:
+            m2m_dehydrated.append(self.dehydrate_related_instance(m2m, representation))
         
         return m2m_dehydrated
     
-    def hydrate(self):
+    def hydrate(self, value=None):
         pass
     
-    def hydrate_m2m(self):
-        if self.value is None:
+    def hydrate_m2m(self, value=None):
+        if value is None:
             if self.null:
                 return None
             else:
@@ -451,8 +618,8 @@ class ToManyField(RelatedField):
         
         m2m_hydrated = []
         
-        for value in self.value:
-            m2m_hydrated.append(self.build_related_representation(value))
+        for related_value in value:
+            m2m_hydrated.append(self.build_related_representation(related_value))
         
         return m2m_hydrated
 
@@ -29,7 +29,8 @@ class Paginator(object):
         implements slicing. Required.
         
         Optionally accepts a ``limit`` argument, which specifies how many
-        items to show at a time. Defaults to ``None``, which is no limit.
+        items to show at a time. Defaults to ``None``, which uses the
+        ``API_LIMIT_PER_PAGE`` setting. A ``limit`` of 0 means no limit.
         
         Optionally accepts an ``offset`` argument, which specifies where in
         the ``objects`` to start displaying results from. Defaults to 0.
@@ -79,18 +80,22 @@ class Paginator(object):
         return offset
     
     def get_slice(self, limit, offset):
+        # No limit means everything from the ``offset`` on.
+        if limit == 0:
+            return self.objects[offset:]
+        
         return self.objects[offset:offset + limit]
     
     def get_count(self):
         return len(self.objects)
 
     def get_previous(self, limit, offset):
-        if offset - limit < 0:
+        if limit == 0 or offset - limit < 0:
             return None
         return self._generate_uri(limit, offset-limit)
 
     def get_next(self, limit, offset, count):
-        if offset + limit >= count:
+        if limit == 0 or offset + limit >= count:
             return None
         return self._generate_uri(limit, offset+limit)
 
@@ -1,16 +1,16 @@
-from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist, MultipleObjectsReturned
-from django.core.urlresolvers import reverse, resolve, NoReverseMatch, Resolver404
+import warnings
+from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
+from django.core.urlresolvers import resolve, NoReverseMatch, Resolver404
+from django.db import connection, models
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import force_unicode
 from tastypie import _get_canonical_resource_name
 from tastypie.exceptions import NotFound, URLReverseError, MultipleRepresentationsFound
 from tastypie.fields import *
-from tastypie.representations.simple import Representation, RepresentationSet
-
-# copy was added in Python 2.5 and copycompat was added in
-# post 1.1.1 Django (r11901)
-try:
-    from django.utils.copycompat import deepcopy
-except ImportError:
-    from copy import deepcopy
+from tastypie.representations.simple import DeclarativeMetaclass, Representation, RepresentationSet, get_override_methods, MAX_FIELD_SUBSETS
+from tastypie.utils.urls import reverse_detail_uri
 
 
 def api_field_from_django_field(f, default=CharField):
@@ -39,6 +39,272 @@ def api_field_from_django_field(f, default=CharField):
     return result
 
 
+def is_single_relation(model, attribute):
+    """
+    Returns whether the ``attribute`` on the ``model`` is a ``ForeignKey`` or
+    a ``OneToOneField`` (either side), so that it can be ``select_related``.
+    """
+    try:
+        field = model._meta.get_field(attribute)
+        return isinstance(field, models.ForeignKey)
+    except FieldDoesNotExist:
+        pass
+    
+    for related in model._meta.get_all_related_objects():
+        if related.get_accessor_name() == attribute:
+            return isinstance(related.field, models.OneToOneField)
+    
+    return False
+
+
+def load_to_many(model, instances, attribute, select_related=None, pks_only=False):
+    """
+    Loads the ``attribute`` relation (a ``ManyToManyField``, either side, or
+    a reverse ``ForeignKey``) for all of the ``instances`` with a single
+    ``IN`` query & stores the results on each instance for
+    ``ToManyField.dehydrate`` to use.
+    
+    With ``pks_only``, just the related pks are read & stored instead, for
+    when nothing but the URIs are needed. For many-to-many relations, they
+    come straight from the join table, unless the related model's default
+    manager filters what it shows (which the join table knows nothing of).
+    
+    Returns a list of all the related objects (or pks) loaded, or ``None`` if
+    the ``attribute`` isn't a relation that can be loaded this way.
+    """
+    through = None
+    target = None
+    
+    for f in model._meta.many_to_many:
+        # Generic relations show up here as well but don't join the same way.
+        if f.name == attribute and isinstance(f, generic.GenericRelation):
+            return load_generic_relation(f, instances, attribute, select_related, pks_only)
+        
+        if f.name == attribute and isinstance(f, models.ManyToManyField):
+            target = f.rel.to
+            lookup = f.related_query_name()
+            through = (f.rel.through, f.m2m_field_name(), f.m2m_reverse_field_name())
+            source = (f.m2m_db_table(), f.m2m_column_name())
+            source_attname = 'pk'
+    
+    if target is None:
+        for related in model._meta.get_all_related_many_to_many_objects():
+            if related.get_accessor_name() == attribute:
+                f = related.field
+                target = related.model
+                lookup = f.name
+                through = (f.rel.through, f.m2m_reverse_field_name(), f.m2m_field_name())
+                source = (f.m2m_db_table(), f.m2m_reverse_name())
+                source_attname = 'pk'
+    
+    if target is None:
+        for related in model._meta.get_all_related_objects():
+            if related.get_accessor_name() == attribute and not isinstance(related.field, models.OneToOneField):
+                f = related.field
+                target = related.model
+                lookup = f.name
+                source = None
+                source_attname = f.rel.get_related_field().attname
+    
+    if target is None:
+        return None
+    
+    keys = [getattr(instance, source_attname) for instance in instances]
+    
+    if pks_only and through is not None and uses_stock_queryset(target):
+        # The join table alone has everything needed. Follow the related
+        # model's ordering, so the URIs come out as they otherwise would.
+        through_model, source_name, target_name = through
+        rows = through_model._default_manager.filter(**{'%s__in' % source_name: keys})
+        rows = rows.order_by(*get_related_ordering(target, target_name))
+        rows = list(rows.values_list(source_name, target_name))
+    elif pks_only and through is None:
+        rows = target._default_manager.filter(**{'%s__in' % lookup: keys})
+        rows = list(rows.values_list(lookup, 'pk'))
+    else:
+        queryset = target._default_manager.filter(**{'%s__in' % lookup: keys})
+        
+        if source is not None:
+            # Pull the owning side's pk out of the join table alongside each row.
+            qn = connection.ops.quote_name
+            queryset = queryset.extra(select={'_tastypie_source': '%s.%s' % (qn(source[0]), qn(source[1]))})
+        
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        
+        rows = []
+        
+        for related_object in queryset:
+            if source is not None:
+                key = related_object._tastypie_source
+            else:
+                key = getattr(related_object, f.attname)
+            
+            if pks_only:
+                rows.append((key, related_object.pk))
+            else:
+                rows.append((key, related_object))
+    
+    return store_to_many(instances, keys, attribute, rows, pks_only)
+
+
+def uses_stock_queryset(model):
+    """
+    Returns whether the ``model``'s default manager shows every row (that
+    is, doesn't override ``get_query_set``).
+    """
+    return model._default_manager.get_query_set.im_func is models.Manager.get_query_set.im_func
+
+
+def get_related_ordering(model, prefix):
+    """
+    Returns the ``model``'s default ordering, to be applied to a query that
+    reaches the ``model`` via the ``prefix`` lookup.
+    """
+    ordering = []
+    
+    for field_name in model._meta.ordering:
+        if field_name == '?':
+            continue
+        
+        if field_name.startswith('-'):
+            ordering.append('-%s__%s' % (prefix, field_name[1:]))
+        else:
+            ordering.append('%s__%s' % (prefix, field_name))
+    
+    return ordering
+
+
+def store_to_many(instances, keys, attribute, rows, pks_only=False):
+    """
+    Groups the ``(key, value)`` ``rows`` loaded for a relation by key & stores
+    them on the matching ``instances`` (whose keys are given, in the same
+    order, by ``keys``).
+    
+    Objects go in ``_tastypie_prefetched``, pks in ``_tastypie_prefetched_pks``.
+    
+    Returns the list of all the values.
+    """
+    if pks_only:
+        storage = '_tastypie_prefetched_pks'
+    else:
+        storage = '_tastypie_prefetched'
+    
+    grouped = {}
+    values = []
+    
+    for key, value in rows:
+        grouped.setdefault(key, []).append(value)
+        values.append(value)
+    
+    for instance, key in zip(instances, keys):
+        if not hasattr(instance, storage):
+            setattr(instance, storage, {})
+        
+        getattr(instance, storage)[attribute] = grouped.get(key, [])
+    
+    return values
+
+
+def load_generic_relation(field, instances, attribute, select_related=None, pks_only=False):
+    """
+    The ``GenericRelation`` flavor of ``load_to_many``, using one query per
+    content type (rather than per instance) for all of the ``instances``.
+    
+    As the object id field is often a text column (``Comment.object_pk``, for
+    instance), the pks are compared as unicode.
+    """
+    related_model = field.rel.to
+    keys = []
+    by_content_type = {}
+    rows = []
+    
+    for instance in instances:
+        key = (ContentType.objects.get_for_model(instance).pk, force_unicode(instance.pk))
+        keys.append(key)
+        by_content_type.setdefault(key[0], []).append(key[1])
+    
+    for content_type_id, object_ids in by_content_type.items():
+        queryset = related_model._default_manager.filter(**{
+            '%s__pk' % field.content_type_field_name: content_type_id,
+            '%s__in' % field.object_id_field_name: object_ids,
+        })
+        
+        if pks_only:
+            for object_id, pk in queryset.values_list(field.object_id_field_name, 'pk'):
+                rows.append(((content_type_id, force_unicode(object_id)), pk))
+            
+            continue
+        
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        
+        for related_object in queryset:
+            key = (content_type_id, force_unicode(getattr(related_object, field.object_id_field_name)))
+            rows.append((key, related_object))
+    
+    return store_to_many(instances, keys, attribute, rows, pks_only)
+
+
+def call_introspection_method(representation_class, name, *args):
+    """
+    Calls the ``name`` method (``get_fields`` or ``should_skip_field``) of
+    the ``representation_class`` with the ``args``, for introspecting its
+    model.
+    
+    These are classmethods, as the model is introspected once per class.
+    Subclasses that still override them as instance methods (as they were
+    when every instance introspected the model itself) have theirs called on
+    a bare instance, with the ``queryset``, ``object_class`` & ``fields``
+    those methods used to rely on.
+    """
+    method = getattr(representation_class, name)
+    
+    if method.im_self is not None:
+        return method(*args)
+    
+    warnings.warn("'%s.%s' should be a classmethod." % (representation_class.__name__, name), DeprecationWarning)
+    instance = representation_class.__new__(representation_class)
+    instance.queryset = representation_class._meta.queryset
+    instance.object_class = instance.queryset.model
+    instance.fields = representation_class.base_fields
+    instance.api_name = ''
+    instance.resource_name = ''
+    instance.instance = None
+    instance.data = {}
+    
+    # The class is still being built, so it isn't bound to its name yet,
+    # which ``super(TheRepresentation, self)`` in the method relies on.
+    module_globals = method.im_func.func_globals
+    class_name = representation_class.__name__
+    unbound = not class_name in module_globals
+    
+    if unbound:
+        module_globals[class_name] = representation_class
+    
+    try:
+        return getattr(instance, name)(*args)
+    finally:
+        if unbound:
+            del module_globals[class_name]
+
+
+class ModelDeclarativeMetaclass(DeclarativeMetaclass):
+    def __new__(cls, name, bases, attrs):
+        new_class = super(ModelDeclarativeMetaclass, cls).__new__(cls, name, bases, attrs)
+        
+        # Introspect the model once, when the class is built, so that every
+        # instance can share the resulting field definitions.
+        if getattr(new_class._meta, 'queryset', None) is not None:
+            fields = getattr(new_class._meta, 'fields', [])
+            excludes = getattr(new_class._meta, 'excludes', [])
+            new_class.base_fields.update(call_introspection_method(new_class, 'get_fields', fields, excludes))
+            # The introspected fields may have overrides of their own.
+            new_class._overrides = get_override_methods(new_class)
+        
+        return new_class
+
+
 class ModelRepresentation(Representation):
     """
     Acts like a normal Representation but implements all of Django's ORM calls.
@@ -54,45 +320,41 @@ class ModelRepresentation(Representation):
                 return obj.user.username
             
             def hydrate_author(self):
-                self.instance.author = User.objects.get_or_create(username=self.author.value)
+                self.instance.author = User.objects.get_or_create(username=self.data['author'])
     """
-    def __init__(self, api_name=None, resource_name=None, data={}):
+    __metaclass__ = ModelDeclarativeMetaclass
+    
+    def __init__(self, api_name=None, resource_name=None, data={}, fields=None):
         self.queryset = getattr(self._meta, 'queryset', None)
         self.api_name = api_name or ''
         self.resource_name = resource_name or ''
-        
-        # Introspect the model, adding/removing fields as needed.
-        # Adds/Excludes should happen only if the fields are not already
-        # defined in `self.fields`.
         self.instance = None
         
         if self.queryset is None:
             raise ImproperlyConfigured("Using the ModelRepresentation requires providing a model.")
         
         self.object_class = self.queryset.model
-        self.fields = deepcopy(self.base_fields)
-        
-        if getattr(self._meta, 'include_resource_uri', True) and not 'resource_uri' in self.fields:
-            self.fields['resource_uri'] = CharField(readonly=True)
         
-        fields = getattr(self._meta, 'fields', [])
-        excludes = getattr(self._meta, 'excludes', [])
+        # The model has already been introspected by the metaclass & the
+        # field instances are stateless, so they're shared, not copied.
+        self.requested_fields = fields
+        self.fields = self.get_field_subset(fields)
+        self.data = {}
         
-        # Add in the new fields.
-        self.fields.update(self.get_fields(fields, excludes))
-        
-        # Now that we have fields, populate fields via kwargs if found.
+        # Now that we have fields, populate the data via kwargs if found.
         for key, value in data.items():
             if key in self.fields:
-                self.fields[key].value = value
-        
-        if self.object_class is None:
-            raise ImproperlyConfigured("Using the Representation requires providing an object_class in the inner Meta class.")
+                self.data[key] = value
     
-    def should_skip_field(self, field):
+    @classmethod
+    def should_skip_field(cls, field):
         """
         Given a Django model field, return if it should be included in the
         contributed ApiFields.
+        
+        A classmethod, as it's only used when the class is built. Overriding
+        it as an instance method still works (see
+        ``call_introspection_method``).
         """
         # Ignore certain fields (AutoField, related fields).
         if field.primary_key or getattr(field, 'rel'):
@@ -100,18 +362,22 @@ class ModelRepresentation(Representation):
         
         return False
     
-    def get_fields(self, fields=None, excludes=None):
+    @classmethod
+    def get_fields(cls, fields=None, excludes=None):
         """
         Given any explicit fields to include and fields to exclude, add
         additional fields based on the associated model.
+        
+        Called once per class by the metaclass. Overriding it as an instance
+        method still works (see ``call_introspection_method``).
         """
         final_fields = {}
         fields = fields or []
         excludes = excludes or []
         
-        for f in self.object_class._meta.fields:
+        for f in cls._meta.queryset.model._meta.fields:
             # If the field name is already present, skip
-            if f.name in self.fields:
+            if f.name in cls.base_fields:
                 continue
             
             # If field is not present in explicit field listing, skip
@@ -122,7 +388,7 @@ class ModelRepresentation(Representation):
             if excludes and f.name in excludes:
                 continue
             
-            if self.should_skip_field(f):
+            if call_introspection_method(cls, 'should_skip_field', f):
                 continue
             
             api_field_class = api_field_from_django_field(f)
@@ -145,10 +411,399 @@ class ModelRepresentation(Representation):
         
         return final_fields
     
+    @classmethod
+    def get_plan(cls, name, fields=None):
+        """
+        Returns the result of ``build_<name>`` for the (optional) subset of
+        ``fields``.
+        
+        Worked out on first use & then cached on the class (up to
+        ``MAX_FIELD_SUBSETS`` plans, before starting over).
+        """
+        if not '_plans' in cls.__dict__:
+            cls._plans = {}
+        
+        key = (name, tuple(sorted(cls.get_field_subset(fields).keys())))
+        
+        # Plans can be ``None``, so check for the key (but don't look it up
+        # again, as another thread may clear the cache in between).
+        try:
+            return cls._plans[key]
+        except KeyError:
+            pass
+        
+        plan = getattr(cls, "build_%s" % name)(fields=fields)
+        
+        if len(cls._plans) >= MAX_FIELD_SUBSETS:
+            cls._plans.clear()
+        
+        cls._plans[key] = plan
+        return plan
+    
+    @classmethod
+    def get_select_related(cls, fields=None):
+        """
+        Returns the ``select_related`` paths needed to dehydrate this
+        representation (or just the named ``fields``) without a query per
+        related object.
+        """
+        return cls.get_plan('select_related', fields)
+    
+    @classmethod
+    def build_select_related(cls, prefix='', seen=None, fields=None):
+        """
+        Walks the ``ToOneField``s (including those on nested ``full_repr``
+        representations) & returns the lookup paths that need joining.
+        
+        Fields whose ``attribute`` isn't a ``ForeignKey``/``OneToOneField``
+        (in either direction) on the model are left alone.
+        """
+        paths = []
+        seen = seen or [cls]
+        model = cls._meta.queryset.model
+        
+        for field_name, field_object in cls.get_field_subset(fields).items():
+            if not isinstance(field_object, ToOneField):
+                continue
+            
+            if not is_single_relation(model, field_object.attribute):
+                continue
+            
+            # The URI gets built straight from the foreign key column.
+            if not field_object.full_repr and field_object.get_uri_attname(model) is not None:
+                continue
+            
+            path = "%s%s" % (prefix, field_object.attribute)
+            paths.append(path)
+            related_class = field_object.to
+            
+            # Only the full representations read anything beyond the pk.
+            # Guard against representations that (eventually) nest themselves.
+            if not field_object.full_repr or related_class in seen:
+                continue
+            
+            if getattr(getattr(related_class, '_meta', None), 'queryset', None) is None:
+                continue
+            
+            if not hasattr(related_class, 'build_select_related'):
+                continue
+            
+            paths.extend(related_class.build_select_related(prefix="%s__" % path, seen=seen + [related_class]))
+        
+        paths.sort()
+        return paths
+    
+    @classmethod
+    def get_columns(cls, fields=None):
+        """
+        Returns the names of the model fields the representation (or just the
+        named ``fields``) reads, so that the rest can be deferred, or ``None``
+        if everything is needed.
+        """
+        return cls.get_plan('columns', fields)
+    
+    @classmethod
+    def build_columns(cls, fields=None):
+        """
+        Works out the model fields read by the fields' ``attribute``s.
+        
+        Custom ``dehydrate_<field_name>`` methods (& a custom
+        ``get_resource_uri`` or ``dehydrate``) can read anything, so they need
+        to declare the model fields they use via ``Meta.dehydrate_columns``, a
+        dictionary of field names (or ``'dehydrate'`` for the ``dehydrate``
+        hook, which runs for every object) to lists of model field names. For
+        example::
+        
+            class Meta:
+                queryset = Note.objects.all()
+                dehydrate_columns = {
+                    'summary': ['content'],
+                    'dehydrate': ['slug'],
+                }
+        
+        If they don't (or an ``attribute`` isn't a plain model field), nothing
+        is deferred.
+        """
+        model = cls._meta.queryset.model
+        declared = getattr(cls._meta, 'dehydrate_columns', {})
+        concrete = [f.name for f in model._meta.fields]
+        overridden = [field_name for field_name, method in cls._overrides['dehydrate']]
+        columns = [model._meta.pk.name]
+        
+        if cls.dehydrate.im_func is not Representation.dehydrate.im_func:
+            if not 'dehydrate' in declared:
+                return None
+            
+            columns.extend(declared['dehydrate'])
+        
+        for field_name, field_object in cls.get_field_subset(fields).items():
+            if field_name in declared:
+                columns.extend(declared[field_name])
+                continue
+            
+            if field_name == 'resource_uri':
+                # The stock URIs only need the pk.
+                if not cls.uses_stock_resource_uri():
+                    return None
+                
+                if cls.dehydrate_resource_uri.im_func is not Representation.dehydrate_resource_uri.im_func:
+                    return None
+            elif field_name in overridden:
+                return None
+            
+            if not field_object.attribute:
+                continue
+            
+            # Anything following a relation is loaded separately, so only
+            # the column for the relation itself is needed.
+            attribute = field_object.attribute.split('__')[0]
+            
+            if attribute in concrete:
+                columns.append(attribute)
+            elif isinstance(field_object, ToManyField) or (isinstance(field_object, ToOneField) and is_single_relation(model, attribute)):
+                # Reverse & many-to-many relations are looked up by pk.
+                continue
+            else:
+                # A method or property, which could read anything.
+                return None
+        
+        for name in concrete:
+            if not name in columns:
+                return columns
+        
+        # Nothing to defer.
+        return None
+    
+    @classmethod
+    def get_queryset(cls, fields=None):
+        """
+        Returns the ``QuerySet`` to fetch from, with the related objects the
+        representation (or just the named ``fields``) needs already joined in
+        & any columns it doesn't use deferred.
+        """
+        queryset = cls._meta.queryset._clone()
+        select_related = cls.get_select_related(fields)
+        columns = cls.get_columns(fields)
+        
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        
+        return queryset
+    
+    @classmethod
+    def prefetch(cls, instances, fields=None):
+        """
+        Loads everything the ``ToManyField``s (or just those named in
+        ``fields``) need for a whole page of ``instances`` up front, with one
+        query per relation rather than one per instance.
+        
+        Recurses into the ``full_repr`` related representations, so that they
+        get the same treatment. For the rest, where the related URIs can be
+        built from the pk alone, only the related pks are loaded.
+        """
+        if not instances:
+            return
+        
+        model = cls._meta.queryset.model
+        
+        for field_name, field_object in cls.get_field_subset(fields).items():
+            if isinstance(field_object, ToManyField):
+                if not field_object.full_repr and field_object.uses_pk_uris():
+                    # Only the URIs are wanted, so skip loading the objects.
+                    load_to_many(model, instances, field_object.attribute, pks_only=True)
+                    continue
+                
+                select_related = None
+                
+                if field_object.full_repr and hasattr(field_object.to, 'get_select_related'):
+                    select_related = field_object.to.get_select_related()
+                
+                related_instances = load_to_many(model, instances, field_object.attribute, select_related)
+            elif isinstance(field_object, ToOneField) and field_object.full_repr:
+                # These were joined in by ``select_related``, so this doesn't
+                # hit the database.
+                if not is_single_relation(model, field_object.attribute):
+                    continue
+                
+                related_instances = []
+                
+                for instance in instances:
+                    try:
+                        related_instance = getattr(instance, field_object.attribute)
+                    except ObjectDoesNotExist:
+                        continue
+                    
+                    if related_instance is not None:
+                        related_instances.append(related_instance)
+            else:
+                continue
+            
+            if related_instances and field_object.full_repr:
+                field_object.to.prefetch(related_instances)
+    
+    @classmethod
+    def get_linked(cls, instances, include, options=None):
+        """
+        Loads & dehydrates the related objects named by the ``include`` paths
+        (ex. ``['user', 'user.groups']``) for the ``instances``.
+        
+        The related objects are fetched with one query per related
+        representation (& level) for all of the ``instances``, rather than
+        one per instance, & each one is only included once.
+        
+        The results are keyed by the canonical resource name of the related
+        representation, or failing that, by the first path that reached it.
+        """
+        tree = {}
+        
+        for path in include:
+            branch = tree
+            
+            for field_name in path.split('.'):
+                branch = branch.setdefault(field_name, {})
+        
+        linked = {}
+        cls.link_related(instances, tree, options or {}, linked, {})
+        return linked
+    
+    @classmethod
+    def link_related(cls, instances, tree, options, linked, seen, prefix=''):
+        """
+        Does the work of ``get_linked`` for one level of the ``tree`` of
+        include paths, recursing into the levels below.
+        
+        ``seen`` tracks the related instances already loaded, by resource
+        name & pk.
+        """
+        batches = {}
+        order = []
+        
+        # Batch up the relations that point at the same representation.
+        for field_name in sorted(tree.keys()):
+            field_object = cls.base_fields[field_name]
+            pks = cls.get_related_pks(field_object, instances)
+            
+            if not field_object.to in batches:
+                batches[field_object.to] = ([], [], prefix + field_name)
+                order.append(field_object.to)
+            
+            batches[field_object.to][0].extend(pks)
+            batches[field_object.to][1].append((field_name, pks))
+        
+        for related_class in order:
+            pks, branches, path = batches[related_class]
+            
+            try:
+                key = _get_canonical_resource_name(options.get('api_name'), related_class)
+            except URLReverseError:
+                key = path
+            
+            loaded = seen.setdefault(key, {})
+            missing = {}
+            
+            for pk in pks:
+                if not pk in loaded:
+                    missing[pk] = True
+            
+            if missing:
+                related_set = related_class.get_list(options={
+                    'api_name': options.get('api_name'),
+                    'resource_name': options.get('resource_name'),
+                }, pk__in=missing.keys())
+                related_instances = related_set.get_instances()
+                
+                for related_instance in related_instances:
+                    loaded[related_instance.pk] = related_instance
+                
+                # The relations included from these are linked, not nested.
+                links = []
+                
+                for field_name, field_pks in branches:
+                    links.extend(tree[field_name].keys())
+                
+                linked.setdefault(key, []).extend(related_set.dehydrate_instances(related_instances, links))
+            
+            for field_name, field_pks in branches:
+                if not tree[field_name]:
+                    continue
+                
+                related_instances = []
+                added = {}
+                
+                for pk in field_pks:
+                    if pk in loaded and not pk in added:
+                        related_instances.append(loaded[pk])
+                        added[pk] = True
+                
+                related_class.link_related(related_instances, tree[field_name], options, linked, seen, '%s%s.' % (prefix, field_name))
+    
+    @classmethod
+    def get_related_pks(cls, field_object, instances):
+        """
+        Returns the pks of the objects related to the ``instances`` via the
+        ``field_object`` (a ``RelatedField``), loading as little as possible.
+        """
+        model = cls._meta.queryset.model
+        attribute = field_object.attribute
+        pks = []
+        
+        if isinstance(field_object, ToManyField):
+            missing = []
+            
+            for instance in instances:
+                if not attribute in getattr(instance, '_tastypie_prefetched_pks', {}) and not attribute in getattr(instance, '_tastypie_prefetched', {}):
+                    missing.append(instance)
+            
+            if missing and load_to_many(model, missing, attribute, pks_only=True) is None:
+                # Not something ``load_to_many`` knows, so go one by one.
+                for instance in missing:
+                    if not hasattr(instance, '_tastypie_prefetched_pks'):
+                        instance._tastypie_prefetched_pks = {}
+                    
+                    instance._tastypie_prefetched_pks[attribute] = [related.pk for related in getattr(instance, attribute).all()]
+            
+            for instance in instances:
+                if attribute in getattr(instance, '_tastypie_prefetched_pks', {}):
+                    pks.extend(instance._tastypie_prefetched_pks[attribute])
+                else:
+                    pks.extend([related.pk for related in instance._tastypie_prefetched[attribute]])
+            
+            return pks
+        
+        attname = field_object.get_pk_attname(model)
+        
+        for instance in instances:
+            if attname is not None:
+                pk = getattr(instance, attname)
+            else:
+                try:
+                    pk = getattr(getattr(instance, attribute), 'pk', None)
+                except ObjectDoesNotExist:
+                    pk = None
+            
+            if pk is not None:
+                pks.append(pk)
+        
+        return pks
+    
+    @classmethod
+    def to_pk(cls, value):
+        """
+        Converts ``value`` via the model's pk field, so ``'007'`` & ``' 7'``
+        both become ``7`` for an ``AutoField``.
+        """
+        try:
+            return cls._meta.queryset.model._meta.pk.to_python(value)
+        except ValidationError:
+            raise ValueError("'%s' isn't a valid pk." % value)
+    
     @classmethod
     def get_list(cls, options=None, **kwargs):
         options = options or {}
-        queryset = cls._meta.queryset.filter(**kwargs)
+        queryset = cls.get_queryset(options.get('fields')).filter(**kwargs)
         return RepresentationSet(cls, queryset, options)
     
     @classmethod
@@ -157,12 +812,14 @@ class ModelRepresentation(Representation):
     
     def get(self, **kwargs):
         try:
-            self.instance = self.queryset.get(**kwargs)
+            self.instance = self.get_queryset(self.requested_fields).get(**kwargs)
         except ObjectDoesNotExist:
             raise NotFound("A model instance matching the provided arguments could not be found.")
         except MultipleObjectsReturned:
             raise MultipleRepresentationsFound("More than one model instance matched the provided arguments.")
         
+        self.prefetch([self.instance], self.requested_fields)
+        self.identity_map = {}
         self.full_dehydrate(self.instance)
     
     def create(self, **kwargs):
@@ -216,23 +873,35 @@ class ModelRepresentation(Representation):
                 # Clear it out, just to be safe.
                 related_mngr.clear()
             
-            related_mngr.add(*[related_repr.instance for related_repr in field_object.value])
+            related_mngr.add(*[related_repr.instance for related_repr in self.data[field_name]])
     
     def get_resource_uri(self):
-        kwargs = {
-            'resource_name': self.resource_name,
-            'obj_id': self.instance.pk
-        }
+        return self.build_resource_uri(self.instance.pk, self.api_name, self.resource_name)
+    
+    @classmethod
+    def build_resource_uri(cls, pk, api_name=None, resource_name=None):
+        """
+        Builds the URI for the object with the given ``pk``, without needing
+        the object itself.
         
-        if self.api_name is not None:
+        Only equivalent to ``get_resource_uri`` if it hasn't been overridden
+        (see ``uses_stock_resource_uri``).
+        """
+        if api_name is not None:
             try:
-                kwargs['resource_name'] =  _get_canonical_resource_name(self.api_name, self)
+                resource_name = _get_canonical_resource_name(api_name, cls)
             except URLReverseError:
                 pass
-            
-            kwargs['api_name'] = self.api_name
         
-        return reverse("api_dispatch_detail", kwargs=kwargs)
+        return reverse_detail_uri(pk, api_name, resource_name)
+    
+    @classmethod
+    def uses_stock_resource_uri(cls):
+        """
+        Returns whether the URIs only depend on the pk, in which case
+        ``build_resource_uri`` can be used in place of ``get_resource_uri``.
+        """
+        return cls.get_resource_uri.im_func is ModelRepresentation.get_resource_uri.im_func
     
     def get_via_uri(self, uri):
         try:
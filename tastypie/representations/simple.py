@@ -1,29 +1,68 @@
+from itertools import islice
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import NoReverseMatch, reverse
 from tastypie.exceptions import HydrationError
-from tastypie.fields import ApiField, CharField, RelatedField
+from tastypie.fields import ApiField, CharField
 
 # copy was added in Python 2.5 and copycompat was added in
 # post 1.1.1 Django (r11901)
 try:
-    from django.utils.copycompat import deepcopy, copy
+    from django.utils.copycompat import copy
 except ImportError:
-    from copy import deepcopy, copy
+    from copy import copy
+
+
+# The field subsets (via ``?fields=``) are the client's choice, so the most
+# that are cached per class (see ``get_field_subset``) is limited. Past it,
+# the cache starts over.
+MAX_FIELD_SUBSETS = 100
+
+
+def get_override_methods(representation_class):
+    """
+    Finds the ``dehydrate_<field_name>``/``hydrate_<field_name>`` methods a
+    ``Representation`` class provides, so that the per-object loops only
+    visit the fields that actually have one.
+    
+    Returns a dictionary of ``dehydrate``, ``hydrate`` & ``hydrate_m2m`` to
+    lists of ``(field_name, function)`` tuples.
+    """
+    overrides = {
+        'dehydrate': [],
+        'hydrate': [],
+        'hydrate_m2m': [],
+    }
+    
+    for field_name, field_object in representation_class.base_fields.items():
+        for prefix in ('dehydrate', 'hydrate'):
+            method = getattr(representation_class, "%s_%s" % (prefix, field_name), None)
+            
+            if method is None:
+                continue
+            
+            # Keep the plain function, to be called with the instance.
+            function = getattr(method, 'im_func', method)
+            overrides[prefix].append((field_name, function))
+            
+            if prefix == 'hydrate' and getattr(field_object, 'is_m2m', False):
+                overrides['hydrate_m2m'].append((field_name, function))
+    
+    return overrides
 
 
 class DeclarativeMetaclass(type):
     def __new__(cls, name, bases, attrs):
-        attrs['base_fields'] = {}
+        attrs['declared_fields'] = {}
         
         # Inherit any fields from parent(s).
         try:
             parents = [b for b in bases if issubclass(b, Representation)]
             
             for p in parents:
-                fields = getattr(p, 'base_fields', None)
+                fields = getattr(p, 'declared_fields', None)
                 
                 if fields:
-                    attrs['base_fields'].update(fields)
+                    attrs['declared_fields'].update(fields)
         except NameError:
             pass
         
@@ -31,14 +70,22 @@ class DeclarativeMetaclass(type):
             if isinstance(obj, ApiField):
                 field = attrs.pop(field_name)
                 field.instance_name = field_name
-                attrs['base_fields'][field_name] = field
+                attrs['declared_fields'][field_name] = field
         
+        attrs['base_fields'] = attrs['declared_fields'].copy()
         new_class = super(DeclarativeMetaclass, cls).__new__(cls, name, bases, attrs)
         new_class._meta = getattr(new_class, 'Meta', None)
         
         if not new_class._meta:
             raise ImproperlyConfigured("An inner Meta class is required to configure '%r'." % new_class)
         
+        # Work out the full set of fields once per class, rather than once
+        # per instance.
+        if getattr(new_class._meta, 'include_resource_uri', True) and not 'resource_uri' in new_class.base_fields:
+            new_class.base_fields['resource_uri'] = CharField(readonly=True)
+            new_class.base_fields['resource_uri'].instance_name = 'resource_uri'
+        
+        new_class._overrides = get_override_methods(new_class)
         return new_class
 
 
@@ -47,33 +94,85 @@ class Representation(object):
     By default, handles the CRUD operations for a single object.
     
     Should be pure data (fields + data object).
+    
+    The ``fields`` are shared, stateless definitions. The per-object values
+    are kept in ``data``, a plain dictionary keyed by field name.
     """
     __metaclass__ = DeclarativeMetaclass
     
-    def __init__(self, api_name=None, resource_name=None, data={}):
+    def __init__(self, api_name=None, resource_name=None, data={}, fields=None):
         self.object_class = getattr(self._meta, 'object_class', None)
         self.instance = None
         self.api_name = api_name or ''
         self.resource_name = resource_name or ''
         
-        # Use a copy of the field instances, not the ones actually stored on
-        # the class.
-        self.fields = deepcopy(self.base_fields)
+        # The field instances hold no per-object data, so they can be shared
+        # with the class (& every other instance) rather than copied.
+        self.requested_fields = fields
+        self.fields = self.get_field_subset(fields)
+        self.data = {}
+        # Shared by everything dehydrated for the same response, so that each
+        # related object is only dehydrated once (see ``RelatedField``).
+        self.identity_map = None
         
-        if getattr(self._meta, 'include_resource_uri', True) and not 'resource_uri' in self.fields:
-            self.fields['resource_uri'] = CharField(readonly=True)
-        
-        # Now that we have fields, populate fields via kwargs if found.
+        # Now that we have fields, populate the data via kwargs if found.
         for key, value in data.items():
             if key in self.fields:
-                self.fields[key].value = value
+                self.data[key] = value
         
         if self.object_class is None:
             raise ImproperlyConfigured("Using the Representation requires providing an object_class in the inner Meta class.")
     
     def __getattr__(self, name):
-        if name in self.fields:
-            return self.fields[name]
+        # Use ``base_fields`` (a class attribute), so that this can't recurse
+        # on a partially built instance.
+        if name in self.base_fields:
+            return self.base_fields[name]
+    
+    @classmethod
+    def get_field_subset(cls, fields=None):
+        """
+        Returns the fields to use when only the named ``fields`` are wanted
+        (say from a client asking for a sparse response).
+        
+        If ``fields`` is ``None``, all of the fields are used.
+        """
+        if fields is None:
+            return cls.base_fields
+        
+        if not '_field_subsets' in cls.__dict__:
+            cls._field_subsets = {}
+        
+        # Only the names of real fields, once each, count towards the key.
+        key = tuple(sorted(set([field_name for field_name in fields if field_name in cls.base_fields])))
+        
+        # Hang on to the subset itself, as another thread may clear the cache
+        # before it's returned.
+        subset = cls._field_subsets.get(key)
+        
+        if subset is None:
+            subset = {}
+            
+            for field_name in key:
+                subset[field_name] = cls.base_fields[field_name]
+            
+            if len(cls._field_subsets) >= MAX_FIELD_SUBSETS:
+                cls._field_subsets.clear()
+            
+            cls._field_subsets[key] = subset
+        
+        return subset
+    
+    @classmethod
+    def to_pk(cls, value):
+        """
+        Converts a pk from a URL (a string) to what the objects' pks are, so
+        that the two can be compared.
+        
+        Raises ``ValueError`` if ``value`` isn't a valid pk. Returns the
+        ``value`` as-is by default.
+        """
+        return value
     
     @classmethod
     def get_list(cls, **kwargs):
@@ -83,6 +182,30 @@ class Representation(object):
     def delete_list(cls, **kwargs):
         raise NotImplementedError()
     
+    @classmethod
+    def prefetch(cls, instances, fields=None):
+        """
+        A hook to load any related data for a whole page of ``instances`` at
+        once, before they're dehydrated. If ``fields`` is provided, only the
+        data for those fields is needed.
+        
+        Does nothing by default.
+        """
+        pass
+    
+    @classmethod
+    def get_linked(cls, instances, include, options=None):
+        """
+        A hook to load & dehydrate the related objects named by the
+        ``include`` paths (ex. ``['user', 'user.groups']``) for a whole page
+        of ``instances``, to be sent alongside them (rather than nested
+        within each one).
+        
+        Should return a dictionary of resource names to lists of dehydrated
+        objects. Returns an empty dictionary by default.
+        """
+        return {}
+    
     def get(self, **kwargs):
         raise NotImplementedError()
     
@@ -128,21 +251,21 @@ class Representation(object):
         Given an object instance, extract the information from it to populate
         the representation.
         """
+        self.data = {}
+        
         # Dehydrate each field.
         for field_name, field_object in self.fields.items():
-            # A touch leaky but it makes URI resolution work.
-            if isinstance(field_object, RelatedField):
-                field_object.api_name = self.api_name
-                field_object.resource_name = self.resource_name
-                
-            field_object.value = field_object.dehydrate(obj)
+            # Related fields need to know which API they're being built for
+            # to make URI resolution work.
+            if getattr(field_object, 'is_related', False):
+                self.data[field_name] = field_object.dehydrate(obj, self)
+            else:
+                self.data[field_name] = field_object.dehydrate(obj)
         
         # Run through optional overrides.
-        for field_name, field_object in self.fields.items():
-            method = getattr(self, "dehydrate_%s" % field_name, None)
-            
-            if method:
-                field_object.value = method(obj)
+        for field_name, method in self._overrides['dehydrate']:
+            if field_name in self.fields:
+                self.data[field_name] = method(self, obj)
         
         self.dehydrate(obj)
     
@@ -159,7 +282,7 @@ class Representation(object):
         
         for field_name, field_object in self.fields.items():
             if field_object.attribute:
-                value = field_object.hydrate()
+                value = field_object.hydrate(self.data.get(field_name))
                 
                 if value is not None:
                     # We need to avoid populating M2M data here as that will
@@ -169,11 +292,9 @@ class Representation(object):
                     elif not getattr(field_object, 'is_m2m', False):
                         setattr(self.instance, field_object.attribute, value.instance)
         
-        for field_name, field_object in self.fields.items():
-            method = getattr(self, "hydrate_%s" % field_name, None)
-            
-            if method:
-                method()
+        for field_name, method in self._overrides['hydrate']:
+            if field_name in self.fields:
+                method(self)
         
         self.hydrate()
     
@@ -196,22 +317,17 @@ class Representation(object):
                 # unmodified. It's up to the user's code to handle this.
                 # The ``ModelRepresentation`` provides a working baseline
                 # in this regard.
-                field_object.value = field_object.hydrate_m2m()
+                self.data[field_name] = field_object.hydrate_m2m(self.data.get(field_name))
         
-        for field_name, field_object in self.fields.items():
-            if not getattr(field_object, 'is_m2m', False):
-                continue
-            
-            method = getattr(self, "hydrate_%s" % field_name, None)
-            
-            if method:
-                method()
+        for field_name, method in self._overrides['hydrate_m2m']:
+            if field_name in self.fields:
+                method(self)
     
     def to_dict(self):
         data = {}
         
-        for field_name, field_object in self.fields.items():
-            data[field_name] = field_object.value
+        for field_name in self.fields:
+            data[field_name] = self.data.get(field_name)
         
         return data
     
@@ -259,19 +375,135 @@ class RepresentationSet(object):
             return self.build_representation(self.data[key])
 
     def __iter__(self):
-        for instance in self.data[self.slice]:
-            representation = self.build_representation(instance)
+        identity_map = {}
+        
+        for instance in self.get_instances():
+            representation = self.build_representation(instance, identity_map)
             yield representation
 
     def __len__(self):
-        return len(self.data[self.slice])
+        data = self.data[self.slice]
+        
+        # Let the database count a ``QuerySet``, rather than loading it all.
+        if hasattr(data, 'iterator') and hasattr(data, 'count'):
+            return data.count()
+        
+        return len(data)
 
-    def build_representation(self, instance):
+    def get_instances(self):
+        """
+        Returns the (sliced) objects, with any related data the
+        representation needs already loaded via ``prefetch``.
+        """
+        instances = list(self.data[self.slice])
+        self.representation_class.prefetch(instances, self.options.get('fields'))
+        return instances
+
+    def build_representation(self, instance, identity_map=None):
         representation = self.representation_class(**self.options)
         representation.instance = instance
+        representation.identity_map = identity_map
         representation.full_dehydrate(instance)
         return representation
 
+    def dehydrate_many(self):
+        """
+        Dehydrates the (sliced) objects straight into a list of plain
+        dictionaries, which the serializers can handle without further work.
+        
+        Equivalent to calling ``full_dehydrate`` on a ``Representation`` per
+        object, but a single ``Representation`` is reused for the whole page &
+        the per-field work (finding the bound ``dehydrate`` & any
+        ``dehydrate_<field_name>`` overrides) is only done once. Related
+        objects shared between rows are only dehydrated once, too.
+        """
+        return self.dehydrate_instances(self.get_instances())
+
+    def dehydrate_instances(self, instances, links=None):
+        """
+        Does the work of ``dehydrate_many`` for the given ``instances``
+        (usually from ``get_instances``).
+        
+        The related fields named in ``links`` are dehydrated to URIs, even
+        if they're ``full_repr`` (see ``RelatedField.get_link_field``).
+        """
+        representation = self.representation_class(**self.options)
+        representation.identity_map = {}
+        dehydrators = []
+        overrides = []
+        
+        for field_name, field_object in representation.fields.items():
+            if links and field_name in links:
+                field_object = field_object.get_link_field()
+            
+            dehydrators.append((field_name, field_object.dehydrate, getattr(field_object, 'is_related', False)))
+        
+        for field_name, method in representation._overrides['dehydrate']:
+            if field_name in representation.fields:
+                overrides.append((field_name, method))
+        
+        objects = []
+        
+        for instance in instances:
+            data = {}
+            representation.instance = instance
+            representation.data = data
+            
+            for field_name, dehydrate, is_related in dehydrators:
+                # Related fields need the representation to resolve URIs.
+                if is_related:
+                    data[field_name] = dehydrate(instance, representation)
+                else:
+                    data[field_name] = dehydrate(instance)
+            
+            for field_name, method in overrides:
+                data[field_name] = method(representation, instance)
+            
+            representation.dehydrate(instance)
+            # Hooks are free to replace ``data`` wholesale.
+            objects.append(representation.data)
+        
+        return objects
+
+    def iter_dehydrated(self, chunk_size=100):
+        """
+        Like ``dehydrate_many``, but yields the dehydrated objects, loading
+        (& prefetching for) ``chunk_size`` of them at a time.
+        
+        Uses ``QuerySet.iterator()`` where possible, so that memory use stays
+        the same however many objects there are.
+        """
+        data = self.data[self.slice]
+        
+        if hasattr(data, 'iterator'):
+            data = data.iterator()
+        else:
+            data = iter(data)
+        
+        while True:
+            instances = list(islice(data, chunk_size))
+            
+            if not instances:
+                break
+            
+            self.representation_class.prefetch(instances, self.options.get('fields'))
+            
+            for obj in self.dehydrate_instances(instances):
+                yield obj
+
+    def dehydrate_compound(self, include):
+        """
+        Like ``dehydrate_many``, but also sideloads the related objects named
+        by the ``include`` paths (see ``Representation.get_linked``). The
+        included relations are sent as URIs, even if they're ``full_repr``.
+        
+        Returns a tuple of the list of dehydrated objects & the dictionary of
+        linked ones.
+        """
+        instances = self.get_instances()
+        objects = self.dehydrate_instances(instances, [path.split('.')[0] for path in include])
+        return objects, self.representation_class.get_linked(instances, include, self.options)
+
     def get_resource_uri(self):
         return reverse('api_dispatch_list', kwargs={
             'api_name': self.api_name,
@@ -1,3 +1,4 @@
+from itertools import chain, islice
 from django.conf.urls.defaults import patterns, url
 from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponse
@@ -6,9 +7,11 @@ from tastypie.cache import NoCache
 from tastypie.exceptions import NotFound, BadRequest, MultipleRepresentationsFound
 from tastypie.http import *
 from tastypie.paginator import Paginator
+from tastypie.representations.simple import RepresentationSet
 from tastypie.serializers import Serializer
 from tastypie.throttle import BaseThrottle
 from tastypie.utils import is_valid_jsonp_callback_value
+from tastypie.utils.layouts import to_columnar, from_columnar
 from tastypie.utils.mime import determine_format, build_content_type
 
 
@@ -120,6 +123,18 @@ class Resource(object):
         return determine_format(request, self.serializer, default_format=self.default_format)
 
     def serialize(self, request, data, format, options=None):
+        options = self.get_serialization_options(request, format, options)
+        return self.serializer.serialize(data, format, options)
+
+    def serialize_stream(self, request, data, format, options=None):
+        """
+        Like ``serialize``, but returns an iterator of strings for a page
+        whose ``objects`` are an iterable (see ``Serializer.serialize_stream``).
+        """
+        options = self.get_serialization_options(request, format, options)
+        return self.serializer.serialize_stream(data, format, options)
+
+    def get_serialization_options(self, request, format, options=None):
         options = options or {}
 
         if 'text/javascript' in format:
@@ -129,7 +144,7 @@ class Resource(object):
                 raise BadRequest('JSONP callback name is invalid.')
             options['callback'] = callback
 
-        return self.serializer.serialize(data, format, options)
+        return options
 
     def deserialize(self, request, data, format='application/json'):
         return self.serializer.deserialize(data, format=request.META.get('CONTENT_TYPE', 'application/json'))
@@ -193,17 +208,155 @@ class Resource(object):
         identifier = self.authentication.get_identifier(request)
         return self.throttle.should_be_throttled(identifier)
     
-    def build_representation(self, data=None):
-        if data is None:
-            return self.representation(api_name=self.api_name, resource_name=self.resource_name)
-        else:
-            return self.representation(api_name=self.api_name, resource_name=self.resource_name, data=data)
+    def build_representation(self, data=None, fields=None):
+        kwargs = self.get_representation_options(fields)
+        
+        if data is not None:
+            kwargs['data'] = data
+        
+        return self.representation(**kwargs)
     
-    def fetch_list(self, **kwargs):
-        return self.representation.get_list(options={
+    def get_representation_options(self, fields=None):
+        """
+        The arguments to build the ``representation`` with. ``fields`` is
+        only passed if a subset was requested, so that representations with
+        their own ``__init__`` (that doesn't take it) still work without.
+        """
+        options = {
             'api_name': self.api_name,
             'resource_name': self.resource_name,
-        })
+        }
+        
+        if fields is not None:
+            options['fields'] = fields
+        
+        return options
+    
+    def get_requested_fields(self, request):
+        """
+        Returns a sorted list of the field names the client asked for via
+        ``?fields=title,resource_uri``, or ``None`` if it didn't ask.
+        
+        Raises ``BadRequest`` if any of the names isn't a field on the
+        representation.
+        """
+        if not request.GET.get('fields'):
+            return None
+        
+        fields = []
+        
+        for field_name in request.GET['fields'].split(','):
+            field_name = field_name.strip()
+            
+            if not field_name or field_name in fields:
+                continue
+            
+            if not field_name in self.representation.base_fields:
+                raise BadRequest("Invalid field '%s' requested. Please choose from: %s." % (field_name, ', '.join(sorted(self.representation.base_fields.keys()))))
+            
+            fields.append(field_name)
+        
+        fields.sort()
+        return fields
+    
+    def get_requested_includes(self, request):
+        """
+        Returns a sorted list of the related paths the client asked to have
+        sideloaded via ``?include=user,user.groups``, or ``None`` if it
+        didn't ask.
+        
+        Raises ``BadRequest`` if any of the paths doesn't follow related
+        fields, or goes through representations that can't be sideloaded
+        (ones without ``link_related`` & ``get_related_pks``, like
+        ``ModelRepresentation`` has).
+        """
+        if not request.GET.get('include'):
+            return None
+        
+        include = []
+        
+        for path in request.GET['include'].split(','):
+            path = path.strip()
+            
+            if not path or path in include:
+                continue
+            
+            representation = self.representation
+            
+            for field_name in path.split('.'):
+                field_object = representation.base_fields.get(field_name)
+                
+                if not getattr(field_object, 'is_related', False):
+                    raise BadRequest("Invalid include '%s' requested. '%s' is not a related field." % (path, field_name))
+                
+                if not hasattr(field_object.to, 'link_related') or not hasattr(field_object.to, 'get_related_pks'):
+                    raise BadRequest("Invalid include '%s' requested. '%s' can't be included." % (path, field_name))
+                
+                representation = field_object.to
+            
+            include.append(path)
+        
+        include.sort()
+        return include
+    
+    def get_requested_layout(self, request):
+        """
+        Returns the layout the client asked for list responses to use via
+        ``?layout=columnar``, or ``None`` for the usual list of ``objects``.
+        
+        Raises ``BadRequest`` for any other layout.
+        """
+        layout = request.GET.get('layout')
+        
+        if not layout:
+            return None
+        
+        if layout != 'columnar':
+            raise BadRequest("Invalid layout '%s' requested. Please choose from: columnar." % layout)
+        
+        return layout
+    
+    def apply_layout(self, object_list, layout=None):
+        """
+        Rearranges the dehydrated ``objects`` of ``object_list`` in the given
+        ``layout``.
+        
+        ``columnar`` replaces them with ``fields`` (the field names, once) &
+        ``rows`` (a list of values in that order per object), which is far
+        smaller when there are lots of narrow objects.
+        """
+        if layout == 'columnar':
+            object_list['fields'], object_list['rows'] = to_columnar(object_list.pop('objects'))
+        
+        return object_list
+    
+    def unapply_layout(self, deserialized, layout=None):
+        """
+        The reverse of ``apply_layout``, for a list sent in the given
+        ``layout``: ``columnar`` ``fields`` & ``rows`` become ``objects``.
+        
+        Only done when the client asked for it (``?layout=columnar``), so
+        that objects with fields named ``fields`` or ``rows`` are left alone.
+        """
+        if layout == 'columnar' and isinstance(deserialized, dict) and 'fields' in deserialized and 'rows' in deserialized:
+            deserialized['objects'] = from_columnar(deserialized.pop('fields'), deserialized.pop('rows'))
+        
+        return deserialized
+    
+    def fetch_list(self, fields=None, **kwargs):
+        return self.representation.get_list(options=self.get_representation_options(fields), **kwargs)
+    
+    def dehydrate_objects(self, objects):
+        """
+        Turns a page of objects into plain data, ready for serialization.
+        
+        ``RepresentationSet``s are dehydrated in bulk. Anything else (say a
+        list from a custom ``fetch_list``) is passed through as-is.
+        """
+        if isinstance(objects, RepresentationSet):
+            return objects.dehydrate_many()
+        
+        return objects
     
     def cached_fetch_list(self, **kwargs):
         cache_key = self.generate_cache_key('list', **kwargs)
@@ -215,15 +368,76 @@ class Resource(object):
         
         return representation_list
     
-    def fetch_detail(self, **kwargs):
+    def fetch_detail(self, fields=None, **kwargs):
         """
         
         If not found, should raise a ``NotFound`` exception.
         """
-        representation = self.build_representation()
+        representation = self.build_representation(fields=fields)
         representation.get(pk=kwargs.get('obj_id'))
         return representation
     
+    def fetch_multiple(self, repr_ids, fields=None):
+        """
+        Returns a tuple of the dehydrated objects for the ``repr_ids`` (in
+        the order they were asked for) & the list of ids that weren't found.
+        
+        The objects are loaded in one go via ``fetch_list`` where possible.
+        If ``fetch_detail``/``cached_fetch_detail`` are overridden (say for
+        per-object authorization), or ``fetch_list`` doesn't give back a
+        ``RepresentationSet``, each id goes through ``cached_fetch_detail``
+        instead, so that the overrides still apply.
+        """
+        pks = {}
+        objects = []
+        not_found = []
+        
+        for obj_id in repr_ids:
+            try:
+                pks[obj_id] = self.representation.to_pk(obj_id)
+            except ValueError:
+                pass
+        
+        if self.uses_stock_fetch_detail():
+            representation_set = self.fetch_list(fields=fields, pk__in=pks.values())
+            
+            if isinstance(representation_set, RepresentationSet):
+                found = {}
+                
+                for instance in representation_set.get_instances():
+                    found[instance.pk] = instance
+                
+                # Keep the order (& any duplicates) the ids were requested in.
+                for obj_id in repr_ids:
+                    if obj_id in pks and pks[obj_id] in found:
+                        objects.append(found[pks[obj_id]])
+                    else:
+                        not_found.append(obj_id)
+                
+                return representation_set.dehydrate_instances(objects), not_found
+        
+        for obj_id in repr_ids:
+            if not obj_id in pks:
+                not_found.append(obj_id)
+                continue
+            
+            try:
+                representation = self.cached_fetch_detail(fields=fields, obj_id=obj_id)
+            except NotFound:
+                not_found.append(obj_id)
+                continue
+            
+            objects.append(representation.to_dict())
+        
+        return objects, not_found
+    
+    def uses_stock_fetch_detail(self):
+        """
+        Returns whether ``fetch_detail`` & ``cached_fetch_detail`` are the
+        stock ones, which ``fetch_multiple`` can skip.
+        """
+        return self.fetch_detail.im_func is Resource.fetch_detail.im_func and self.cached_fetch_detail.im_func is Resource.cached_fetch_detail.im_func
+    
     def cached_fetch_detail(self, **kwargs):
         cache_key = self.generate_cache_key('detail', **kwargs)
         representation = self.cache.get(cache_key)
@@ -238,6 +452,9 @@ class Resource(object):
         smooshed = []
         
         for key, value in kwargs.items():
+            if isinstance(value, (list, tuple)):
+                value = ','.join(value)
+            
             smooshed.append("%s=%s" % (key, value))
         
         # Use a list plus a ``.join()`` because it's faster than concatenation.
@@ -249,24 +466,82 @@ class Resource(object):
         """
         # TODO: Uncached for now. Invalidation that works for everyone may be
         #       impossible.
-        objects = self.fetch_list(**kwargs)
+        try:
+            fields = self.get_requested_fields(request)
+            include = self.get_requested_includes(request)
+            layout = self.get_requested_layout(request)
+        except BadRequest, e:
+            return HttpBadRequest(e.args[0])
+        
+        if include and fields is not None:
+            # The rows link to whatever gets sideloaded.
+            for path in include:
+                field_name = path.split('.')[0]
+                
+                if not field_name in fields:
+                    fields.append(field_name)
+            
+            fields.sort()
+        
+        objects = self.fetch_list(fields=fields, **kwargs)
         paginator = Paginator(request.GET, objects)
         
         try:
             object_list = paginator.page()
             desired_format = self.determine_format(request)
-            serialized = self.serialize(request, object_list, desired_format)
+            
+            if self.should_stream(object_list, desired_format) and not include and layout is None:
+                # Hand the objects over one by one as they're sent. Taking the
+                # first one dehydrates the whole first chunk up front, so that
+                # anything wrong with every object still fails the request
+                # properly. Errors further in can only cut the response short.
+                objects = object_list['objects'].iter_dehydrated()
+                object_list['objects'] = chain(list(islice(objects, 1)), objects)
+                serialized = self.serialize_stream(request, object_list, desired_format, {'list_representation': self.representation, 'list_fields': fields})
+            else:
+                if include and isinstance(object_list['objects'], RepresentationSet):
+                    object_list['objects'], object_list['linked'] = object_list['objects'].dehydrate_compound(include)
+                else:
+                    object_list['objects'] = self.dehydrate_objects(object_list['objects'])
+                
+                self.apply_layout(object_list, layout)
+                serialized = self.serialize(request, object_list, desired_format, {'list_representation': self.representation, 'list_fields': fields})
         except BadRequest, e:
             return HttpBadRequest(e.args[0])
         
         return HttpResponse(content=serialized, content_type=build_content_type(desired_format))
     
+    def should_stream(self, object_list, format):
+        """
+        Returns whether the page in ``object_list`` should be streamed to the
+        client, rather than built up in memory first.
+        
+        By default, only unlimited pages (``?limit=0``) of a
+        ``RepresentationSet`` are, in formats the serializer can stream.
+        
+        Only the first chunk of objects is dehydrated before the response is
+        built. If dehydrating a later one fails, the status has already been
+        sent, so the client gets a truncated ``200 OK`` body instead.
+        """
+        if object_list['meta']['limit'] != 0:
+            return False
+        
+        if not isinstance(object_list['objects'], RepresentationSet):
+            return False
+        
+        return self.serializer.supports_streaming(format)
+    
     def get_detail(self, request, **kwargs):
         """
         Should return a HttpResponse (200 OK).
         """
         try:
-            representation = self.cached_fetch_detail(**kwargs)
+            fields = self.get_requested_fields(request)
+        except BadRequest, e:
+            return HttpBadRequest(e.args[0])
+        
+        try:
+            representation = self.cached_fetch_detail(fields=fields, **kwargs)
         except NotFound:
             return HttpGone()
         except MultipleRepresentationsFound:
@@ -275,7 +550,7 @@ class Resource(object):
         desired_format = self.determine_format(request)
         
         try:
-            serialized = self.serialize(request, representation.to_dict(), desired_format)
+            serialized = self.serialize(request, representation.to_dict(), desired_format, {'detail_representation': representation.__class__})
         except BadRequest, e:
             return HttpBadRequest(e.args[0])
         
@@ -286,7 +561,13 @@ class Resource(object):
         Replaces a collection of resources with another collection.
         Return ``HttpAccepted`` (204 No Content).
         """
+        try:
+            layout = self.get_requested_layout(request)
+        except BadRequest, e:
+            return HttpBadRequest(e.args[0])
+        
         deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        deserialized = self.unapply_layout(deserialized, layout)
         
         if not 'objects' in deserialized:
             return HttpBadRequest("Invalid data sent.")
@@ -423,17 +704,15 @@ class Resource(object):
             # Throttle limit exceeded.
             return HttpBadRequest()
         
-        # Rip apart the list then iterate.
-        repr_ids = kwargs.get('id_list', '').split(';')
-        objects = []
-        not_found = []
+        try:
+            fields = self.get_requested_fields(request)
+            layout = self.get_requested_layout(request)
+        except BadRequest, e:
+            return HttpBadRequest(e.args[0])
         
-        for obj_id in repr_ids:
-            try:
-                representation = self.fetch_detail(obj_id=obj_id)
-                objects.append(representation)
-            except NotFound:
-                not_found.append(obj_id)
+        # Rip apart the list, then fetch them.
+        repr_ids = kwargs.get('id_list', '').split(';')
+        objects, not_found = self.fetch_multiple(repr_ids, fields=fields)
         
         object_list = {
             'objects': objects,
@@ -442,12 +721,14 @@ class Resource(object):
         if len(not_found):
             object_list['not_found'] = not_found
         
+        self.apply_layout(object_list, layout)
+        
         # Add the throttled request.
         self.throttle.accessed(self.authentication.get_identifier(request), url=request.get_full_path(), request_method=request_method)
         desired_format = self.determine_format(request)
         
         try:
-            serialized = self.serialize(request, object_list, desired_format)
+            serialized = self.serialize(request, object_list, desired_format, {'list_representation': self.representation, 'list_fields': fields})
         except BadRequest, e:
             return HttpBadRequest(e.args[0])
         
@@ -4,17 +4,27 @@ from django.template import loader, Context
 from django.utils import simplejson
 from django.utils.encoding import force_unicode
 from tastypie.exceptions import UnsupportedFormat
-from tastypie.representations.simple import Representation, RepresentationSet
+from tastypie.representations.simple import Representation, RepresentationSet, MAX_FIELD_SUBSETS
 from tastypie.utils import format_datetime, format_date, format_time
-from tastypie.fields import ApiField, ToOneField, ToManyField
 from StringIO import StringIO
+import calendar
+import csv
 import datetime
+import time
+try:
+    from django.utils.simplejson.encoder import encode_basestring_ascii
+except ImportError:
+    encode_basestring_ascii = simplejson.dumps
 try:
     import lxml
     from lxml.etree import parse as parse_xml
     from lxml.etree import Element, tostring
 except ImportError:
     lxml = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 try:
     import yaml
     from django.core.serializers import pyyaml
@@ -23,10 +33,13 @@ except ImportError:
 
 
 class Serializer(object):
-    formats = ['json', 'jsonp', 'xml', 'yaml', 'html']
+    formats = ['json', 'jsonp', 'ndjson', 'csv', 'msgpack', 'xml', 'yaml', 'html']
     content_types = {
         'json': 'application/json',
         'jsonp': 'text/javascript',
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+        'msgpack': 'application/x-msgpack',
         'xml': 'application/xml',
         'yaml': 'text/yaml',
         'html': 'text/html',
@@ -34,6 +47,9 @@ class Serializer(object):
     
     def __init__(self, formats=None, content_types=None):
         self.supported_formats = []
+        # Cache of (representation class, field names) -> JSON encoder (see
+        # ``get_json_encoder``).
+        self._json_encoders = {}
         
         if formats is not None:
             self.formats = formats
@@ -68,6 +84,36 @@ class Serializer(object):
         serialized = getattr(self, "to_%s" % desired_format)(representation, options)
         return serialized
     
+    def supports_streaming(self, format):
+        """
+        Returns whether there's a ``to_<format>_stream`` method for the given
+        content type (see ``serialize_stream``).
+        """
+        for short_format, long_format in self.content_types.items():
+            if format == long_format and hasattr(self, "to_%s_stream" % short_format):
+                return True
+        
+        return False
+    
+    def serialize_stream(self, data, format='application/json', options={}):
+        """
+        Like ``serialize``, but for a page whose ``objects`` are an iterable
+        (see ``RepresentationSet.iter_dehydrated``). Returns an iterator of
+        strings, which only consumes the ``objects`` as it goes.
+        """
+        desired_format = None
+        
+        for short_format, long_format in self.content_types.items():
+            if format == long_format:
+                if hasattr(self, "to_%s_stream" % short_format):
+                    desired_format = short_format
+                    break
+        
+        if desired_format is None:
+            raise UnsupportedFormat("The format indicated '%s' had no available streaming serialization method. Please check your ``formats`` and ``content_types`` on your Serializer." % format)
+        
+        return getattr(self, "to_%s_stream" % desired_format)(data, options)
+    
     def deserialize(self, content, format='application/json'):
         desired_format = None
         
@@ -90,22 +136,9 @@ class Serializer(object):
             return dict((key, self.to_simple(val, options)) for (key, val) in data.iteritems())
         elif isinstance(data, Representation):
             object = {}
-            for field_name, field_object in data.fields.items():
-                object[field_name] = self.to_simple(field_object, options)
+            for field_name in data.fields:
+                object[field_name] = self.to_simple(data.data.get(field_name), options)
             return object
-        elif isinstance(data, ApiField):
-            if isinstance(data, ToOneField):
-                if data.full_repr:
-                    return self.to_simple(data.fk_repr, options)
-                else:
-                    return self.to_simple(data.value, options)
-            elif isinstance(data, ToManyField):
-                if data.full_repr:
-                    return [self.to_simple(repr, options) for repr in data.m2m_reprs]
-                else:
-                    return [self.to_simple(val, options) for val in data.value]
-            else:
-                return self.to_simple(data.value, options)
         elif isinstance(data, datetime.datetime):
             return format_datetime(data)
         elif isinstance(data, datetime.date):
@@ -123,7 +156,6 @@ class Serializer(object):
 
     def to_etree(self, data, options=None, name=None, depth=0):
         if type(data) in (list, tuple) or isinstance(data, RepresentationSet):
-            element = Element(name or 'objects')
             if name:
                 element = Element(name)
                 element.set('type', 'list')
@@ -134,38 +166,25 @@ class Serializer(object):
         elif isinstance(data, dict):
             if depth == 0:
                 element = Element(name or 'response')
-            else:
-                element = Element(name or 'object')
+            elif name:
+                element = Element(name)
                 element.set('type', 'hash')
+            else:
+                # An unnamed ``object`` is already understood to be a hash
+                # (see ``from_etree``), so it matches a ``Representation``.
+                element = Element('object')
             for (key, value) in data.iteritems():
                 element.append(self.to_etree(value, options, name=key, depth=depth+1))
         elif isinstance(data, Representation):
             element = Element(name or 'object')
-            for field_name, field_object in data.fields.items():
-                element.append(self.to_etree(field_object, options, name=field_name, depth=depth+1))
-        elif isinstance(data, ApiField):
-            if isinstance(data, ToOneField):
-                if data.full_repr:
-                    return self.to_etree(data.fk_repr, options, name, depth+1)
-                else:
-                    return self.to_etree(data.value, options, name, depth+1)
-            elif isinstance(data, ToManyField):
-                if data.full_repr:
-                    element = Element(name or 'objects')
-                    for repr in data.m2m_reprs:
-                        element.append(self.to_etree(repr, options, repr.resource_name, depth+1))
-                else:
-                    element = Element(name or 'objects')
-                    for value in data.value:
-                        element.append(self.to_etree(value, options, name, depth=depth+1))
-            else:
-                return self.to_etree(data.value, options, name)
+            for field_name in data.fields:
+                element.append(self.to_etree(data.data.get(field_name), options, name=field_name, depth=depth+1))
         else:
             element = Element(name or 'value')
             simple_data = self.to_simple(data, options)
             data_type = get_type_string(simple_data)
             if data_type != 'string':
-                element.set('type', get_type_string(simple_data))
+                element.set('type', data_type)
             if data_type != 'null':
                 element.text = force_unicode(simple_data)
         return element
@@ -206,9 +225,253 @@ class Serializer(object):
             
     def to_json(self, data, options=None):
         options = options or {}
+        
+        # Custom ``to_simple`` methods need to see everything.
+        if self.to_simple.im_func is Serializer.to_simple.im_func:
+            serialized = self.to_compiled_json(data, options)
+            
+            if serialized is not None:
+                return serialized
+        
         data = self.to_simple(data, options)
         return simplejson.dumps(data, cls=json.DjangoJSONEncoder, sort_keys=True)
+    
+    def to_compiled_json(self, data, options):
+        """
+        Produces the same output as ``to_json`` for representations (& pages
+        of them) using the per-class encoders from ``get_json_encoder``.
+        
+        Dehydrated objects are plain dictionaries, so the class they came
+        from is taken from the ``options``: ``detail_representation`` if
+        ``data`` is a single object, ``list_representation`` if it's a page
+        with ``objects``.
+        
+        Returns ``None`` if the ``data`` isn't something it handles.
+        """
+        if isinstance(data, Representation):
+            return self.representation_to_json(data, options)
+        
+        if isinstance(data, RepresentationSet):
+            return '[%s]' % ', '.join([self.representation_to_json(representation, options) for representation in data])
+        
+        if type(data) is not dict:
+            return None
+        
+        if options.get('detail_representation') is not None:
+            return self.objects_to_json(options['detail_representation'], [data], options)[1:-1]
+        
+        if options.get('list_representation') is not None and type(data.get('objects')) is list:
+            parts = []
+            
+            for key in sorted(data.keys()):
+                if key == 'objects':
+                    value = self.objects_to_json(options['list_representation'], data[key], options)
+                else:
+                    value = simplejson.dumps(self.to_simple(data[key], options), cls=json.DjangoJSONEncoder, sort_keys=True)
+                
+                parts.append('%s: %s' % (encode_basestring_ascii(key), value))
+            
+            return '{%s}' % ', '.join(parts)
+        
+        return None
+    
+    def objects_to_json(self, representation_class, objects, options):
+        """
+        Encodes a list of dehydrated objects (see
+        ``RepresentationSet.dehydrate_many``) of the ``representation_class``
+        as a JSON array.
+        
+        The objects are expected to share the fields of the first one. Any
+        that don't go through ``to_simple``.
+        """
+        return '[%s]' % ', '.join(list(self.iter_objects_json(representation_class, objects, options)))
+    
+    def iter_objects_json(self, representation_class, objects, options):
+        """
+        Yields each of the dehydrated ``objects`` (any iterable) encoded as
+        JSON, for ``objects_to_json`` & ``to_json_stream``.
+        """
+        encoder = None
+        
+        for obj in objects:
+            serialized = None
+            
+            if type(obj) is dict and representation_class is not None:
+                if encoder is None:
+                    encoder = self.get_json_encoder(representation_class, tuple(sorted(obj.keys())))
+                
+                serialized = encoder(obj, options)
+            
+            if serialized is None:
+                serialized = simplejson.dumps(self.to_simple(obj, options), cls=json.DjangoJSONEncoder, sort_keys=True)
+            
+            yield serialized
+    
+    def representation_to_json(self, representation, options):
+        if representation.fields is representation.base_fields:
+            field_names = None
+        else:
+            field_names = tuple(sorted(representation.fields))
+        
+        serialized = self.get_json_encoder(representation.__class__, field_names)(representation.data, options)
+        
+        if serialized is None:
+            serialized = simplejson.dumps(self.to_simple(representation, options), cls=json.DjangoJSONEncoder, sort_keys=True)
+        
+        return serialized
+    
+    def get_json_encoder(self, representation_class, field_names=None):
+        """
+        Returns a function that encodes the data of an object of the
+        ``representation_class`` (a dictionary with exactly the given
+        ``field_names``, or all of the fields if ``None``) as JSON, the same
+        way ``to_json`` would. If the data doesn't have those fields, the
+        function returns ``None``.
+        
+        The keys are sorted & an encoder is picked for each field based on
+        its type once per class (& set of fields), rather than every value
+        going through ``to_simple``. The result is cached (up to
+        ``MAX_FIELD_SUBSETS`` encoders, before starting over).
+        """
+        key = (representation_class, field_names)
+        # Hang on to the encoder itself, as another thread may clear the
+        # cache before it's returned.
+        json_encoder = self._json_encoders.get(key)
+        
+        if json_encoder is None:
+            if field_names is None:
+                field_names = sorted(representation_class.base_fields.keys())
+            
+            encoders = []
+            
+            for field_name in field_names:
+                field_object = representation_class.base_fields.get(field_name)
+                field_encoder = self.get_field_json_encoder(getattr(field_object, 'dehydrated_type', None))
+                encoders.append(('%s: ' % encode_basestring_ascii(field_name), field_name, field_encoder))
+            
+            json_encoder = self.build_json_encoder(encoders)
+            
+            if len(self._json_encoders) >= MAX_FIELD_SUBSETS:
+                self._json_encoders.clear()
+            
+            self._json_encoders[key] = json_encoder
+        
+        return json_encoder
+    
+    def build_json_encoder(self, encoders):
+        field_count = len(encoders)
+        
+        def encode(data, options):
+            if len(data) != field_count:
+                return None
+            
+            try:
+                parts = [prefix + field_encoder(data[field_name], options) for prefix, field_name, field_encoder in encoders]
+            except KeyError:
+                return None
+            
+            return '{%s}' % ', '.join(parts)
+        
+        return encode
+    
+    def get_field_json_encoder(self, dehydrated_type):
+        """
+        Returns a function to encode the values of a field with the given
+        ``dehydrated_type`` as JSON. Each one handles the type the field
+        usually produces up front & hands anything else to ``value_to_json``.
+        """
+        value_to_json = self.value_to_json
+        
+        if dehydrated_type == 'string':
+            def encode(value, options):
+                if type(value) is unicode:
+                    return encode_basestring_ascii(value)
+                
+                return value_to_json(value, options)
+        elif dehydrated_type == 'integer':
+            def encode(value, options):
+                if type(value) is int:
+                    return str(value)
+                
+                return value_to_json(value, options)
+        elif dehydrated_type == 'boolean':
+            def encode(value, options):
+                if value is True:
+                    return 'true'
+                elif value is False:
+                    return 'false'
+                
+                return value_to_json(value, options)
+        elif dehydrated_type == 'datetime':
+            def encode(value, options):
+                if type(value) is datetime.datetime:
+                    return encode_basestring_ascii(format_datetime(value))
+                
+                return value_to_json(value, options)
+        else:
+            encode = value_to_json
+        
+        return encode
+    
+    def value_to_json(self, value, options):
+        """
+        Encodes a single value as JSON, the same way ``to_json`` would.
+        """
+        value_type = type(value)
+        
+        if value_type is unicode or value_type is str:
+            return encode_basestring_ascii(value)
+        elif value is None:
+            return 'null'
+        elif value is True:
+            return 'true'
+        elif value is False:
+            return 'false'
+        elif value_type is int or value_type is long:
+            return str(value)
+        elif value_type is list or value_type is tuple:
+            return '[%s]' % ', '.join([self.value_to_json(item, options) for item in value])
+        elif isinstance(value, Representation):
+            return self.representation_to_json(value, options)
+        
+        return simplejson.dumps(self.to_simple(value, options), cls=json.DjangoJSONEncoder, sort_keys=True)
 
+    def to_json_stream(self, data, options=None):
+        """
+        Yields the same JSON as ``to_json`` would for the page in ``data``, a
+        piece at a time, with the ``objects`` encoded as they're consumed.
+        """
+        options = options or {}
+        representation_class = None
+        
+        if self.to_simple.im_func is Serializer.to_simple.im_func:
+            representation_class = options.get('list_representation')
+        
+        separator = '{'
+        
+        for key in sorted(data.keys()):
+            yield '%s%s: ' % (separator, encode_basestring_ascii(key))
+            separator = ', '
+            
+            if key == 'objects':
+                object_separator = '['
+                
+                for serialized in self.iter_objects_json(representation_class, data[key], options):
+                    yield object_separator + serialized
+                    object_separator = ', '
+                
+                if object_separator == '[':
+                    yield '[]'
+                else:
+                    yield ']'
+            else:
+                yield simplejson.dumps(self.to_simple(data[key], options), cls=json.DjangoJSONEncoder, sort_keys=True)
+        
+        if separator == '{':
+            yield '{}'
+        else:
+            yield '}'
+    
     def from_json(self, content):
         return simplejson.loads(content)
 
@@ -216,12 +479,247 @@ class Serializer(object):
         options = options or {}
         return '%s(%s)' % (options['callback'], self.to_json(data, options))
 
+    def to_jsonp_stream(self, data, options=None):
+        options = options or {}
+        yield '%s(' % options['callback']
+        
+        for chunk in self.to_json_stream(data, options):
+            yield chunk
+        
+        yield ')'
+
+    def to_ndjson(self, data, options=None):
+        return ''.join(list(self.to_ndjson_stream(data, options)))
+    
+    def to_ndjson_stream(self, data, options=None):
+        """
+        Yields newline-delimited JSON, one line per object, without any
+        envelope: the ``objects`` of a page (the rest, like ``meta``, is
+        left out), the items of a list or else ``data`` itself.
+        """
+        options = options or {}
+        compiled = self.to_simple.im_func is Serializer.to_simple.im_func
+        representation_class = None
+        
+        if type(data) is dict and 'objects' in data:
+            objects = data['objects']
+            
+            if compiled:
+                representation_class = options.get('list_representation')
+        elif type(data) in (list, tuple) or isinstance(data, RepresentationSet):
+            objects = data
+        else:
+            objects = [data]
+            
+            if compiled:
+                representation_class = options.get('detail_representation')
+        
+        for serialized in self.iter_objects_json(representation_class, objects, options):
+            yield serialized + '\n'
+    
+    def from_ndjson(self, content):
+        return [simplejson.loads(line) for line in content.splitlines() if line.strip()]
+
+    def to_csv(self, data, options=None):
+        return ''.join(list(self.to_csv_stream(data, options)))
+    
+    def to_csv_stream(self, data, options=None):
+        """
+        Yields CSV (UTF-8) with a header row of the field names (sorted, the
+        same order as the JSON keys) & then a row per object: the ``objects``
+        of a page, the items of a list or else ``data`` itself.
+        
+        Related objects come out as their URIs (see ``value_to_csv``).
+        
+        With no objects at all, the header still comes from the
+        ``list_representation`` (& ``list_fields``, the requested subset) in
+        the ``options``, if there is one.
+        
+        CSV is for output only. There's no ``from_csv``, as the cells can't
+        be read back reliably: every value is a string (``None`` included)
+        & to-many URIs are joined up with commas.
+        """
+        options = options or {}
+        representation_class = options.get('list_representation')
+        field_names = options.get('list_fields')
+        
+        if type(data) is dict and 'objects' in data:
+            objects = data['objects']
+        elif type(data) in (list, tuple) or isinstance(data, RepresentationSet):
+            objects = data
+            
+            if isinstance(data, RepresentationSet):
+                representation_class = data.representation_class
+                field_names = data.options.get('fields')
+        else:
+            objects = [data]
+        
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        header = None
+        
+        for obj in objects:
+            row = self.to_simple(obj, options)
+            
+            if header is None:
+                header = sorted(row.keys())
+                writer.writerow([name.encode('utf-8') for name in header])
+            
+            writer.writerow([self.value_to_csv(row.get(name)) for name in header])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        
+        if header is None and representation_class is not None:
+            header = sorted(representation_class.get_field_subset(field_names).keys())
+            writer.writerow([name.encode('utf-8') for name in header])
+            yield buffer.getvalue()
+    
+    def value_to_csv(self, value):
+        """
+        Renders an already simple ``value`` as a single cell. Nested objects
+        (from ``full_repr`` related fields) become their ``resource_uri`` &
+        lists are comma-separated.
+        """
+        if value is None:
+            return ''
+        elif isinstance(value, dict):
+            if 'resource_uri' in value:
+                return self.value_to_csv(value['resource_uri'])
+            
+            return simplejson.dumps(value, sort_keys=True)
+        elif type(value) is list:
+            return ','.join([self.value_to_csv(item) for item in value])
+        elif isinstance(value, unicode):
+            return value.encode('utf-8')
+        
+        return str(value)
+    
+    def to_msgpack(self, data, options=None):
+        """
+        Packs ``data`` as MessagePack. Datetimes use its timestamp extension
+        (if the ``msgpack`` installed has one), rather than strings.
+        
+        Dehydrated objects are already plain dictionaries, so they're handed
+        to ``msgpack`` as they are, with only what it can't pack itself
+        (representations, dates, decimals & the like) going through
+        ``msgpack_default``.
+        """
+        options = options or {}
+        if msgpack is None:
+            raise ImproperlyConfigured("Usage of the MessagePack aspects requires msgpack.")
+        
+        # Custom ``to_simple`` methods need to see everything.
+        if self.to_simple.im_func is not Serializer.to_simple.im_func:
+            data = self.to_simple(data, options)
+        
+        def default(value):
+            return self.msgpack_default(value, options)
+        
+        return msgpack.packb(data, default=default, use_bin_type=False)
+    
+    def msgpack_default(self, value, options):
+        """
+        Converts a ``value`` ``msgpack`` can't pack on its own into one it
+        can. Naive datetimes are taken to be in the local time zone (the
+        ``TIME_ZONE`` setting).
+        """
+        if isinstance(value, Representation):
+            return dict((field_name, value.data.get(field_name)) for field_name in value.fields)
+        elif isinstance(value, RepresentationSet):
+            return list(value)
+        elif isinstance(value, datetime.datetime) and getattr(msgpack, 'Timestamp', None) is not None:
+            if value.tzinfo is None:
+                seconds = time.mktime(value.timetuple())
+            else:
+                seconds = calendar.timegm(value.utctimetuple())
+            
+            return msgpack.Timestamp(int(seconds), value.microsecond * 1000)
+        
+        return self.to_simple(value, options)
+    
+    def from_msgpack(self, content):
+        if msgpack is None:
+            raise ImproperlyConfigured("Usage of the MessagePack aspects requires msgpack.")
+        
+        return self.from_msgpack_value(msgpack.unpackb(content, raw=False))
+    
+    def from_msgpack_value(self, value):
+        """
+        Turns the timestamps in an unpacked ``value`` back into (naive,
+        local) datetimes.
+        """
+        if type(value) is dict:
+            for key, item in value.items():
+                value[key] = self.from_msgpack_value(item)
+        elif type(value) is list:
+            value = [self.from_msgpack_value(item) for item in value]
+        elif getattr(msgpack, 'Timestamp', None) is not None and isinstance(value, msgpack.Timestamp):
+            value = datetime.datetime.fromtimestamp(value.seconds).replace(microsecond=value.nanoseconds // 1000)
+        
+        return value
+
     def to_xml(self, data, options=None):
         options = options or {}
         if lxml is None:
             raise ImproperlyConfigured("Usage of the XML aspects requires lxml.")
         return tostring(self.to_etree(data, options), xml_declaration=True, encoding='utf-8')
     
+    def to_xml_stream(self, data, options=None):
+        """
+        Returns an iterator of the same XML as ``to_xml`` would give for the
+        page in ``data``, written with lxml's incremental ``xmlfile``, so only
+        one of the ``objects`` is ever held as an element tree.
+        """
+        options = options or {}
+        if lxml is None:
+            raise ImproperlyConfigured("Usage of the XML aspects requires lxml.")
+        
+        if not hasattr(lxml.etree, 'xmlfile'):
+            # Older lxml (before 3.1) can only write the whole tree at once.
+            page = dict(data)
+            page['objects'] = list(page.get('objects', []))
+            return iter([self.to_xml(page, options)])
+        
+        return self.iter_xml(data, options)
+    
+    def iter_xml(self, data, options):
+        buffer = StringIO()
+        writer = lxml.etree.xmlfile(buffer, encoding='utf-8')
+        xml_file = writer.__enter__()
+        xml_file.write_declaration()
+        response = xml_file.element('response')
+        response.__enter__()
+        
+        for (key, value) in data.iteritems():
+            if key != 'objects':
+                xml_file.write(self.to_etree(value, options, name=key, depth=1))
+                continue
+            
+            objects = None
+            
+            for item in value:
+                if objects is None:
+                    objects = xml_file.element('objects', type='list')
+                    objects.__enter__()
+                
+                xml_file.write(self.to_etree(item, options, depth=2))
+                xml_file.flush()
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            
+            if objects is None:
+                # Matches the self-closing ``<objects type="list"/>`` of
+                # ``to_xml``.
+                xml_file.write(self.to_etree([], options, name=key, depth=1))
+            else:
+                objects.__exit__(None, None, None)
+        
+        response.__exit__(None, None, None)
+        writer.__exit__(None, None, None)
+        yield buffer.getvalue()
+    
     def from_xml(self, content):
         if lxml is None:
             raise ImproperlyConfigured("Usage of the XML aspects requires lxml.")
@@ -1,2 +1,2 @@
 from tastypie.utils.validate_jsonp import is_valid_jsonp_callback_value
-from tastypie.utils.formatting import mk_datetime, format_datetime, format_date, format_time
+from tastypie.utils.formatting import mk_datetime, format_datetime, format_date, format_time, parse_date, parse_datetime
@@ -1,5 +1,10 @@
+import calendar
 import datetime
-from django.utils import dateformat
+import email.utils
+import re
+import time
+from django.conf import settings
+from django.utils import dateformat, datetime_safe
 
 # Try to use dateutil for maximum date-parsing niceness. Fall back to
 # hard-coded RFC2822 parsing if that's not possible.
@@ -9,25 +14,194 @@ except ImportError:
     def mk_datetime(string):
         return datetime.datetime.fromtimestamp(time.mktime(email.utils.parsedate(string)))
 
+# A single anchored ``match`` (rather than ``search`` & ``groupdict``) is
+# as quick as parsing gets without a C extension.
+ISO_DATE = re.compile(r'(\d{4})-(\d\d)-(\d\d)')
+ISO_DATETIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d)(?::(\d\d)(?:[.,](\d+))?)?(Z|[-+]\d\d(?::?\d\d)?)?\Z')
+
+# The local UTC offsets already worked out (see ``get_utc_offset``), by hour.
+_utc_offsets = {}
+MAX_UTC_OFFSETS = 1000
+
+def get_datetime_formatting():
+    """
+    The format dates & times are sent in, from the
+    ``TASTYPIE_DATETIME_FORMATTING`` setting: either ``iso-8601`` (the
+    default) or ``rfc-2822``.
+    """
+    return getattr(settings, 'TASTYPIE_DATETIME_FORMATTING', 'iso-8601')
+
+def get_utc_offset(dt):
+    """
+    Returns the ISO 8601 ``+HH:MM`` offset from UTC of the local time zone
+    (the ``TIME_ZONE`` setting) at the naive datetime ``dt``, or ``''`` if
+    it's out of the range the platform can tell.
+    """
+    key = (dt.year, dt.month, dt.day, dt.hour)
+    
+    try:
+        return _utc_offsets[key]
+    except KeyError:
+        pass
+    
+    timetuple = dt.timetuple()
+    
+    try:
+        minutes = int(calendar.timegm(timetuple) - time.mktime(timetuple)) // 60
+    except (OverflowError, ValueError):
+        return ''
+    
+    if minutes < 0:
+        offset = '-%02d:%02d' % divmod(-minutes, 60)
+    else:
+        offset = '+%02d:%02d' % divmod(minutes, 60)
+    
+    if len(_utc_offsets) >= MAX_UTC_OFFSETS:
+        _utc_offsets.clear()
+    
+    _utc_offsets[key] = offset
+    return offset
+
 def format_datetime(dt):
     """
-    RFC 2822 datetime formatter
+    ISO 8601 (or RFC 2822) datetime formatter
+    
+    Naive datetimes are local time, so get the local offset, as they did
+    with RFC 2822.
     """
-    return dateformat.format(dt, 'r')
+    if get_datetime_formatting() == 'rfc-2822':
+        return dateformat.format(dt, 'r')
+    
+    if dt.tzinfo is None:
+        return dt.isoformat() + get_utc_offset(dt)
+    
+    return dt.isoformat()
 
 def format_date(d):
     """
-    RFC 2822 date formatter
+    ISO 8601 (or RFC 2822) date formatter
     """
-    # workaround because Django's dateformat utility requires a datetime
-    # object (not just date)
-    dt = datetime.datetime(d.year, d.month, d.day, 0, 0, 0)
-    return dateformat.format(dt, 'j M Y')
+    if get_datetime_formatting() == 'rfc-2822':
+        # workaround because Django's dateformat utility requires a datetime
+        # object (not just date)
+        dt = datetime.datetime(d.year, d.month, d.day, 0, 0, 0)
+        return dateformat.format(dt, 'j M Y')
+    
+    return d.isoformat()
 
 def format_time(t):
     """
-    RFC 2822 time formatter
+    ISO 8601 (or RFC 2822) time formatter
+    """
+    if get_datetime_formatting() == 'rfc-2822':
+        # again, workaround dateformat input requirement
+        dt = datetime.datetime(2000, 1, 1, t.hour, t.minute, t.second)
+        return dateformat.format(dt, 'H:i:s O')
+    
+    if t.tzinfo is None:
+        # Like ``'O'`` above, as of a date (with no DST) that has one.
+        return t.isoformat() + get_utc_offset(datetime.datetime(2000, 1, 1, t.hour))
+    
+    return t.isoformat()
+
+def to_local_datetime(dt, offset):
+    """
+    Converts the naive datetime ``dt``, which is ``offset`` minutes ahead of
+    UTC, to (naive) local time.
+    """
+    local = datetime.datetime.fromtimestamp(calendar.timegm(dt.timetuple()) - offset * 60)
+    return datetime_safe.datetime(local.year, local.month, local.day, local.hour, local.minute, local.second, dt.microsecond)
+
+def parse_rfc_2822(value):
+    """
+    Parses an RFC 2822 datetime (``Tue, 30 Mar 2010 20:05:00 -0500``) or
+    date (``30 Mar 2010``), as sent with the ``rfc-2822`` formatting.
+    
+    Returns the 10-tuple from ``email.utils.parsedate_tz``. Raises
+    ``ValueError`` if ``value`` isn't one.
+    """
+    parsed = email.utils.parsedate_tz(value)
+    
+    if parsed is None:
+        # Just the date.
+        parsed = email.utils.parsedate_tz(value + ' 00:00:00')
+    
+    if parsed is None:
+        raise ValueError("'%s' isn't an RFC 2822 datetime." % value)
+    
+    return parsed
+
+def parse_date(value):
+    """
+    Parses the ``YYYY-MM-DD`` at the start of ``value`` (anything after it,
+    like the time of a datetime, is ignored).
+    
+    With the ``rfc-2822`` formatting, RFC 2822 dates (or the date of an RFC
+    2822 datetime) are accepted as well.
+    
+    Raises ``ValueError`` if there isn't one.
+    """
+    match = ISO_DATE.match(value)
+    
+    if match is None:
+        if get_datetime_formatting() == 'rfc-2822':
+            year, month, day = parse_rfc_2822(value)[:3]
+            return datetime_safe.date(year, month, day)
+        
+        raise ValueError("'%s' isn't a YYYY-MM-DD date." % value)
+    
+    year, month, day = match.groups()
+    return datetime_safe.date(int(year), int(month), int(day))
+
+def parse_datetime(value):
+    """
+    Parses an ISO 8601 ``YYYY-MM-DDTHH:MM[:SS[.ffffff]][Z|+HH:MM]`` datetime
+    (a space works in place of the ``T``).
+    
+    With the ``rfc-2822`` formatting, RFC 2822 datetimes are accepted as
+    well.
+    
+    Datetimes with an offset are converted to (naive) local time.
+    
+    Raises ``ValueError`` if ``value`` isn't one.
     """
-    # again, workaround dateformat input requirement
-    dt = datetime.datetime(2000, 1, 1, t.hour, t.minute, t.second)
-    return dateformat.format(dt, 'H:i:s O')
+    match = ISO_DATETIME.match(value)
+    
+    if match is None:
+        if get_datetime_formatting() == 'rfc-2822':
+            parsed = parse_rfc_2822(value)
+            dt = datetime_safe.datetime(*parsed[:6])
+            
+            if parsed[9] is not None:
+                dt = to_local_datetime(dt, parsed[9] // 60)
+            
+            return dt
+        
+        raise ValueError("'%s' isn't an ISO 8601 datetime." % value)
+    
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    
+    if second is None:
+        second = 0
+    else:
+        second = int(second)
+    
+    if fraction is None:
+        microsecond = 0
+    else:
+        microsecond = int((fraction + '000000')[:6])
+    
+    dt = datetime_safe.datetime(int(year), int(month), int(day), int(hour), int(minute), second, microsecond)
+    
+    if zone is not None:
+        if zone == 'Z':
+            offset = 0
+        else:
+            offset = int(zone[1:3]) * 60 + int(zone[3:].lstrip(':') or 0)
+            
+            if zone[0] == '-':
+                offset = -offset
+        
+        dt = to_local_datetime(dt, offset)
+    
+    return dt
@@ -0,0 +1,27 @@
+def to_columnar(objects):
+    """
+    Splits a list of dehydrated objects into ``(fields, rows)``: the (sorted)
+    field names once, then each object as a list of values in that order.
+    
+    Objects missing a field get ``None`` for it.
+    """
+    field_names = {}
+    
+    for obj in objects:
+        for field_name in obj:
+            field_names[field_name] = True
+    
+    fields = sorted(field_names.keys())
+    rows = []
+    
+    for obj in objects:
+        rows.append([obj.get(field_name) for field_name in fields])
+    
+    return fields, rows
+
+
+def from_columnar(fields, rows):
+    """
+    The reverse of ``to_columnar``, giving back a list of dictionaries.
+    """
+    return [dict(zip(fields, row)) for row in rows]
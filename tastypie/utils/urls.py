@@ -0,0 +1,75 @@
+from django.core.urlresolvers import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, reverse
+
+
+# Stand in for the ``obj_id`` when reversing, to find where it goes. The
+# digits are for URLconfs that only allow (say) ``\d+`` there.
+PK_PLACEHOLDERS = ('tastypiepk', '9876543210123456789')
+
+
+def get_detail_uri_template(api_name=None, resource_name=None):
+    """
+    Returns the ``(before, after)`` halves of the ``api_dispatch_detail`` URI
+    for the given ``api_name``/``resource_name``, which only need an integer
+    ``obj_id`` put between them.
+    
+    Reversed once per URLconf (the templates are kept on the resolver, so
+    they go away along with it) & script prefix, rather than once per object.
+    Returns ``None`` if none of the ``PK_PLACEHOLDERS`` reverse. That isn't
+    cached, as the URLconf may still match real pks.
+    """
+    resolver = get_resolver(get_urlconf())
+    templates = getattr(resolver, '_tastypie_detail_uris', None)
+    
+    if templates is None:
+        templates = resolver._tastypie_detail_uris = {}
+    
+    key = (get_script_prefix(), api_name, resource_name)
+    
+    if key in templates:
+        return templates[key]
+    
+    for placeholder in PK_PLACEHOLDERS:
+        kwargs = {
+            'resource_name': resource_name,
+            'obj_id': placeholder,
+        }
+        
+        if api_name is not None:
+            kwargs['api_name'] = api_name
+        
+        try:
+            uri = reverse("api_dispatch_detail", kwargs=kwargs)
+        except NoReverseMatch:
+            continue
+        
+        if uri.count(placeholder) == 1:
+            templates[key] = tuple(uri.split(placeholder))
+            return templates[key]
+    
+    return None
+
+
+def reverse_detail_uri(pk, api_name=None, resource_name=None):
+    """
+    Equivalent to ``reverse("api_dispatch_detail", ...)`` with the given
+    ``pk`` as the ``obj_id``, but only formats a string for integer pks.
+    
+    Anything else (which may need quoting or not match the URLconf at all),
+    or a URLconf with no template (see ``get_detail_uri_template``), still
+    goes through ``reverse``.
+    """
+    if isinstance(pk, (int, long)):
+        template = get_detail_uri_template(api_name, resource_name)
+        
+        if template is not None:
+            return '%s%d%s' % (template[0], pk, template[1])
+    
+    kwargs = {
+        'resource_name': resource_name,
+        'obj_id': pk,
+    }
+    
+    if api_name is not None:
+        kwargs['api_name'] = api_name
+    
+    return reverse("api_dispatch_detail", kwargs=kwargs)
@@ -0,0 +1,238 @@
+"""
+Rough timings for the hot paths of a request, to compare implementations.
+
+Run from within the ``tests`` directory with::
+
+    PYTHONPATH=`pwd`:`pwd`/.. DJANGO_SETTINGS_MODULE=settings_core python benchmarks.py
+
+No database is needed, as everything works on unsaved, in-memory objects.
+"""
+import datetime
+import re
+import time
+from django.contrib.auth.models import User
+from django.core.serializers import json
+from django.utils import dateformat, datetime_safe, simplejson
+from tastypie.exceptions import ApiFieldError
+from tastypie.fields import ApiField
+from tastypie.representations.models import ModelRepresentation
+from tastypie.representations.simple import RepresentationSet
+from tastypie.serializers import Serializer
+from tastypie.utils.formatting import format_datetime, parse_datetime
+from core.models import Note
+
+
+SIZES = (100, 1000, 10000)
+REPEAT = 3
+
+
+class NoteRepresentation(ModelRepresentation):
+    class Meta:
+        queryset = Note.objects.all()
+
+
+class UndatedNoteRepresentation(ModelRepresentation):
+    class Meta:
+        queryset = Note.objects.all()
+        excludes = ['created', 'updated']
+
+
+def build_notes(count):
+    notes = []
+    created = datetime.datetime(2010, 3, 30, 20, 5)
+
+    for i in xrange(1, count + 1):
+        notes.append(Note(pk=i, title='Note %s' % i, slug='note-%s' % i, content='Lorem ipsum ' * 10, is_active=True, created=created, updated=created))
+
+    return notes
+
+
+def best_of(func, *args):
+    timings = []
+
+    for i in range(REPEAT):
+        start = time.time()
+        func(*args)
+        timings.append(time.time() - start)
+
+    return min(timings)
+
+
+def report(name, size, baseline, candidate):
+    print "%-40s %6d rows: %8.4fs -> %8.4fs (%.1fx)" % (name, size, baseline, candidate, baseline / max(candidate, 1e-9))
+
+
+def report_per_value(name, size, baseline, candidate):
+    print "%-40s %6d values: %6.2fus -> %6.2fus per value (%.1fx)" % (name, size, baseline * 1e6 / size, candidate * 1e6 / size, baseline / max(candidate, 1e-9))
+
+
+def legacy_dehydrate(field, obj):
+    """
+    ``ApiField.dehydrate`` as it was, splitting the ``attribute`` per call.
+    """
+    attrs = field.attribute.split('__')
+    current_object = obj
+
+    for attr in attrs:
+        current_object = getattr(current_object, attr, None)
+
+        if current_object is None:
+            if field.has_default():
+                current_object = field._default
+                break
+            elif field.null:
+                current_object = None
+                break
+            else:
+                raise ApiFieldError("The model '%r' has an empty attribute '%s' and doesn't allow a default or null value." % (current_object, attr))
+
+    if callable(current_object):
+        return current_object()
+
+    return current_object
+
+
+def bench_field_dehydrate():
+    """
+    The per-field cost of ``ApiField.dehydrate``, splitting the ``attribute``
+    per call vs. the accessors compiled up front.
+    """
+    author = User(username='johndoe')
+    fields = [
+        ('plain', ApiField(attribute='title')),
+        ('related', ApiField(attribute='author__username')),
+        ('missing', ApiField(attribute='editor__username', null=True)),
+    ]
+
+    for size in SIZES:
+        notes = build_notes(size)
+
+        for note in notes:
+            note.author = author
+
+        for name, field in fields:
+            def legacy():
+                for note in notes:
+                    legacy_dehydrate(field, note)
+
+            def compiled():
+                for note in notes:
+                    field.dehydrate(note)
+
+            report('ApiField.dehydrate (%s)' % name, size, best_of(legacy), best_of(compiled))
+
+
+def bench_dehydrate_many():
+    """
+    ``RepresentationSet.__iter__`` + ``Serializer.to_simple`` vs.
+    ``RepresentationSet.dehydrate_many`` + ``Serializer.to_simple``.
+    """
+    serializer = Serializer()
+    options = {'api_name': 'v1', 'resource_name': 'notes'}
+
+    def per_representation(repr_set):
+        serializer.to_simple(list(repr_set), {})
+
+    def batched(repr_set):
+        serializer.to_simple(repr_set.dehydrate_many(), {})
+
+    for size in SIZES:
+        repr_set = RepresentationSet(NoteRepresentation, build_notes(size), options)
+        report('dehydrate_many', size, best_of(per_representation, repr_set), best_of(batched, repr_set))
+
+
+def bench_to_json():
+    """
+    ``Serializer.to_simple`` + ``simplejson.dumps`` vs. the per-class
+    encoders ``Serializer.to_json`` uses when it knows the representation.
+    """
+    serializer = Serializer()
+    options = {'api_name': 'v1', 'resource_name': 'notes'}
+    
+    # The date formatting costs the same either way, so also time without.
+    for name, representation_class in (('dated', NoteRepresentation), ('undated', UndatedNoteRepresentation)):
+        for size in SIZES:
+            page = {
+                'meta': {'limit': size, 'offset': 0, 'previous': None, 'next': None, 'total_count': size},
+                'objects': RepresentationSet(representation_class, build_notes(size), options).dehydrate_many(),
+            }
+            
+            def generic():
+                return simplejson.dumps(serializer.to_simple(page, {}), cls=json.DjangoJSONEncoder, sort_keys=True)
+            
+            def compiled():
+                return serializer.to_json(page, {'list_representation': representation_class})
+            
+            assert generic() == compiled()
+            report('to_json (%s)' % name, size, best_of(generic), best_of(compiled))
+
+
+def bench_to_msgpack():
+    """
+    ``Serializer.to_json`` vs. ``Serializer.to_msgpack`` for the same page,
+    which skips ``to_simple`` (& the date formatting) for plain values.
+    """
+    serializer = Serializer()
+    options = {'api_name': 'v1', 'resource_name': 'notes'}
+    
+    for size in SIZES:
+        page = {
+            'meta': {'limit': size, 'offset': 0, 'previous': None, 'next': None, 'total_count': size},
+            'objects': RepresentationSet(NoteRepresentation, build_notes(size), options).dehydrate_many(),
+        }
+        
+        def to_json():
+            return serializer.to_json(page, {'list_representation': NoteRepresentation})
+        
+        def to_msgpack():
+            return serializer.to_msgpack(page)
+        
+        report('to_msgpack (%d vs. %d bytes)' % (len(to_json()), len(to_msgpack())), size, best_of(to_json), best_of(to_msgpack))
+
+
+DATETIME_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})(T|\s+)(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}).*?$')
+
+
+def bench_format_datetime():
+    """
+    Per-value cost of RFC 2822 via ``dateformat`` vs. ``format_datetime``
+    (ISO 8601).
+    """
+    for size in SIZES:
+        values = [datetime.datetime(2010, 3, 30, 20, 5) + datetime.timedelta(minutes=i) for i in xrange(size)]
+        
+        def rfc_2822():
+            for value in values:
+                dateformat.format(value, 'r')
+        
+        def iso_8601():
+            for value in values:
+                format_datetime(value)
+        
+        report_per_value('format_datetime', size, best_of(rfc_2822), best_of(iso_8601))
+
+
+def bench_parse_datetime():
+    """
+    Per-value cost of the regex ``DateTimeField.convert`` used vs.
+    ``parse_datetime``.
+    """
+    for size in SIZES:
+        values = [(datetime.datetime(2010, 3, 30, 20, 5) + datetime.timedelta(minutes=i)).isoformat() for i in xrange(size)]
+        
+        def regex():
+            for value in values:
+                data = DATETIME_REGEX.search(value).groupdict()
+                datetime_safe.datetime(int(data['year']), int(data['month']), int(data['day']), int(data['hour']), int(data['minute']), int(data['second']))
+        
+        def parsed():
+            for value in values:
+                parse_datetime(value)
+        
+        report_per_value('parse_datetime', size, best_of(regex), best_of(parsed))
+
+
+if __name__ == '__main__':
+    for name, func in sorted(globals().items()):
+        if name.startswith('bench_'):
+            func()
@@ -0,0 +1,2 @@
+from complex.tests.representations import *
+from complex.tests.resources import *
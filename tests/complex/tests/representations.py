@@ -0,0 +1,472 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from tastypie.fields import CharField, ForeignKey, ManyToManyField, OneToManyField, OneToOneField
+from tastypie.representations.models import ModelRepresentation
+from tastypie.representations.simple import MAX_FIELD_SUBSETS
+from tastypie.serializers import Serializer
+from complex.api.representations import CommentRepresentation, GroupRepresentation, PostRepresentation, ProfileRepresentation, UserRepresentation
+from complex.models import Post
+# Registers the canonical resources, which the resource URIs rely on.
+import complex.api.urls
+
+
+class ProfiledUserRepresentation(ModelRepresentation):
+    profile = OneToOneField(ProfileRepresentation, 'profile', full_repr=True)
+
+    class Meta:
+        queryset = User.objects.all()
+
+
+class FullPostRepresentation(ModelRepresentation):
+    user = ForeignKey(ProfiledUserRepresentation, 'user', full_repr=True)
+
+    class Meta:
+        queryset = Post.objects.all()
+
+
+class NestedPostRepresentation(ModelRepresentation):
+    user = ForeignKey(UserRepresentation, 'user', full_repr=True)
+
+    class Meta:
+        queryset = Post.objects.all()
+
+
+class SimplePostRepresentation(ModelRepresentation):
+    user = ForeignKey(ProfiledUserRepresentation, 'user', full_repr=True)
+
+    class Meta:
+        queryset = Post.objects.all()
+        excludes = ['content']
+
+
+class PostingUserRepresentation(ModelRepresentation):
+    groups = ManyToManyField(GroupRepresentation, 'groups')
+    posts = OneToManyField(SimplePostRepresentation, 'notes', full_repr=True)
+
+    class Meta:
+        queryset = User.objects.all()
+        excludes = ['password']
+
+
+class MemberGroupRepresentation(ModelRepresentation):
+    users = ManyToManyField(PostingUserRepresentation, 'user_set', full_repr=True)
+
+    class Meta:
+        queryset = Group.objects.all()
+
+
+class CommentedPostRepresentation(ModelRepresentation):
+    comments = OneToManyField(CommentRepresentation, 'comments', full_repr=True)
+
+    class Meta:
+        queryset = Post.objects.all()
+
+
+class SummarizedPostRepresentation(ModelRepresentation):
+    summary = CharField()
+
+    class Meta:
+        queryset = Post.objects.all()
+        fields = ['title']
+        dehydrate_columns = {
+            'summary': ['content'],
+        }
+
+    def dehydrate_summary(self, obj):
+        return obj.content[:10]
+
+
+class UndeclaredPostRepresentation(ModelRepresentation):
+    summary = CharField()
+
+    class Meta:
+        queryset = Post.objects.all()
+        fields = ['title']
+
+    def dehydrate_summary(self, obj):
+        return obj.content[:10]
+
+
+class HookedPostRepresentation(ModelRepresentation):
+    class Meta:
+        queryset = Post.objects.all()
+        fields = ['title']
+
+    def dehydrate(self, obj):
+        self.data['slug'] = obj.slug
+
+
+class DeclaredHookPostRepresentation(HookedPostRepresentation):
+    class Meta:
+        queryset = Post.objects.all()
+        fields = ['title']
+        dehydrate_columns = {
+            'dehydrate': ['slug'],
+        }
+
+
+class QueryCountTestCase(TestCase):
+    def setUp(self):
+        super(QueryCountTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(QueryCountTestCase, self).tearDown()
+
+    def assertNumQueries(self, num, func, *args, **kwargs):
+        connection.queries = []
+        result = func(*args, **kwargs)
+        self.assertEqual(len(connection.queries), num, "%s queries executed, %s expected:\n%s" % (len(connection.queries), num, '\n'.join([query['sql'] for query in connection.queries])))
+        return result
+
+
+class SelectRelatedTestCase(QueryCountTestCase):
+    def test_get_select_related(self):
+        self.assertEqual(ProfileRepresentation.get_select_related(), [])
+        self.assertEqual(ProfiledUserRepresentation.get_select_related(), ['profile'])
+        self.assertEqual(FullPostRepresentation.get_select_related(), ['user', 'user__profile'])
+        # Non-full relations build the URI from the foreign key column.
+        self.assertEqual(PostRepresentation.get_select_related(), [])
+
+    def test_get_list(self):
+        def dehydrate_page():
+            return FullPostRepresentation.get_list()[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(1, dehydrate_page)
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(objects[0]['user'].data['username'], u'daniel')
+        self.assertEqual(objects[0]['user'].data['profile'].data['favorite_color'], u'blue')
+
+    def test_get(self):
+        representation = FullPostRepresentation()
+        self.assertNumQueries(1, representation.get, pk=1)
+        self.assertEqual(representation.data['user'].data['profile'].data['favorite_color'], u'blue')
+
+
+class PrefetchTestCase(QueryCountTestCase):
+    def test_many_to_many(self):
+        def dehydrate_page():
+            return UserRepresentation.get_list()[0:20].dehydrate_many()
+
+        # One for the users (& profiles), one for all of their groups.
+        objects = self.assertNumQueries(2, dehydrate_page)
+        self.assertEqual([obj['username'] for obj in objects], [u'daniel', u'scatman'])
+        self.assertEqual([[group.data['name'] for group in obj['groups']] for obj in objects], [[u'Ninjas', u'Pirates'], [u'Ninjas']])
+
+    def test_reverse_foreign_key(self):
+        def dehydrate_page():
+            return PostingUserRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        # Users, groups & posts (with their users & profiles).
+        objects = self.assertNumQueries(3, dehydrate_page)
+        self.assertEqual([len(obj['groups']) for obj in objects], [2, 1])
+        self.assertEqual([[post.data['title'] for post in obj['posts']] for obj in objects], [[u'The First Post'], [u'Another Post']])
+        self.assertEqual(objects[1]['posts'][0].data['user'].data['profile'].data['favorite_color'], u'brown')
+
+    def test_nested(self):
+        def dehydrate_page():
+            return MemberGroupRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        # Groups, their users, the users' groups & the users' posts.
+        objects = self.assertNumQueries(4, dehydrate_page)
+        self.assertEqual([[user.data['username'] for user in obj['users']] for obj in objects], [[u'daniel', u'scatman'], [u'daniel']])
+        self.assertEqual([len(user.data['posts']) for user in objects[0]['users']], [1, 1])
+
+    def test_get(self):
+        representation = PostingUserRepresentation(api_name='v1')
+        self.assertNumQueries(3, representation.get, pk=2)
+        self.assertEqual(len(representation.data['groups']), 1)
+        self.assertEqual(representation.data['posts'][0].data['title'], u'Another Post')
+
+    def test_iter(self):
+        def dehydrate_page():
+            return [representation.to_dict() for representation in UserRepresentation.get_list()]
+
+        objects = self.assertNumQueries(2, dehydrate_page)
+        self.assertEqual([len(obj['groups']) for obj in objects], [2, 1])
+
+    def test_generic_relation(self):
+        # Content types are cached after the first lookup.
+        ContentType.objects.get_for_model(Post)
+
+        def dehydrate_page():
+            return PostRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        # Posts (& users), then all the comments in one go.
+        objects = self.assertNumQueries(2, dehydrate_page)
+        self.assertEqual([obj['comments'] for obj in objects], [[u'/api/v1/comments/1/'], [u'/api/v1/comments/2/']])
+
+        def dehydrate_full_page():
+            return CommentedPostRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(2, dehydrate_full_page)
+        self.assertEqual([[comment.data['comment'] for comment in obj['comments']] for obj in objects], [[u'Nice post'], [u'Even better than the last!']])
+
+
+class ColumnPruningTestCase(QueryCountTestCase):
+    def test_get_columns(self):
+        self.assertEqual(GroupRepresentation.get_columns(), None)
+        # Unused relations get deferred too.
+        self.assertEqual(sorted(CommentedPostRepresentation.get_columns()), ['content', 'created', 'id', 'is_active', 'slug', 'title', 'updated'])
+        self.assertEqual(sorted(SimplePostRepresentation.get_columns()), ['created', 'id', 'is_active', 'slug', 'title', 'updated', 'user'])
+        self.assertEqual(sorted(SummarizedPostRepresentation.get_columns()), ['content', 'id', 'title'])
+        self.assertEqual(UndeclaredPostRepresentation.get_columns(), None)
+        # The ``dehydrate`` hook could read anything too.
+        self.assertEqual(HookedPostRepresentation.get_columns(), None)
+        self.assertEqual(sorted(DeclaredHookPostRepresentation.get_columns()), ['id', 'slug', 'title'])
+        # Reverse relations don't need any columns of their own.
+        self.assertEqual(sorted(PostingUserRepresentation.get_columns()), ['date_joined', 'email', 'first_name', 'id', 'is_active', 'is_staff', 'is_superuser', 'last_login', 'last_name', 'username'])
+
+    def test_get_list(self):
+        def dehydrate_page():
+            return SimplePostRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(1, dehydrate_page)
+        self.assert_(not '"complex_post"."content"' in connection.queries[0]['sql'])
+        self.assertEqual([obj['title'] for obj in objects], [u'The First Post', u'Another Post'])
+        self.assertEqual(objects[0]['user'].data['username'], u'daniel')
+
+        def dehydrate_summaries():
+            return SummarizedPostRepresentation.get_list()[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(1, dehydrate_summaries)
+        self.assert_(not '"complex_post"."slug"' in connection.queries[0]['sql'])
+        self.assertEqual(sorted(objects[0].keys()), ['resource_uri', 'summary', 'title'])
+
+    def test_dehydrate_hook(self):
+        for representation_class in (HookedPostRepresentation, DeclaredHookPostRepresentation):
+            def dehydrate_page():
+                return representation_class.get_list()[0:20].dehydrate_many()
+
+            # Not a query per object for the deferred ``slug``.
+            objects = self.assertNumQueries(1, dehydrate_page)
+            self.assertEqual([obj['slug'] for obj in objects], [u'first-post', u'another-post'])
+
+    def test_get(self):
+        representation = SummarizedPostRepresentation()
+        self.assertNumQueries(1, representation.get, pk=2)
+        self.assert_(not '"complex_post"."slug"' in connection.queries[0]['sql'])
+        self.assertEqual(representation.data['title'], u'Another Post')
+
+
+class ClearedDict(dict):
+    """
+    Cleared straight after each store, as if by another thread.
+    """
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.clear()
+
+
+class SparseFieldsTestCase(QueryCountTestCase):
+    def test_plans(self):
+        self.assertEqual(FullPostRepresentation.get_select_related(['title']), [])
+        self.assertEqual(FullPostRepresentation.get_select_related(['title', 'user']), ['user', 'user__profile'])
+        self.assertEqual(sorted(FullPostRepresentation.get_columns(['title'])), ['id', 'title'])
+
+    def test_cache_limits(self):
+        # Unknown & repeated names don't make for another subset.
+        self.assert_(FullPostRepresentation.get_field_subset(['title', 'title', 'nope']) is FullPostRepresentation.get_field_subset(['title']))
+
+        serializer = Serializer()
+        field_names = sorted(PostingUserRepresentation.base_fields.keys())
+
+        # Every combination a client could ask for (2 ** 12) wouldn't fit.
+        for i in range(1, 2 ** len(field_names)):
+            fields = [field_name for (bit, field_name) in enumerate(field_names) if i & (1 << bit)]
+            PostingUserRepresentation.get_columns(fields)
+            serializer.get_json_encoder(PostingUserRepresentation, tuple(fields))
+
+        self.assert_(len(PostingUserRepresentation._field_subsets) <= MAX_FIELD_SUBSETS)
+        self.assert_(len(PostingUserRepresentation._plans) <= MAX_FIELD_SUBSETS)
+        self.assert_(len(serializer._json_encoders) <= MAX_FIELD_SUBSETS)
+
+    def test_cache_cleared(self):
+        serializer = Serializer()
+        serializer._json_encoders = ClearedDict()
+        PostingUserRepresentation._field_subsets = ClearedDict()
+        PostingUserRepresentation._plans = ClearedDict()
+
+        try:
+            self.assertEqual(sorted(PostingUserRepresentation.get_field_subset(['username']).keys()), ['username'])
+            self.assertEqual(sorted(PostingUserRepresentation.get_columns(['username'])), ['id', 'username'])
+            self.assert_(serializer.get_json_encoder(PostingUserRepresentation, ('username',)) is not None)
+        finally:
+            del PostingUserRepresentation._field_subsets
+            del PostingUserRepresentation._plans
+
+    def test_get_list(self):
+        def dehydrate_page():
+            return PostingUserRepresentation.get_list(options={'api_name': 'v1', 'fields': ['username']})[0:20].dehydrate_many()
+
+        # No prefetching for the relations that weren't asked for.
+        objects = self.assertNumQueries(1, dehydrate_page)
+        self.assertEqual(objects, [{'username': u'daniel'}, {'username': u'scatman'}])
+
+        def dehydrate_groups():
+            return PostingUserRepresentation.get_list(options={'api_name': 'v1', 'fields': ['groups']})[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(2, dehydrate_groups)
+        self.assertEqual([len(obj['groups']) for obj in objects], [2, 1])
+
+    def test_get(self):
+        representation = FullPostRepresentation(fields=['title'])
+        self.assertNumQueries(1, representation.get, pk=1)
+        self.assert_(not 'auth_user' in connection.queries[0]['sql'])
+        self.assertEqual(representation.to_dict(), {'title': u'The First Post'})
+
+
+class RelatedUriTestCase(QueryCountTestCase):
+    def test_foreign_key_uri(self):
+        def dehydrate_page():
+            return PostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['user']})[0:20].dehydrate_many()
+
+        # The users are never loaded, not even via a join.
+        objects = self.assertNumQueries(1, dehydrate_page)
+        self.assert_(not 'auth_user' in connection.queries[0]['sql'])
+        self.assertEqual(objects, [{'user': u'/api/v1/users/1/'}, {'user': u'/api/v1/users/2/'}])
+
+        # Which matches what the related representation gives.
+        post = Post.objects.get(pk=1)
+        representation = UserRepresentation(api_name='v1')
+        representation.instance = post.user
+        self.assertEqual(representation.get_resource_uri(), u'/api/v1/users/1/')
+
+    def test_custom_uri(self):
+        class CustomUriUserRepresentation(UserRepresentation):
+            def get_resource_uri(self):
+                return '/users/%s/' % self.instance.username
+
+        class CustomUriPostRepresentation(ModelRepresentation):
+            user = ForeignKey(CustomUriUserRepresentation, 'user')
+
+            class Meta:
+                queryset = Post.objects.all()
+
+        # A custom ``get_resource_uri`` may need the whole object.
+        self.assertEqual(CustomUriPostRepresentation.get_select_related(), ['user'])
+        objects = CustomUriPostRepresentation.get_list(options={'fields': ['user']}).dehydrate_many()
+        self.assertEqual(objects, [{'user': '/users/daniel/'}, {'user': '/users/scatman/'}])
+
+    def test_to_many_uris(self):
+        def dehydrate_page():
+            return PostingUserRepresentation.get_list(options={'api_name': 'v1', 'fields': ['groups']})[0:20].dehydrate_many()
+
+        # Only the join table is read, not the groups themselves.
+        objects = self.assertNumQueries(2, dehydrate_page)
+        self.assert_(not 'auth_group"' in connection.queries[1]['sql'])
+        self.assertEqual(objects, [{'groups': [u'/api/v1/groups/1/', u'/api/v1/groups/2/']}, {'groups': [u'/api/v1/groups/1/']}])
+
+        # Which matches loading them one by one.
+        user = User.objects.get(pk=1)
+        representation = GroupRepresentation(api_name='v1')
+        uris = []
+
+        for group in user.groups.all():
+            representation.instance = group
+            uris.append(representation.get_resource_uri())
+
+        self.assertEqual(uris, objects[0]['groups'])
+
+        def dehydrate_comments():
+            return PostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['comments']})[0:20].dehydrate_many()
+
+        self.assertNumQueries(2, dehydrate_comments)
+        self.assert_(not '"django_comments"."comment"' in connection.queries[1]['sql'])
+
+
+class IdentityMapTestCase(QueryCountTestCase):
+    def test_to_one(self):
+        Post.objects.create(user_id=1, title=u'Yet Another Post', slug='yet-another-post', content=u'More.')
+
+        def dehydrate_page():
+            return FullPostRepresentation.get_list()[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(1, dehydrate_page)
+        self.assertEqual([obj['user'].data['username'] for obj in objects], [u'daniel', u'scatman', u'daniel'])
+        # Dehydrated once & shared between the rows.
+        self.assert_(objects[0]['user'] is objects[2]['user'])
+        self.assert_(objects[0]['user'] is not objects[1]['user'])
+
+    def test_to_many(self):
+        def dehydrate_page():
+            return MemberGroupRepresentation.get_list(options={'api_name': 'v1'})[0:20].dehydrate_many()
+
+        objects = self.assertNumQueries(4, dehydrate_page)
+        self.assert_(objects[0]['users'][0] is objects[1]['users'][0])
+        self.assertEqual(objects[1]['users'][0].data['username'], u'daniel')
+
+    def test_per_response(self):
+        representation_set = FullPostRepresentation.get_list()
+        first = representation_set.dehydrate_many()
+        second = representation_set.dehydrate_many()
+        self.assert_(first[0]['user'] is not second[0]['user'])
+        self.assertEqual(first[0]['user'].to_dict()['username'], second[0]['user'].to_dict()['username'])
+
+        # Nor for representations that aren't part of a response.
+        self.assertEqual(FullPostRepresentation().identity_map, None)
+
+
+class LinkedTestCase(QueryCountTestCase):
+    def test_get_linked(self):
+        def dehydrate_page():
+            return PostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['user']})[0:20].dehydrate_compound(['user', 'user.groups'])
+
+        # Posts, users (& profiles), the users' groups, then the linked groups.
+        objects, linked = self.assertNumQueries(4, dehydrate_page)
+        self.assertEqual(objects, [{'user': u'/api/v1/users/1/'}, {'user': u'/api/v1/users/2/'}])
+        self.assertEqual(sorted(linked.keys()), ['groups', 'users'])
+        self.assertEqual([user['username'] for user in linked['users']], [u'daniel', u'scatman'])
+        self.assertEqual(sorted([group['name'] for group in linked['groups']]), [u'Ninjas', u'Pirates'])
+
+    def test_shared(self):
+        Post.objects.create(user_id=1, title=u'Yet Another Post', slug='yet-another-post', content=u'More.')
+
+        # Each user is only included once, however many posts point at it.
+        objects, linked = PostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['user']}).dehydrate_compound(['user'])
+        self.assertEqual(len(objects), 3)
+        self.assertEqual([user['resource_uri'] for user in linked['users']], [u'/api/v1/users/1/', u'/api/v1/users/2/'])
+
+    def test_to_many(self):
+        def dehydrate_page():
+            return PostingUserRepresentation.get_list(options={'api_name': 'v1', 'fields': ['groups']})[0:20].dehydrate_compound(['groups'])
+
+        # Users, their group pks & then the groups themselves.
+        objects, linked = self.assertNumQueries(3, dehydrate_page)
+        self.assertEqual(objects[0], {'groups': [u'/api/v1/groups/1/', u'/api/v1/groups/2/']})
+        self.assertEqual([group['resource_uri'] for group in linked['groups']], [u'/api/v1/groups/1/', u'/api/v1/groups/2/'])
+
+    def test_full_repr(self):
+        objects, linked = NestedPostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['user']}).dehydrate_compound(['user', 'user.profile'])
+        # Linked rather than nested, in the rows & in the linked objects.
+        self.assertEqual(objects, [{'user': u'/api/v1/users/1/'}, {'user': u'/api/v1/users/2/'}])
+        self.assertEqual([user['profile'] for user in linked['users']], [u'/api/v1/profiles/1/', u'/api/v1/profiles/2/'])
+        self.assertEqual([profile['favorite_color'] for profile in linked['profiles']], [u'blue', u'brown'])
+
+        # Without the include, they're nested as before.
+        objects, linked = NestedPostRepresentation.get_list(options={'api_name': 'v1', 'fields': ['user']}).dehydrate_compound(['user'])
+        self.assertEqual(objects[0]['user'], u'/api/v1/users/1/')
+        self.assertEqual(linked['users'][0]['profile'].data['favorite_color'], u'blue')
+
+
+class IterDehydratedTestCase(QueryCountTestCase):
+    def test_chunks(self):
+        def dehydrate_all(chunk_size):
+            return list(UserRepresentation.get_list().iter_dehydrated(chunk_size=chunk_size))
+
+        # The users, then the groups for each chunk of them.
+        objects = self.assertNumQueries(2, dehydrate_all, 100)
+        self.assertEqual([[group.data['name'] for group in obj['groups']] for obj in objects], [[u'Ninjas', u'Pirates'], [u'Ninjas']])
+        objects = self.assertNumQueries(3, dehydrate_all, 1)
+        self.assertEqual([obj['username'] for obj in objects], [u'daniel', u'scatman'])
+
+    def test_len(self):
+        representation_set = UserRepresentation.get_list()
+        # Counted by the database.
+        self.assertEqual(self.assertNumQueries(1, len, representation_set), 2)
+        self.assert_('COUNT(*)' in connection.queries[0]['sql'])
@@ -0,0 +1,155 @@
+import sys
+import threading
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+from django.test import TestCase
+from django.utils import simplejson
+from tastypie.exceptions import BadRequest
+from tastypie.fields import CharField, ForeignKey
+from tastypie.representations.models import ModelRepresentation
+from tastypie.representations.simple import Representation
+from tastypie.resources import Resource
+from complex.api.urls import api
+from complex.models import Post
+
+
+class PlainUserRepresentation(Representation):
+    username = CharField(attribute='username')
+
+    class Meta:
+        object_class = User
+
+
+class PlainUserPostRepresentation(ModelRepresentation):
+    user = ForeignKey(PlainUserRepresentation, 'user')
+
+    class Meta:
+        queryset = Post.objects.all()
+
+
+class PlainUserPostResource(Resource):
+    representation = PlainUserPostRepresentation
+    resource_name = 'posts'
+
+
+class IncludeTestCase(TestCase):
+    def test_get_requested_includes(self):
+        resource = api.canonical_resource_for('posts')
+        request = HttpRequest()
+
+        request.GET = {'format': 'json'}
+        self.assertEqual(resource.get_requested_includes(request), None)
+
+        request.GET = {'format': 'json', 'include': 'user.groups, user,user'}
+        self.assertEqual(resource.get_requested_includes(request), ['user', 'user.groups'])
+
+        request.GET = {'format': 'json', 'include': 'title'}
+        self.assertRaises(BadRequest, resource.get_requested_includes, request)
+
+        request.GET = {'format': 'json', 'include': 'user.username'}
+        self.assertRaises(BadRequest, resource.get_requested_includes, request)
+
+        # Only representations that know how to sideload can be included.
+        request.GET = {'format': 'json', 'include': 'user'}
+        self.assertRaises(BadRequest, PlainUserPostResource().get_requested_includes, request)
+
+    def test_get_list(self):
+        resource = api.canonical_resource_for('posts')
+        request = HttpRequest()
+        request.GET = {'format': 'json', 'fields': 'title', 'include': 'user.profile'}
+
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 200)
+        data = simplejson.loads(resp.content)
+        self.assertEqual(data['objects'], [{'title': 'The First Post', 'user': '/api/v1/users/1/'}, {'title': 'Another Post', 'user': '/api/v1/users/2/'}])
+        self.assertEqual([user['username'] for user in data['linked']['users']], ['daniel', 'scatman'])
+        self.assertEqual([user['profile'] for user in data['linked']['users']], ['/api/v1/profiles/1/', '/api/v1/profiles/2/'])
+        self.assertEqual([profile['favorite_color'] for profile in data['linked']['profiles']], ['blue', 'brown'])
+
+        request.GET = {'format': 'json', 'include': 'nope'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 400)
+
+        request.GET = {'format': 'json', 'include': 'user'}
+        resp = PlainUserPostResource().get_list(request)
+        self.assertEqual(resp.status_code, 400)
+
+
+class ThreadSafetyTestCase(TestCase):
+    def setUp(self):
+        super(ThreadSafetyTestCase, self).setUp()
+        # Switch threads as often as possible to shake out any races.
+        self.old_check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+
+    def tearDown(self):
+        sys.setcheckinterval(self.old_check_interval)
+        super(ThreadSafetyTestCase, self).tearDown()
+
+    def make_request(self, **get):
+        request = HttpRequest()
+        request.GET = QueryDict('').copy()
+        request.GET.update(get)
+        request.method = 'GET'
+        return request
+
+    def test_concurrent_dispatch(self):
+        # Through the ORM & every per-class cache (field subsets, plans, JSON
+        # encoders, URI templates), with a fresh mix of them on each request.
+        posts = api.canonical_resource_for('posts')
+        users = api.canonical_resource_for('users')
+        jobs = [
+            (posts, 'list', {'format': 'json'}, {}),
+            (posts, 'list', {'format': 'json', 'fields': 'title,user'}, {}),
+            (posts, 'list', {'format': 'json', 'fields': 'slug', 'include': 'user,user.groups'}, {}),
+            (posts, 'list', {'format': 'xml', 'fields': 'title', 'include': 'user.profile'}, {}),
+            (posts, 'detail', {'format': 'json', 'fields': 'title,comments'}, {'obj_id': '1'}),
+            (users, 'list', {'format': 'json', 'fields': 'username,groups'}, {}),
+            (users, 'list', {'format': 'xml', 'fields': 'username,profile'}, {}),
+            (users, 'list', {'format': 'json', 'include': 'groups'}, {}),
+            (users, 'detail', {'format': 'xml'}, {'obj_id': '2'}),
+        ]
+
+        # What each job should produce, computed without any concurrency.
+        expected = []
+
+        for resource, request_type, get, kwargs in jobs:
+            response = resource.dispatch(request_type, self.make_request(**get), **kwargs)
+            self.assertEqual(response.status_code, 200)
+            expected.append(response.content)
+
+        data = simplejson.loads(expected[2])
+        self.assertEqual(data['objects'], [{'slug': 'first-post', 'user': '/api/v1/users/1/'}, {'slug': 'another-post', 'user': '/api/v1/users/2/'}])
+        self.assertEqual(sorted(data['linked'].keys()), ['groups', 'users'])
+        self.assert_('<favorite_color>blue</favorite_color>' in expected[3])
+        self.assertEqual(simplejson.loads(expected[4]), {'title': 'The First Post', 'comments': ['/api/v1/comments/1/']})
+        self.assertEqual([obj['username'] for obj in simplejson.loads(expected[5])['objects']], ['daniel', 'scatman'])
+
+        failures = []
+
+        def hammer(offset):
+            try:
+                try:
+                    for i in range(20):
+                        job_offset = (offset + i) % len(jobs)
+                        resource, request_type, get, kwargs = jobs[job_offset]
+                        response = resource.dispatch(request_type, self.make_request(**get), **kwargs)
+
+                        if response.status_code != 200 or response.content != expected[job_offset]:
+                            failures.append((job_offset, response.status_code, response.content))
+                except Exception, e:
+                    failures.append((offset, repr(e)))
+            finally:
+                # Each thread has a connection of its own.
+                connection.close()
+
+        threads = [threading.Thread(target=hammer, args=(offset,)) for offset in range(9)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
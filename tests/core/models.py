@@ -23,6 +23,22 @@ class Note(models.Model):
         return datetime.datetime(2010, 4, 1, 0, 48)
 
 
+class ActiveManager(models.Manager):
+    def get_query_set(self):
+        return super(ActiveManager, self).get_query_set().filter(is_active=True)
+
+
+class Label(models.Model):
+    notes = models.ManyToManyField(Note, related_name='labels')
+    name = models.CharField(max_length=255)
+    is_active = models.BooleanField(default=True)
+    
+    objects = ActiveManager()
+    
+    def __unicode__(self):
+        return self.name
+
+
 class Subject(models.Model):
     notes = models.ManyToManyField(Note, related_name='subjects')
     name = models.CharField(max_length=255)
@@ -148,8 +148,16 @@ class ApiTestCase(TestCase):
         self.assertEqual(tastypie._get_canonical_resource_name(api.api_name, UserRepresentation()), 'users')
         self.assertEqual(tastypie._get_canonical_resource_name(api.api_name, user_resource.detail_representation), 'users')
         
+        
+        # Representations are told apart by class, not by name.
+        OtherNoteRepresentation = type('NoteRepresentation', (ModelRepresentation,), {
+            'Meta': type('Meta', (object,), {'queryset': Note.objects.all()}),
+        })
+        self.assertRaises(URLReverseError, tastypie._get_canonical_resource_name, api.api_name, OtherNoteRepresentation)
+        
         api.unregister(user_resource.resource_name)
         self.assertRaises(NotRegistered, api.canonical_resource_for, 'users')
+        self.assertRaises(URLReverseError, tastypie._get_canonical_resource_name, api.api_name, UserRepresentation)
     
     def test_urls(self):
         api = Api()
@@ -0,0 +1,11 @@
+from django.conf.urls.defaults import *
+from core.tests.resources import NoteResource
+
+
+note_resource = NoteResource()
+
+# Only digits for the ``obj_id`` (& only a few, for ``users``).
+urlpatterns = patterns('',
+    url(r"^(?P<resource_name>notes)/(?P<obj_id>\d+)/$", note_resource.wrap_view('dispatch_detail'), name="api_dispatch_detail"),
+    url(r"^(?P<resource_name>users)/(?P<obj_id>\d{1,3})/$", note_resource.wrap_view('dispatch_detail'), name="api_dispatch_detail"),
+)
@@ -1,4 +1,5 @@
 import datetime
+import pickle
 from django.contrib.auth.models import User
 from django.test import TestCase
 from tastypie.exceptions import ApiFieldError, NotFound
@@ -16,14 +17,12 @@ class ApiFieldTestCase(TestCase):
         self.assertEqual(field_1.attribute, None)
         self.assertEqual(field_1._default, NOT_PROVIDED)
         self.assertEqual(field_1.null, False)
-        self.assertEqual(field_1.value, None)
         
         field_2 = ApiField(attribute='foo', default=True, null=True, readonly=True)
         self.assertEqual(field_2.instance_name, None)
         self.assertEqual(field_2.attribute, 'foo')
         self.assertEqual(field_2._default, True)
         self.assertEqual(field_2.null, True)
-        self.assertEqual(field_2.value, None)
         self.assertEqual(field_2.readonly, True)
     
     def test_dehydrated_type(self):
@@ -70,6 +69,33 @@ class ApiFieldTestCase(TestCase):
         # Correct callable attribute.
         field_6 = ApiField(attribute='what_time_is_it', default=True)
         self.assertEqual(field_6.dehydrate(note), datetime.datetime(2010, 4, 1, 0, 48))
+        
+        # Through a relation.
+        field_7 = ApiField(attribute='author__username')
+        self.assertEqual(field_7.dehydrate(note), u'johndoe')
+        
+        # Empty somewhere along the relation.
+        note.author = None
+        
+        try:
+            field_7.dehydrate(note)
+            self.fail()
+        except ApiFieldError, e:
+            self.assertEqual(e.args[0], "The model '%r' has an empty attribute 'author' and doesn't allow a default or null value." % note)
+        
+        field_8 = ApiField(attribute='author__username', null=True)
+        self.assertEqual(field_8.dehydrate(note), None)
+        field_9 = ApiField(attribute='author__username', default=lambda: u'anonymous')
+        self.assertEqual(field_9.dehydrate(note), u'anonymous')
+        
+        # Changing the attribute takes effect right away.
+        field_5.attribute = 'slug'
+        self.assertEqual(field_5.dehydrate(note), u'first-post')
+        
+        # Fields survive pickling (for the cache backends).
+        unpickled = pickle.loads(pickle.dumps(field_5))
+        self.assertEqual(unpickled.attribute, 'slug')
+        self.assertEqual(unpickled.dehydrate(note), u'first-post')
     
     def test_convert(self):
         field_1 = ApiField()
@@ -81,36 +107,30 @@ class ApiFieldTestCase(TestCase):
         
         # With no value, default or nullable, we should get an ``ApiFieldError``.
         field_1 = ApiField()
-        field_1.value = None
-        self.assertRaises(ApiFieldError, field_1.hydrate)
+        self.assertRaises(ApiFieldError, field_1.hydrate, None)
         
         # The default.
         field_2 = ApiField(default='foo')
-        field_2.value = None
-        self.assertEqual(field_2.hydrate(), 'foo')
+        self.assertEqual(field_2.hydrate(None), 'foo')
         
         # The callable default.
         def foo():
             return 'bar'
         
         field_3 = ApiField(default=foo)
-        field_3.value = None
-        self.assertEqual(field_3.hydrate(), 'bar')
+        self.assertEqual(field_3.hydrate(None), 'bar')
         
         # The nullable case.
         field_4 = ApiField(null=True)
-        field_4.value = None
-        self.assertEqual(field_4.hydrate(), None)
+        self.assertEqual(field_4.hydrate(None), None)
         
         # The readonly case.
         field_5 = ApiField(readonly=True)
-        field_5.value = 'abcdef'
-        self.assertEqual(field_5.hydrate(), None)
+        self.assertEqual(field_5.hydrate('abcdef'), None)
         
         # A real, live attribute!
         field_6 = ApiField(attribute='title')
-        field_6.value = note.title
-        self.assertEqual(field_6.hydrate(), u'First Post!')
+        self.assertEqual(field_6.hydrate(note.title), u'First Post!')
 
 
 class CharFieldTestCase(TestCase):
@@ -224,6 +244,12 @@ class DateTimeFieldTestCase(TestCase):
         note.created_string = '2010-04-02 01:11:00'
         field_3 = DateTimeField(attribute='created_string')
         self.assertEqual(field_3.dehydrate(note), datetime.datetime(2010, 4, 2, 1, 11))
+        
+        note.created_string = '2010-04-02T01:11:00.5-05:00'
+        self.assertEqual(field_3.dehydrate(note), datetime.datetime(2010, 4, 2, 1, 11, 0, 500000))
+        
+        note.created_string = 'Fri, 2 Apr 2010 01:11:00 -0500'
+        self.assertRaises(ApiFieldError, field_3.dehydrate, note)
 
 
 class UserRepresentation(ModelRepresentation):
@@ -245,7 +271,6 @@ class ForeignKeyTestCase(TestCase):
         self.assertEqual(field_1.related_name, None)
         self.assertEqual(field_1.null, False)
         self.assertEqual(field_1.full_repr, False)
-        self.assertEqual(field_1.value, None)
         
         field_2 = ForeignKey(UserRepresentation, 'author', null=True)
         self.assertEqual(field_2.instance_name, None)
@@ -254,7 +279,6 @@ class ForeignKeyTestCase(TestCase):
         self.assertEqual(field_2.related_name, None)
         self.assertEqual(field_2.null, True)
         self.assertEqual(field_2.full_repr, False)
-        self.assertEqual(field_2.value, None)
     
     def test_dehydrated_type(self):
         field_1 = ForeignKey(UserRepresentation, 'author')
@@ -290,8 +314,8 @@ class ForeignKeyTestCase(TestCase):
         field_4 = ForeignKey(UserRepresentation, 'author', full_repr=True)
         user_repr = field_4.dehydrate(note)
         self.assertEqual(isinstance(user_repr, UserRepresentation), True)
-        self.assertEqual(user_repr.username.value, u'johndoe')
-        self.assertEqual(user_repr.email.value, u'john@doe.com')
+        self.assertEqual(user_repr.data['username'], u'johndoe')
+        self.assertEqual(user_repr.data['email'], u'john@doe.com')
     
     def test_hydrate(self):
         note = Note.objects.get(pk=1)
@@ -302,30 +326,27 @@ class ForeignKeyTestCase(TestCase):
         
         # The nullable case.
         field_2 = ForeignKey(UserRepresentation, 'author', null=True)
-        field_2.value = None
-        self.assertEqual(field_2.hydrate(), None)
+        self.assertEqual(field_2.hydrate(None), None)
         
         # Wrong resource URI.
         field_3 = ForeignKey(UserRepresentation, 'author')
-        field_3.value = '/api/v1/users/abc/'
-        self.assertRaises(NotFound, field_3.hydrate)
+        self.assertRaises(NotFound, field_3.hydrate, '/api/v1/users/abc/')
         
         # A real, live attribute!
         field_4 = ForeignKey(UserRepresentation, 'author')
-        field_4.value = '/api/v1/users/1/'
-        user_repr = field_4.hydrate()
-        self.assertEqual(user_repr.username.value, u'johndoe')
-        self.assertEqual(user_repr.email.value, u'john@doe.com')
+        user_repr = field_4.hydrate('/api/v1/users/1/')
+        self.assertEqual(user_repr.data['username'], u'johndoe')
+        self.assertEqual(user_repr.data['email'], u'john@doe.com')
         
         field_5 = ForeignKey(UserRepresentation, 'author')
-        field_5.value = {
+        value = {
             'username': u'mistersmith',
             'email': u'smith@example.com',
             'password': u'foobar',
         }
-        user_repr = field_5.hydrate()
-        self.assertEqual(user_repr.username.value, u'mistersmith')
-        self.assertEqual(user_repr.email.value, u'smith@example.com')
+        user_repr = field_5.hydrate(value)
+        self.assertEqual(user_repr.data['username'], u'mistersmith')
+        self.assertEqual(user_repr.data['email'], u'smith@example.com')
 
 
 class SubjectRepresentation(ModelRepresentation):
@@ -371,7 +392,6 @@ class ManyToManyFieldTestCase(TestCase):
         self.assertEqual(field_1.related_name, None)
         self.assertEqual(field_1.null, False)
         self.assertEqual(field_1.full_repr, False)
-        self.assertEqual(field_1.value, None)
         
         field_2 = ManyToManyField(SubjectRepresentation, 'subjects', null=True)
         self.assertEqual(field_2.instance_name, None)
@@ -380,7 +400,6 @@ class ManyToManyFieldTestCase(TestCase):
         self.assertEqual(field_2.related_name, None)
         self.assertEqual(field_2.null, True)
         self.assertEqual(field_2.full_repr, False)
-        self.assertEqual(field_2.value, None)
     
     def test_dehydrated_type(self):
         field_1 = ManyToManyField(SubjectRepresentation, 'subjects')
@@ -421,11 +440,11 @@ class ManyToManyFieldTestCase(TestCase):
         subject_repr_list = field_4.dehydrate(self.note_1)
         self.assertEqual(len(subject_repr_list), 2)
         self.assertEqual(isinstance(subject_repr_list[0], SubjectRepresentation), True)
-        self.assertEqual(subject_repr_list[0].name.value, u'News')
-        self.assertEqual(subject_repr_list[0].url.value, u'/news/')
+        self.assertEqual(subject_repr_list[0].data['name'], u'News')
+        self.assertEqual(subject_repr_list[0].data['url'], u'/news/')
         self.assertEqual(isinstance(subject_repr_list[1], SubjectRepresentation), True)
-        self.assertEqual(subject_repr_list[1].name.value, u'Photos')
-        self.assertEqual(subject_repr_list[1].url.value, u'/photos/')
+        self.assertEqual(subject_repr_list[1].data['name'], u'Photos')
+        self.assertEqual(subject_repr_list[1].data['url'], u'/photos/')
         
         field_4 = ManyToManyField(SubjectRepresentation, 'subjects')
         self.assertEqual(field_4.dehydrate(self.note_2), ['/api/v1/subjects/1/', '/api/v1/subjects/3/'])
@@ -442,28 +461,24 @@ class ManyToManyFieldTestCase(TestCase):
         
         # The nullable case.
         field_2 = ManyToManyField(SubjectRepresentation, 'subjects', null=True)
-        field_2.value = None
-        self.assertEqual(field_2.hydrate_m2m(), None)
+        self.assertEqual(field_2.hydrate_m2m(None), None)
         
         field_3 = ManyToManyField(SubjectRepresentation, 'subjects', null=True)
-        field_3.value = []
-        self.assertEqual(field_3.hydrate_m2m(), [])
+        self.assertEqual(field_3.hydrate_m2m([]), [])
         
         # Wrong resource URI.
         field_4 = ManyToManyField(SubjectRepresentation, 'subjects')
-        field_4.value = ['/api/v1/subjects/abc/']
-        self.assertRaises(NotFound, field_4.hydrate_m2m)
+        self.assertRaises(NotFound, field_4.hydrate_m2m, ['/api/v1/subjects/abc/'])
         
         # A real, live attribute!
         field_5 = ManyToManyField(SubjectRepresentation, 'subjects')
-        field_5.value = ['/api/v1/subjects/1/']
-        subject_repr_list = field_5.hydrate_m2m()
+        subject_repr_list = field_5.hydrate_m2m(['/api/v1/subjects/1/'])
         self.assertEqual(len(subject_repr_list), 1)
-        self.assertEqual(subject_repr_list[0].name.value, u'News')
-        self.assertEqual(subject_repr_list[0].url.value, u'/news/')
+        self.assertEqual(subject_repr_list[0].data['name'], u'News')
+        self.assertEqual(subject_repr_list[0].data['url'], u'/news/')
         
         field_6 = ManyToManyField(SubjectRepresentation, 'subjects')
-        field_6.value = [
+        value = [
             {
                 'name': u'Foo',
                 'url': u'/foo/',
@@ -473,9 +488,9 @@ class ManyToManyFieldTestCase(TestCase):
                 'url': u'/bar/',
             },
         ]
-        subject_repr_list = field_6.hydrate_m2m()
+        subject_repr_list = field_6.hydrate_m2m(value)
         self.assertEqual(len(subject_repr_list), 2)
-        self.assertEqual(subject_repr_list[0].name.value, u'Foo')
-        self.assertEqual(subject_repr_list[0].url.value, u'/foo/')
-        self.assertEqual(subject_repr_list[1].name.value, u'Bar')
-        self.assertEqual(subject_repr_list[1].url.value, u'/bar/')
+        self.assertEqual(subject_repr_list[0].data['name'], u'Foo')
+        self.assertEqual(subject_repr_list[0].data['url'], u'/foo/')
+        self.assertEqual(subject_repr_list[1].data['name'], u'Bar')
+        self.assertEqual(subject_repr_list[1].data['url'], u'/bar/')
@@ -48,6 +48,17 @@ class PaginatorTestCase(TestCase):
         self.assertEqual(meta['next'], None)
         self.assertEqual(meta['total_count'], 6)
 
+    def test_unlimited(self):
+        paginator = Paginator({}, self.repr_set, limit=0, offset=2)
+        page = paginator.page()
+        self.assertEqual(len(list(page['objects'])), 4)
+        meta = page['meta']
+        self.assertEqual(meta['limit'], 0)
+        self.assertEqual(meta['offset'], 2)
+        self.assertEqual(meta['previous'], None)
+        self.assertEqual(meta['next'], None)
+        self.assertEqual(meta['total_count'], 6)
+
     def test_limit(self):
         paginator = Paginator({}, self.repr_set, limit=20, offset=0)
 
@@ -4,8 +4,11 @@ from django.test import TestCase
 from django.core.urlresolvers import NoReverseMatch
 from tastypie import fields
 from tastypie.representations.simple import Representation, RepresentationSet
-from tastypie.representations.models import ModelRepresentation
-from core.models import Note, Subject
+from tastypie.representations.models import ModelRepresentation, load_to_many
+from core.models import Label, Note, Subject
+# The ones registered as canonical in ``core.tests.field_urls``.
+from core.tests.api import UserRepresentation
+from core.tests.fields import SubjectRepresentation
 
 
 class TestObject(object):
@@ -26,13 +29,13 @@ class BasicRepresentation(Representation):
         if getattr(obj, 'date_joined', None) is not None:
             return obj.date_joined
         
-        if self.date_joined.value is not None:
-            return self.date_joined.value
+        if self.data.get('date_joined') is not None:
+            return self.data.get('date_joined')
         
         return datetime.datetime(2010, 3, 27, 22, 30, 0)
     
     def hydrate_date_joined(self):
-        self.instance.date_joined = self.date_joined.value
+        self.instance.date_joined = self.data['date_joined']
 
 
 class AnotherBasicRepresentation(BasicRepresentation):
@@ -91,15 +94,15 @@ class RepresentationTestCase(TestCase):
         basic = BasicRepresentation()
         
         # Sanity check.
-        self.assertEqual(basic.name.value, None)
-        self.assertEqual(basic.view_count.value, None)
-        self.assertEqual(basic.date_joined.value, None)
+        self.assertEqual(basic.data.get('name'), None)
+        self.assertEqual(basic.data.get('view_count'), None)
+        self.assertEqual(basic.data.get('date_joined'), None)
         
         basic.full_dehydrate(test_object_1)
-        self.assertEqual(basic.name.value, 'Daniel')
-        self.assertEqual(basic.view_count.value, 12)
-        self.assertEqual(basic.date_joined.value.year, 2010)
-        self.assertEqual(basic.date_joined.value.day, 30)
+        self.assertEqual(basic.data['name'], 'Daniel')
+        self.assertEqual(basic.data['view_count'], 12)
+        self.assertEqual(basic.data['date_joined'].year, 2010)
+        self.assertEqual(basic.data['date_joined'].day, 30)
         
         # Now check the fallback behaviors.
         test_object_2 = TestObject()
@@ -107,15 +110,15 @@ class RepresentationTestCase(TestCase):
         basic_2 = BasicRepresentation()
         
         # Sanity check.
-        self.assertEqual(basic_2.name.value, None)
-        self.assertEqual(basic_2.view_count.value, None)
-        self.assertEqual(basic_2.date_joined.value, None)
+        self.assertEqual(basic_2.data.get('name'), None)
+        self.assertEqual(basic_2.data.get('view_count'), None)
+        self.assertEqual(basic_2.data.get('date_joined'), None)
         
         basic_2.full_dehydrate(test_object_2)
-        self.assertEqual(basic_2.name.value, 'Daniel')
-        self.assertEqual(basic_2.view_count.value, 0)
-        self.assertEqual(basic_2.date_joined.value.year, 2010)
-        self.assertEqual(basic_2.date_joined.value.day, 27)
+        self.assertEqual(basic_2.data['name'], 'Daniel')
+        self.assertEqual(basic_2.data['view_count'], 0)
+        self.assertEqual(basic_2.data['date_joined'].year, 2010)
+        self.assertEqual(basic_2.data['date_joined'].day, 27)
         
         test_object_3 = TestObject()
         test_object_3.name = 'Joe'
@@ -125,25 +128,45 @@ class RepresentationTestCase(TestCase):
         another_1 = AnotherBasicRepresentation()
         
         # Sanity check.
-        self.assertEqual(another_1.name.value, None)
-        self.assertEqual(another_1.view_count.value, None)
-        self.assertEqual(another_1.date_joined.value, None)
-        self.assertEqual(another_1.is_active.value, None)
+        self.assertEqual(another_1.data.get('name'), None)
+        self.assertEqual(another_1.data.get('view_count'), None)
+        self.assertEqual(another_1.data.get('date_joined'), None)
+        self.assertEqual(another_1.data.get('is_active'), None)
         
         another_1.full_dehydrate(test_object_3)
-        self.assertEqual(another_1.name.value, 'Joe')
-        self.assertEqual(another_1.view_count.value, 5)
-        self.assertEqual(another_1.date_joined.value.year, 2010)
-        self.assertEqual(another_1.date_joined.value.day, 29)
-        self.assertEqual(another_1.is_active.value, False)
+        self.assertEqual(another_1.data['name'], 'Joe')
+        self.assertEqual(another_1.data['view_count'], 5)
+        self.assertEqual(another_1.data['date_joined'].year, 2010)
+        self.assertEqual(another_1.data['date_joined'].day, 29)
+        self.assertEqual(another_1.data['is_active'], False)
+    
+    def test_fields_are_shared(self):
+        test_object_1 = TestObject()
+        test_object_1.name = 'Daniel'
+        test_object_1.view_count = 12
+        test_object_2 = TestObject()
+        test_object_2.name = 'Joe'
+        
+        basic_1 = BasicRepresentation()
+        basic_2 = BasicRepresentation()
+        self.assert_(basic_1.fields['name'] is basic_2.fields['name'])
+        self.assert_(basic_1.fields['name'] is BasicRepresentation.base_fields['name'])
+        
+        # The data stays with the representation, not the shared field.
+        basic_1.full_dehydrate(test_object_1)
+        basic_2.full_dehydrate(test_object_2)
+        self.assertEqual(basic_1.data['name'], 'Daniel')
+        self.assertEqual(basic_1.data['view_count'], 12)
+        self.assertEqual(basic_2.data['name'], 'Joe')
+        self.assertEqual(basic_2.data['view_count'], 0)
     
     def test_full_hydrate(self):
         basic = BasicRepresentation()
         
         # Sanity check.
-        self.assertEqual(basic.name.value, None)
-        self.assertEqual(basic.view_count.value, None)
-        self.assertEqual(basic.date_joined.value, None)
+        self.assertEqual(basic.data.get('name'), None)
+        self.assertEqual(basic.data.get('view_count'), None)
+        self.assertEqual(basic.data.get('date_joined'), None)
         
         basic = BasicRepresentation(data={
             'name': 'Daniel',
@@ -152,21 +175,33 @@ class RepresentationTestCase(TestCase):
         })
         
         # Sanity check.
-        self.assertEqual(basic.name.value, 'Daniel')
-        self.assertEqual(basic.view_count.value, 6)
-        self.assertEqual(basic.date_joined.value, datetime.datetime(2010, 2, 15, 12, 0, 0))
+        self.assertEqual(basic.data['name'], 'Daniel')
+        self.assertEqual(basic.data['view_count'], 6)
+        self.assertEqual(basic.data['date_joined'], datetime.datetime(2010, 2, 15, 12, 0, 0))
         self.assertEqual(basic.instance, None)
         
         # Now load up the data.
         basic.full_hydrate()
         
-        self.assertEqual(basic.name.value, 'Daniel')
-        self.assertEqual(basic.view_count.value, 6)
-        self.assertEqual(basic.date_joined.value, datetime.datetime(2010, 2, 15, 12, 0, 0))
+        self.assertEqual(basic.data['name'], 'Daniel')
+        self.assertEqual(basic.data['view_count'], 6)
+        self.assertEqual(basic.data['date_joined'], datetime.datetime(2010, 2, 15, 12, 0, 0))
         self.assertEqual(basic.instance.name, 'Daniel')
         self.assertEqual(basic.instance.view_count, 6)
         self.assertEqual(basic.instance.date_joined, datetime.datetime(2010, 2, 15, 12, 0, 0))
     
+    def test_overrides(self):
+        # Only the fields with an override are listed, found once per class.
+        self.assertEqual(sorted(BasicRepresentation._overrides['dehydrate']), [
+            ('date_joined', BasicRepresentation.dehydrate_date_joined.im_func),
+            ('resource_uri', Representation.dehydrate_resource_uri.im_func),
+        ])
+        self.assertEqual(BasicRepresentation._overrides['hydrate'], [('date_joined', BasicRepresentation.hydrate_date_joined.im_func)])
+        self.assertEqual(BasicRepresentation._overrides['hydrate_m2m'], [])
+        
+        # Inherited overrides are picked up as well.
+        self.assertEqual(NoUriBasicRepresentation._overrides['dehydrate'], [('date_joined', BasicRepresentation.dehydrate_date_joined.im_func)])
+    
     def test_get_list(self):
         self.assertRaises(NotImplementedError, BasicRepresentation.get_list)
     
@@ -235,16 +270,6 @@ class NoUriNoteRepresentation(ModelRepresentation):
         include_resource_uri = False
 
 
-class UserRepresentation(ModelRepresentation):
-    class Meta:
-        queryset = User.objects.all()
-
-
-class SubjectRepresentation(ModelRepresentation):
-    class Meta:
-        queryset = Subject.objects.all()
-
-
 class RelatedNoteRepresentation(ModelRepresentation):
     author = fields.ForeignKey(UserRepresentation, 'author')
     subjects = fields.ManyToManyField(SubjectRepresentation, 'subjects')
@@ -254,6 +279,20 @@ class RelatedNoteRepresentation(ModelRepresentation):
         fields = ['title', 'slug', 'content', 'created', 'is_active']
 
 
+class OldStyleNoteRepresentation(ModelRepresentation):
+    class Meta:
+        queryset = Note.objects.all()
+    
+    # Instance methods, as they were before the fields were built per class.
+    def should_skip_field(self, field):
+        return field.name == 'content' or super(OldStyleNoteRepresentation, self).should_skip_field(field)
+    
+    def get_fields(self, field_names=None, excludes=None):
+        final_fields = super(OldStyleNoteRepresentation, self).get_fields(field_names, excludes)
+        final_fields['headline'] = fields.CharField(attribute=self.object_class._meta.get_field('title').name)
+        return final_fields
+
+
 class ModelRepresentationTestCase(TestCase):
     fixtures = ['note_testdata.json']
     urls = 'core.tests.field_urls'
@@ -286,40 +325,58 @@ class ModelRepresentationTestCase(TestCase):
         self.assertEqual(len(no_uri.fields), 6)
         self.assertEqual(sorted(no_uri.fields.keys()), ['content', 'created', 'is_active', 'slug', 'title', 'updated'])
     
+    def test_legacy_introspection(self):
+        self.assertEqual(sorted(OldStyleNoteRepresentation.base_fields.keys()), ['created', 'headline', 'is_active', 'resource_uri', 'slug', 'title', 'updated'])
+        note = OldStyleNoteRepresentation()
+        note.get(pk=1)
+        self.assertEqual(note.data['headline'], u'First Post!')
+    
+    def test_fields_built_per_class(self):
+        # The model is introspected when the class is built...
+        self.assertEqual(sorted(NoteRepresentation.base_fields.keys()), ['content', 'created', 'is_active', 'resource_uri', 'slug', 'title', 'updated'])
+        self.assertEqual(sorted(CustomNoteRepresentation.base_fields.keys()), ['author', 'constant', 'content', 'created', 'is_active', 'resource_uri', 'title'])
+        self.assertEqual(sorted(NoUriNoteRepresentation.base_fields.keys()), ['content', 'created', 'is_active', 'slug', 'title', 'updated'])
+        
+        # ... and not again per instance.
+        note = NoteRepresentation()
+        self.assertEqual(sorted(note.fields.keys()), sorted(NoteRepresentation.base_fields.keys()))
+        self.assertEqual(isinstance(note.fields['title'], fields.CharField), True)
+        self.assertEqual(note.fields['content'].default, '')
+    
     def test_get_list(self):
         notes = NoteRepresentation.get_list()
         self.assertEqual(len(notes), 4)
-        self.assertEqual(notes[0].is_active.value, True)
-        self.assertEqual(notes[0].title.value, u'First Post!')
-        self.assertEqual(notes[1].is_active.value, True)
-        self.assertEqual(notes[1].title.value, u'Another Post')
-        self.assertEqual(notes[2].is_active.value, True)
-        self.assertEqual(notes[2].title.value, u'Recent Volcanic Activity.')
-        self.assertEqual(notes[3].is_active.value, True)
-        self.assertEqual(notes[3].title.value, u"Granny's Gone")
+        self.assertEqual(notes[0].data['is_active'], True)
+        self.assertEqual(notes[0].data['title'], u'First Post!')
+        self.assertEqual(notes[1].data['is_active'], True)
+        self.assertEqual(notes[1].data['title'], u'Another Post')
+        self.assertEqual(notes[2].data['is_active'], True)
+        self.assertEqual(notes[2].data['title'], u'Recent Volcanic Activity.')
+        self.assertEqual(notes[3].data['is_active'], True)
+        self.assertEqual(notes[3].data['title'], u"Granny's Gone")
         
         customs = CustomNoteRepresentation.get_list()
         self.assertEqual(len(customs), 6)
-        self.assertEqual(customs[0].is_active.value, True)
-        self.assertEqual(customs[0].title.value, u'First Post!')
-        self.assertEqual(customs[0].author.value, u'johndoe')
-        self.assertEqual(customs[0].constant.value, 20)
-        self.assertEqual(customs[1].is_active.value, True)
-        self.assertEqual(customs[1].title.value, u'Another Post')
-        self.assertEqual(customs[1].author.value, u'johndoe')
-        self.assertEqual(customs[1].constant.value, 20)
-        self.assertEqual(customs[2].is_active.value, False)
-        self.assertEqual(customs[2].title.value, u'Hello World!')
-        self.assertEqual(customs[2].author.value, u'janedoe')
-        self.assertEqual(customs[3].is_active.value, True)
-        self.assertEqual(customs[3].title.value, u'Recent Volcanic Activity.')
-        self.assertEqual(customs[3].author.value, u'janedoe')
-        self.assertEqual(customs[4].is_active.value, False)
-        self.assertEqual(customs[4].title.value, u'My favorite new show')
-        self.assertEqual(customs[4].author.value, u'johndoe')
-        self.assertEqual(customs[5].is_active.value, True)
-        self.assertEqual(customs[5].title.value, u"Granny's Gone")
-        self.assertEqual(customs[5].author.value, u'janedoe')
+        self.assertEqual(customs[0].data['is_active'], True)
+        self.assertEqual(customs[0].data['title'], u'First Post!')
+        self.assertEqual(customs[0].data['author'], u'johndoe')
+        self.assertEqual(customs[0].data['constant'], 20)
+        self.assertEqual(customs[1].data['is_active'], True)
+        self.assertEqual(customs[1].data['title'], u'Another Post')
+        self.assertEqual(customs[1].data['author'], u'johndoe')
+        self.assertEqual(customs[1].data['constant'], 20)
+        self.assertEqual(customs[2].data['is_active'], False)
+        self.assertEqual(customs[2].data['title'], u'Hello World!')
+        self.assertEqual(customs[2].data['author'], u'janedoe')
+        self.assertEqual(customs[3].data['is_active'], True)
+        self.assertEqual(customs[3].data['title'], u'Recent Volcanic Activity.')
+        self.assertEqual(customs[3].data['author'], u'janedoe')
+        self.assertEqual(customs[4].data['is_active'], False)
+        self.assertEqual(customs[4].data['title'], u'My favorite new show')
+        self.assertEqual(customs[4].data['author'], u'johndoe')
+        self.assertEqual(customs[5].data['is_active'], True)
+        self.assertEqual(customs[5].data['title'], u"Granny's Gone")
+        self.assertEqual(customs[5].data['author'], u'janedoe')
     
     def test_delete_list_custom_qs(self):
         self.assertEqual(len(Note.objects.all()), 6)
@@ -334,30 +391,30 @@ class ModelRepresentationTestCase(TestCase):
     def test_get(self):
         note = NoteRepresentation()
         note.get(pk=1)
-        self.assertEqual(note.content.value, u'This is my very first post using my shiny new API. Pretty sweet, huh?')
-        self.assertEqual(note.created.value, datetime.datetime(2010, 3, 30, 20, 5))
-        self.assertEqual(note.is_active.value, True)
-        self.assertEqual(note.slug.value, u'first-post')
-        self.assertEqual(note.title.value, u'First Post!')
-        self.assertEqual(note.updated.value, datetime.datetime(2010, 3, 30, 20, 5))
+        self.assertEqual(note.data['content'], u'This is my very first post using my shiny new API. Pretty sweet, huh?')
+        self.assertEqual(note.data['created'], datetime.datetime(2010, 3, 30, 20, 5))
+        self.assertEqual(note.data['is_active'], True)
+        self.assertEqual(note.data['slug'], u'first-post')
+        self.assertEqual(note.data['title'], u'First Post!')
+        self.assertEqual(note.data['updated'], datetime.datetime(2010, 3, 30, 20, 5))
         
         custom = CustomNoteRepresentation()
         custom.get(pk=1)
-        self.assertEqual(custom.content.value, u'This is my very first post using my shiny new API. Pretty sweet, huh?')
-        self.assertEqual(custom.created.value, datetime.datetime(2010, 3, 30, 20, 5))
-        self.assertEqual(custom.is_active.value, True)
-        self.assertEqual(custom.author.value, u'johndoe')
-        self.assertEqual(custom.title.value, u'First Post!')
-        self.assertEqual(custom.constant.value, 20)
+        self.assertEqual(custom.data['content'], u'This is my very first post using my shiny new API. Pretty sweet, huh?')
+        self.assertEqual(custom.data['created'], datetime.datetime(2010, 3, 30, 20, 5))
+        self.assertEqual(custom.data['is_active'], True)
+        self.assertEqual(custom.data['author'], u'johndoe')
+        self.assertEqual(custom.data['title'], u'First Post!')
+        self.assertEqual(custom.data['constant'], 20)
         
         related = RelatedNoteRepresentation(api_name='v1', resource_name='notes')
         related.get(pk=1)
-        self.assertEqual(related.content.value, u'This is my very first post using my shiny new API. Pretty sweet, huh?')
-        self.assertEqual(related.created.value, datetime.datetime(2010, 3, 30, 20, 5))
-        self.assertEqual(related.is_active.value, True)
-        self.assertEqual(related.author.value, '/api/v1/users/1/')
-        self.assertEqual(related.title.value, u'First Post!')
-        self.assertEqual(related.subjects.value, ['/api/v1/subjects/1/', '/api/v1/subjects/2/'])
+        self.assertEqual(related.data['content'], u'This is my very first post using my shiny new API. Pretty sweet, huh?')
+        self.assertEqual(related.data['created'], datetime.datetime(2010, 3, 30, 20, 5))
+        self.assertEqual(related.data['is_active'], True)
+        self.assertEqual(related.data['author'], '/api/v1/users/1/')
+        self.assertEqual(related.data['title'], u'First Post!')
+        self.assertEqual(related.data['subjects'], ['/api/v1/subjects/1/', '/api/v1/subjects/2/'])
     
     def test_create(self):
         self.assertEqual(Note.objects.all().count(), 6)
@@ -399,7 +456,7 @@ class ModelRepresentationTestCase(TestCase):
         self.assertEqual(Note.objects.all().count(), 6)
         note = NoteRepresentation()
         note.get(pk=1)
-        note.title.value = 'Whee!'
+        note.data['title'] = 'Whee!'
         note.update(pk=1)
         self.assertEqual(Note.objects.all().count(), 6)
         numero_uno = Note.objects.get(pk=1)
@@ -411,12 +468,12 @@ class ModelRepresentationTestCase(TestCase):
         self.assertEqual(Note.objects.all().count(), 6)
         note = RelatedNoteRepresentation(api_name='v1', resource_name='notes')
         note.get(pk=1)
-        note.title.value = "Yet another new post!"
-        note.slug.value = "yet-another-new-post"
-        note.content.value = "WHEEEEEE!"
-        note.is_active.value = True
-        note.author.value = '/api/v1/users/2/'
-        note.subjects.value = ['/api/v1/subjects/2/', '/api/v1/subjects/1/']
+        note.data['title'] = "Yet another new post!"
+        note.data['slug'] = "yet-another-new-post"
+        note.data['content'] = "WHEEEEEE!"
+        note.data['is_active'] = True
+        note.data['author'] = '/api/v1/users/2/'
+        note.data['subjects'] = ['/api/v1/subjects/2/', '/api/v1/subjects/1/']
         note.update(pk=1)
         self.assertEqual(Note.objects.all().count(), 6)
         latest = Note.objects.get(slug='yet-another-new-post')
@@ -434,6 +491,22 @@ class ModelRepresentationTestCase(TestCase):
         note.delete(pk=1)
         self.assertEqual(Note.objects.all().count(), 5)
         self.assertRaises(Note.DoesNotExist, Note.objects.get, pk=1)
+    
+    def test_load_to_many_default_manager(self):
+        public = Label.objects.create(name='Public')
+        hidden = Label.objects.create(name='Hidden', is_active=False)
+        self.note_1.labels.add(public, hidden)
+        self.assertEqual([label.pk for label in self.note_1.labels.all()], [public.pk])
+        
+        # Only what the related model's default manager shows, as with
+        # ``.all()``, whether loading the objects or just their pks.
+        notes = [Note.objects.get(pk=1)]
+        self.assertEqual([label.pk for label in load_to_many(Note, notes, 'labels')], [public.pk])
+        self.assertEqual(load_to_many(Note, notes, 'labels', pks_only=True), [public.pk])
+        self.assertEqual(notes[0]._tastypie_prefetched_pks['labels'], [public.pk])
+        
+        # Plain managers still get the pks from the join table.
+        self.assertEqual(sorted(load_to_many(Note, notes, 'subjects', pks_only=True)), [self.subject_1.pk, self.subject_2.pk])
 
 
 class RepresentationSetTestCase(TestCase):
@@ -479,6 +552,30 @@ class RepresentationSetTestCase(TestCase):
 
         self.assertNotEqual(item0.instance.pk, item1.instance.pk)
 
+    def test_dehydrate_many(self):
+        objects = self.repr_set.dehydrate_many()
+        self.assertEqual(len(objects), 6)
+        self.assertEqual([type(obj) for obj in objects], [dict] * 6)
+        self.assertEqual(objects, [representation.to_dict() for representation in self.repr_set])
+        self.assertEqual(objects[0]['resource_uri'], '/api/v1/notes/1/')
+        
+        objects = self.repr_set[1:3].dehydrate_many()
+        self.assertEqual([obj['slug'] for obj in objects], [u'another-post', u'hello-world'])
+        
+        # Overrides are still honored.
+        custom_set = RepresentationSet(CustomNoteRepresentation, Note.objects.all(), {})
+        objects = custom_set.dehydrate_many()
+        self.assertEqual(objects[0]['author'], u'johndoe')
+        self.assertEqual(objects[0]['constant'], 20)
+        
+        test_object = TestObject()
+        test_object.name = 'Daniel'
+        custom_set = RepresentationSet(NoUriBasicRepresentation, [test_object], {})
+        objects = custom_set.dehydrate_many()
+        self.assertEqual(objects[0]['name'], 'Daniel')
+        self.assertEqual(objects[0]['view_count'], 0)
+        self.assertEqual(objects[0]['date_joined'], datetime.datetime(2010, 3, 27, 22, 30, 0))
+    
     def test_resource_uri(self):
         self.assertEqual(self.repr_set.get_resource_uri(), '/api/v1/notes/')
 
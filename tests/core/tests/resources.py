@@ -1,12 +1,19 @@
 import base64
+import datetime
+import sys
+import threading
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
 from django.http import HttpRequest, QueryDict
 from django.test import TestCase
+from django.utils import simplejson
+from tastypie import fields
 from tastypie.authentication import BasicAuthentication
+from tastypie.exceptions import ApiFieldError, BadRequest, NotFound
 from tastypie.representations.models import ModelRepresentation
+from tastypie.representations.simple import Representation, RepresentationSet
 from tastypie.resources import Resource
 from tastypie.serializers import Serializer
 from tastypie.throttle import CacheThrottle
@@ -38,6 +45,46 @@ class NoteResource(Resource):
     resource_name = 'notes'
 
 
+class BrokenNoteRepresentation(NoteRepresentation):
+    missing = fields.CharField(attribute='missing')
+    
+    class Meta:
+        queryset = Note.objects.filter(is_active=True)
+
+
+class BrokenNoteResource(Resource):
+    representation = BrokenNoteRepresentation
+    resource_name = 'notes'
+
+
+class PrivateNoteResource(NoteResource):
+    # Per-object authorization, of sorts.
+    def fetch_detail(self, fields=None, **kwargs):
+        if kwargs.get('obj_id') == '2':
+            raise NotFound("Not yours.")
+        
+        return super(PrivateNoteResource, self).fetch_detail(fields=fields, **kwargs)
+
+
+class ListedNoteResource(NoteResource):
+    def fetch_list(self, fields=None, **kwargs):
+        return list(super(ListedNoteResource, self).fetch_list(fields=fields, **kwargs))
+
+
+class LegacyNoteRepresentation(NoteRepresentation):
+    class Meta:
+        queryset = Note.objects.filter(is_active=True)
+    
+    # Predates ``fields``.
+    def __init__(self, api_name=None, resource_name=None, data={}):
+        super(LegacyNoteRepresentation, self).__init__(api_name=api_name, resource_name=resource_name, data=data)
+
+
+class LegacyNoteResource(Resource):
+    representation = LegacyNoteRepresentation
+    resource_name = 'notes'
+
+
 class ThrottledNoteResource(Resource):
     representation = NoteRepresentation
     resource_name = 'notes'
@@ -180,7 +227,7 @@ class ResourceTestCase(TestCase):
         
         resp = resource.get_list(request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]}')
         
         # Test slicing.
         # First an invalid offset.
@@ -202,19 +249,19 @@ class ResourceTestCase(TestCase):
         request.GET = {'format': 'json', 'offset': 0, 'limit': 2}
         resp = resource.get_list(request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}]}')
         
         # Valid, slightly overlapping slice.
         request.GET = {'format': 'json', 'offset': 1, 'limit': 2}
         resp = resource.get_list(request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 1, "previous": null, "total_count": 4}, "objects": [{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 1, "previous": null, "total_count": 4}, "objects": [{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}]}')
         
         # Valid, non-overlapping slice.
         request.GET = {'format': 'json', 'offset': 3, 'limit': 2}
         resp = resource.get_list(request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 3, "previous": null, "total_count": 4}, "objects": [{"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 3, "previous": null, "total_count": 4}, "objects": [{"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]}')
         
         # Valid, but beyond the bounds slice.
         request.GET = {'format': 'json', 'offset': 100, 'limit': 2}
@@ -229,14 +276,164 @@ class ResourceTestCase(TestCase):
         
         resp = resource.get_detail(request, obj_id=1)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}')
+        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}')
         
         resp = resource.get_detail(request, obj_id=2)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}')
+        self.assertEqual(resp.content, '{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}')
         
         resp = resource.get_detail(request, obj_id=300)
         self.assertEqual(resp.status_code, 410)
+        
+        request.GET = {'format': 'json', 'fields': 'title,resource_uri'}
+        resp = resource.get_detail(request, obj_id=1)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '{"resource_uri": "/api/v1/notes/1/", "title": "First Post!"}')
+        
+        request.GET = {'format': 'msgpack', 'fields': 'title,created'}
+        resp = resource.get_detail(request, obj_id=1)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-msgpack; charset=utf-8')
+        self.assertEqual(Serializer().from_msgpack(resp.content), {'title': u'First Post!', 'created': datetime.datetime(2010, 3, 30, 20, 5)})
+    
+    def test_get_requested_fields(self):
+        resource = NoteResource()
+        request = HttpRequest()
+        
+        request.GET = {'format': 'json'}
+        self.assertEqual(resource.get_requested_fields(request), None)
+        
+        request.GET = {'format': 'json', 'fields': ''}
+        self.assertEqual(resource.get_requested_fields(request), None)
+        
+        request.GET = {'format': 'json', 'fields': 'title, resource_uri,title'}
+        self.assertEqual(resource.get_requested_fields(request), ['resource_uri', 'title'])
+        
+        request.GET = {'format': 'json', 'fields': 'title,password'}
+        self.assertRaises(BadRequest, resource.get_requested_fields, request)
+    
+    def test_get_list_streaming(self):
+        resource = NoteResource()
+        request = HttpRequest()
+        request.GET = {'format': 'json'}
+        expected = resource.get_list(request).content.replace('"limit": 20', '"limit": 0')
+        
+        # No limit, so it gets streamed.
+        request.GET = {'format': 'json', 'limit': 0}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp._is_string, False)
+        self.assertEqual(resp.content, expected)
+        
+        request.GET = {'format': 'jsonp', 'limit': 0, 'callback': 'notes'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp._is_string, False)
+        self.assertEqual(resp.content, 'notes(%s)' % expected)
+        
+        request.GET = {'format': 'xml'}
+        expected = resource.get_list(request).content.replace('<limit type="integer">20</limit>', '<limit type="integer">0</limit>')
+        request.GET = {'format': 'xml', 'limit': 0}
+        resp = resource.get_list(request)
+        self.assertEqual(resp._is_string, False)
+        self.assertEqual(resp.content, expected)
+        
+        # Just the objects, a line each.
+        request.GET = {'format': 'ndjson', 'limit': 0, 'fields': 'title'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp._is_string, False)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(resp.content, '{"title": "First Post!"}\n{"title": "Another Post"}\n{"title": "Recent Volcanic Activity."}\n{"title": "Granny\'s Gone"}\n')
+        
+        request.GET = {'format': 'csv', 'limit': 0, 'fields': 'slug,title'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp._is_string, False)
+        self.assertEqual(resp['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(resp.content, 'slug,title\r\nfirst-post,First Post!\r\nanother-post,Another Post\r\nrecent-volcanic-activity,Recent Volcanic Activity.\r\ngrannys-gone,Granny\'s Gone\r\n')
+        
+        # An empty export still has its header.
+        request.GET = {'format': 'csv', 'limit': 0, 'offset': 4, 'fields': 'slug,title'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.content, 'slug,title\r\n')
+        
+        request.GET = {'format': 'csv', 'limit': 20, 'offset': 4}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.content, 'content,created,is_active,resource_uri,slug,title,updated\r\n')
+        
+        request.GET = {'format': 'json', 'limit': 0, 'offset': 3, 'fields': 'title'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.content, '{"meta": {"limit": 0, "next": null, "offset": 3, "previous": null, "total_count": 4}, "objects": [{"title": "Granny\'s Gone"}]}')
+        
+        request.GET = {'format': 'json', 'limit': 0, 'offset': 4}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.content, '{"meta": {"limit": 0, "next": null, "offset": 4, "previous": null, "total_count": 4}, "objects": []}')
+        
+        # Fails before the response is built, rather than partway through it.
+        request.GET = {'format': 'json', 'limit': 0}
+        self.assertRaises(ApiFieldError, BrokenNoteResource().get_list, request)
+    
+    def test_legacy_representation(self):
+        resource = LegacyNoteResource()
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = {'format': 'json', 'limit': 1}
+        
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '{"meta": {"limit": 1, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}]}')
+        
+        resp = resource.get_detail(request, obj_id=2)
+        self.assertEqual(resp.status_code, 200)
+        
+        resp = resource.get_multiple(request, id_list='2;1')
+        self.assertEqual(resp.status_code, 200)
+    
+    def test_get_list_columnar(self):
+        resource = NoteResource()
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = {'format': 'json', 'fields': 'slug,title', 'layout': 'columnar', 'limit': 2}
+        
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '{"fields": ["slug", "title"], "meta": {"limit": 2, "next": null, "offset": 0, "previous": null, "total_count": 4}, "rows": [["first-post", "First Post!"], ["another-post", "Another Post"]]}')
+        
+        # Not streamed, as the fields go first.
+        request.GET = {'format': 'json', 'fields': 'title', 'layout': 'columnar', 'limit': 0}
+        resp = resource.get_list(request)
+        self.assertEqual(resp._is_string, True)
+        self.assertEqual(resp.content, '{"fields": ["title"], "meta": {"limit": 0, "next": null, "offset": 0, "previous": null, "total_count": 4}, "rows": [["First Post!"], ["Another Post"], ["Recent Volcanic Activity."], ["Granny\'s Gone"]]}')
+        
+        resp = resource.get_multiple(request, id_list='2;1')
+        self.assertEqual(resp.content, '{"fields": ["title"], "rows": [["Another Post"], ["First Post!"]]}')
+        
+        request.GET = {'format': 'json', 'layout': 'rows'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 400)
+    
+    def test_sparse_fields(self):
+        resource = NoteResource()
+        request = HttpRequest()
+        request.GET = {'format': 'json', 'fields': 'title,resource_uri', 'limit': 2}
+        
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '{"meta": {"limit": 2, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"resource_uri": "/api/v1/notes/1/", "title": "First Post!"}, {"resource_uri": "/api/v1/notes/2/", "title": "Another Post"}]}')
+        
+        request.method = 'GET'
+        resp = resource.get_multiple(request, id_list='2;1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '{"objects": [{"resource_uri": "/api/v1/notes/2/", "title": "Another Post"}, {"resource_uri": "/api/v1/notes/1/", "title": "First Post!"}]}')
+        
+        request.GET = {'format': 'json', 'fields': 'title,nope'}
+        resp = resource.get_list(request)
+        self.assertEqual(resp.status_code, 400)
+        resp = resource.get_detail(request, obj_id=1)
+        self.assertEqual(resp.status_code, 400)
+        resp = resource.get_multiple(request, id_list='1')
+        self.assertEqual(resp.status_code, 400)
+        
+        # The fields only get loaded if they're used.
+        self.assertEqual(sorted(NoteRepresentation.get_columns(['title'])), ['id', 'title'])
     
     def test_put_list(self):
         resource = NoteResource()
@@ -254,6 +451,26 @@ class ResourceTestCase(TestCase):
         new_note = Note.objects.get(slug='cat-is-back-again')
         self.assertEqual(new_note.content, "The cat is back. The dog coughed him up out back.")
     
+    def test_put_list_columnar(self):
+        resource = NoteResource()
+        request = HttpRequest()
+        request.GET = {'format': 'json'}
+        request.method = 'PUT'
+        request.raw_post_data = '{"fields": ["content", "created", "is_active", "slug", "title", "updated"], "rows": [["The cat is back. The dog coughed him up out back.", "2010-04-03 20:05:00", true, "cat-is-back-again", "The Cat Is Back", "2010-04-03 20:05:00"]]}'
+        
+        # Only read as columnar when asked to.
+        self.assertEqual(resource.deserialize(request, request.raw_post_data), {'fields': [u'content', u'created', u'is_active', u'slug', u'title', u'updated'], 'rows': [[u'The cat is back. The dog coughed him up out back.', u'2010-04-03 20:05:00', True, u'cat-is-back-again', u'The Cat Is Back', u'2010-04-03 20:05:00']]})
+        resp = resource.put_list(request)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Note.objects.count(), 6)
+        
+        request.GET = {'format': 'json', 'layout': 'columnar'}
+        resp = resource.put_list(request)
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(Note.objects.count(), 3)
+        new_note = Note.objects.get(slug='cat-is-back-again')
+        self.assertEqual(new_note.title, "The Cat Is Back")
+    
     def test_put_detail(self):
         self.assertEqual(Note.objects.count(), 6)
         resource = NoteResource()
@@ -330,7 +547,7 @@ class ResourceTestCase(TestCase):
         
         resp = resource.dispatch_list(request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]}')
     
     def test_dispatch_detail(self):
         resource = NoteResource()
@@ -340,7 +557,7 @@ class ResourceTestCase(TestCase):
         
         resp = resource.dispatch_detail(request, obj_id=1)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}')
+        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}')
     
     def test_dispatch(self):
         resource = NoteResource()
@@ -350,36 +567,36 @@ class ResourceTestCase(TestCase):
         
         resp = resource.dispatch('list', request)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"meta": {"limit": 20, "next": null, "offset": 0, "previous": null, "total_count": 4}, "objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]}')
         
         resp = resource.dispatch('detail', request, obj_id=1)
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}')
+        self.assertEqual(resp.content, '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}')
     
     def test_build_representation(self):
         resource = NoteResource()
         
         unpopulated_repr = resource.build_representation()
         self.assertTrue(isinstance(unpopulated_repr, NoteRepresentation))
-        self.assertEqual(unpopulated_repr.title.value, None)
+        self.assertEqual(unpopulated_repr.data.get('title'), None)
         
         populated_repr = resource.build_representation(data={'title': 'Foo'})
         self.assertTrue(isinstance(populated_repr, NoteRepresentation))
-        self.assertEqual(populated_repr.title.value, 'Foo')
+        self.assertEqual(populated_repr.data['title'], 'Foo')
     
     def test_fetch_list(self):
         resource = NoteResource()
         
         object_list = resource.fetch_list()
         self.assertEqual(len(object_list), 4)
-        self.assertEqual(object_list[0].title.value, u'First Post!')
+        self.assertEqual(object_list[0].data['title'], u'First Post!')
     
     def test_fetch_detail(self):
         resource = NoteResource()
         
         representation = resource.fetch_detail(obj_id=1)
         self.assertTrue(isinstance(representation, NoteRepresentation))
-        self.assertEqual(representation.title.value, u'First Post!')
+        self.assertEqual(representation.data['title'], u'First Post!')
 
     def test_jsonp_validation(self):
         resource = NoteResource()
@@ -417,19 +634,40 @@ class ResourceTestCase(TestCase):
         
         resp = resource.get_multiple(request, id_list='1')
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}]}')
         
         resp = resource.get_multiple(request, id_list='1;2')
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}]}')
         
         resp = resource.get_multiple(request, id_list='2;3')
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"not_found": ["3"], "objects": [{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"not_found": ["3"], "objects": [{"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}]}')
+        
+        # However the ids are written, they're the same notes.
+        resp = resource.get_multiple(request, id_list='001; 2;abc')
+        self.assertEqual(resp.status_code, 200)
+        data = simplejson.loads(resp.content)
+        self.assertEqual([obj['resource_uri'] for obj in data['objects']], ['/api/v1/notes/1/', '/api/v1/notes/2/'])
+        self.assertEqual(data['not_found'], ['abc'])
+        
+        # Overrides of ``fetch_detail`` still apply.
+        resp = PrivateNoteResource().get_multiple(request, id_list='1;2;abc')
+        self.assertEqual(resp.status_code, 200)
+        data = simplejson.loads(resp.content)
+        self.assertEqual([obj['resource_uri'] for obj in data['objects']], ['/api/v1/notes/1/'])
+        self.assertEqual(data['not_found'], ['2', 'abc'])
+        
+        # As does a ``fetch_list`` that doesn't give back a ``RepresentationSet``.
+        resp = ListedNoteResource().get_multiple(request, id_list='2;1;3')
+        self.assertEqual(resp.status_code, 200)
+        data = simplejson.loads(resp.content)
+        self.assertEqual([obj['resource_uri'] for obj in data['objects']], ['/api/v1/notes/2/', '/api/v1/notes/1/'])
+        self.assertEqual(data['not_found'], ['3'])
         
         resp = resource.get_multiple(request, id_list='1;2;4;6')
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]}')
+        self.assertEqual(resp.content, '{"objects": [{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/1/", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/2/", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/4/", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "/api/v1/notes/6/", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]}')
     
     def test_check_throttling(self):
         resource = ThrottledNoteResource()
@@ -463,20 +701,28 @@ class ResourceTestCase(TestCase):
         self.assertEqual(resource.generate_cache_key('abc', '123'), 'nonspecific:notes:abc:123:')
         self.assertEqual(resource.generate_cache_key(foo='bar', moof='baz'), 'nonspecific:notes::foo=bar:moof=baz')
         self.assertEqual(resource.generate_cache_key('abc', '123', foo='bar', moof='baz'), 'nonspecific:notes:abc:123:foo=bar:moof=baz')
+        self.assertEqual(resource.generate_cache_key('detail', fields=['resource_uri', 'title']), 'nonspecific:notes:detail:fields=resource_uri,title')
     
     def test_cached_fetch_list(self):
         resource = NoteResource()
         
         object_list = resource.cached_fetch_list()
         self.assertEqual(len(object_list), 4)
-        self.assertEqual(object_list[0].title.value, u'First Post!')
+        self.assertEqual(object_list[0].data['title'], u'First Post!')
     
     def test_cached_fetch_detail(self):
         resource = NoteResource()
         
         representation = resource.cached_fetch_detail(obj_id=1)
         self.assertTrue(isinstance(representation, NoteRepresentation))
-        self.assertEqual(representation.title.value, u'First Post!')
+        self.assertEqual(representation.data['title'], u'First Post!')
+        
+        # A sparse representation is cached separately.
+        representation = resource.cached_fetch_detail(obj_id=1, fields=['title'])
+        self.assertEqual(representation.to_dict(), {'title': u'First Post!'})
+        
+        representation = resource.cached_fetch_detail(obj_id=1)
+        self.assertEqual(representation.data['slug'], u'first-post')
 
 
 class BasicAuthResourceTestCase(TestCase):
@@ -515,3 +761,123 @@ class BasicAuthResourceTestCase(TestCase):
         
         resp = resource.dispatch_list(request)
         self.assertEqual(resp.status_code, 200)
+
+
+class Author(object):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class Quote(object):
+    def __init__(self, id, text, author):
+        self.id = id
+        self.text = text
+        self.author = author
+
+
+AUTHORS = [Author(1, u'Ford'), Author(2, u'Arthur')]
+QUOTES = [Quote(i, u'Quote #%s' % i, AUTHORS[i % 2]) for i in range(1, 31)]
+
+
+class AuthorRepresentation(Representation):
+    name = fields.CharField(attribute='name')
+    
+    class Meta:
+        object_class = Author
+    
+    def get_resource_uri(self):
+        return '/api/%s/authors/%s/' % (self.api_name, self.instance.id)
+
+
+class QuoteRepresentation(Representation):
+    text = fields.CharField(attribute='text')
+    author = fields.ForeignKey(AuthorRepresentation, 'author')
+    full_author = fields.ForeignKey(AuthorRepresentation, 'author', full_repr=True)
+    
+    class Meta:
+        object_class = Quote
+    
+    @classmethod
+    def get_list(cls, options=None, **kwargs):
+        return RepresentationSet(cls, QUOTES, options or {})
+    
+    def get(self, **kwargs):
+        self.instance = QUOTES[int(kwargs['pk']) - 1]
+        self.full_dehydrate(self.instance)
+    
+    def get_resource_uri(self):
+        return '/api/%s/quotes/%s/' % (self.api_name, self.instance.id)
+
+
+class QuoteResource(Resource):
+    representation = QuoteRepresentation
+    resource_name = 'quotes'
+    limit = 30
+
+
+class ThreadSafetyTestCase(TestCase):
+    def setUp(self):
+        super(ThreadSafetyTestCase, self).setUp()
+        # Switch threads as often as possible to shake out any races.
+        self.old_check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+    
+    def tearDown(self):
+        sys.setcheckinterval(self.old_check_interval)
+        super(ThreadSafetyTestCase, self).tearDown()
+    
+    def make_request(self, **get):
+        request = HttpRequest()
+        request.GET = QueryDict('').copy()
+        request.GET.update(get)
+        request.method = 'GET'
+        return request
+    
+    def test_concurrent_dispatch(self):
+        # Two ``Resource`` instances sharing the same representation classes,
+        # just like the same resource registered in two ``Api`` versions.
+        resources = [QuoteResource(api_name='v1'), QuoteResource(api_name='v2')]
+        jobs = []
+        
+        for resource in resources:
+            jobs.append((resource, 'list', {'format': 'json', 'limit': '30'}, {}))
+            jobs.append((resource, 'detail', {'format': 'json'}, {'obj_id': '7'}))
+            jobs.append((resource, 'list', {'format': 'xml', 'offset': '5', 'limit': '10'}, {}))
+        
+        # What each job should produce, computed without any concurrency.
+        expected = []
+        
+        for resource, request_type, get, kwargs in jobs:
+            response = resource.dispatch(request_type, self.make_request(**get), **kwargs)
+            self.assertEqual(response.status_code, 200)
+            expected.append(response.content)
+        
+        self.assert_('/api/v1/authors/2/' in expected[0])
+        self.assert_(not '/api/v2/' in expected[0])
+        self.assert_('/api/v2/authors/2/' in expected[3])
+        self.assert_(not '/api/v1/' in expected[3])
+        
+        failures = []
+        
+        def hammer(offset):
+            try:
+                for i in range(30):
+                    job_offset = (offset + i) % len(jobs)
+                    resource, request_type, get, kwargs = jobs[job_offset]
+                    response = resource.dispatch(request_type, self.make_request(**get), **kwargs)
+                    
+                    if response.content != expected[job_offset]:
+                        failures.append((job_offset, response.content))
+            except Exception, e:
+                failures.append((offset, repr(e)))
+        
+        threads = [threading.Thread(target=hammer, args=(offset,)) for offset in range(12)]
+        
+        for thread in threads:
+            thread.start()
+        
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(failures, [])
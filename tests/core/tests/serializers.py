@@ -1,6 +1,7 @@
 import datetime
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
+from tastypie.exceptions import UnsupportedFormat
 from tastypie.serializers import Serializer
 from tastypie.representations.models import ModelRepresentation
 from core.models import Note
@@ -12,13 +13,13 @@ class NoteRepresentation(ModelRepresentation):
 class SerializerTestCase(TestCase):
     def test_init(self):
         serializer_1 = Serializer()
-        self.assertEqual(serializer_1.formats, ['json', 'jsonp', 'xml', 'yaml', 'html'])
-        self.assertEqual(serializer_1.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'html': 'text/html'})
-        self.assertEqual(serializer_1.supported_formats, ['application/json', 'text/javascript', 'application/xml', 'text/yaml', 'text/html'])
+        self.assertEqual(serializer_1.formats, ['json', 'jsonp', 'ndjson', 'csv', 'msgpack', 'xml', 'yaml', 'html'])
+        self.assertEqual(serializer_1.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'msgpack': 'application/x-msgpack', 'html': 'text/html'})
+        self.assertEqual(serializer_1.supported_formats, ['application/json', 'text/javascript', 'application/x-ndjson', 'text/csv', 'application/x-msgpack', 'application/xml', 'text/yaml', 'text/html'])
         
         serializer_2 = Serializer(formats=['json', 'xml'])
         self.assertEqual(serializer_2.formats, ['json', 'xml'])
-        self.assertEqual(serializer_2.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'html': 'text/html'})
+        self.assertEqual(serializer_2.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'msgpack': 'application/x-msgpack', 'html': 'text/html'})
         self.assertEqual(serializer_2.supported_formats, ['application/json', 'application/xml'])
         
         serializer_3 = Serializer(formats=['json', 'xml'], content_types={'json': 'text/json', 'xml': 'application/xml'})
@@ -47,7 +48,7 @@ class SerializerTestCase(TestCase):
     def test_to_xml(self):
         serializer = Serializer()
         sample_1 = self.get_sample1()
-        self.assertEqual(serializer.to_xml(sample_1), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><age type="integer">27</age><name>Daniel</name><date_joined>27 Mar 2010</date_joined></response>')
+        self.assertEqual(serializer.to_xml(sample_1), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><age type="integer">27</age><name>Daniel</name><date_joined>2010-03-27</date_joined></response>')
 
     def test_to_xml2(self):
         serializer = Serializer()
@@ -68,7 +69,7 @@ class SerializerTestCase(TestCase):
         serializer = Serializer()
         
         sample_1 = self.get_sample1()
-        self.assertEqual(serializer.to_json(sample_1), '{"age": 27, "date_joined": "27 Mar 2010", "name": "Daniel"}')
+        self.assertEqual(serializer.to_json(sample_1), '{"age": 27, "date_joined": "2010-03-27", "name": "Daniel"}')
     
     def test_from_json(self):
         serializer = Serializer()
@@ -108,7 +109,41 @@ class SerializerTestCase(TestCase):
 
         sample_1 = self.get_sample1()
         options = {'callback': 'myCallback'}
-        self.assertEqual(serializer.to_jsonp(sample_1, options), 'myCallback({"age": 27, "date_joined": "27 Mar 2010", "name": "Daniel"})')
+        self.assertEqual(serializer.to_jsonp(sample_1, options), 'myCallback({"age": 27, "date_joined": "2010-03-27", "name": "Daniel"})')
+
+    def test_round_trip_ndjson(self):
+        serializer = Serializer()
+        sample_data = [self.get_sample2(), self.get_sample2()]
+        serialized = serializer.to_ndjson({'meta': {'total_count': 2}, 'objects': sample_data})
+        self.assertEqual(serialized.count('\n'), 2)
+        self.assertEqual(serializer.from_ndjson(serialized), sample_data)
+        self.assertEqual(serializer.to_ndjson({'name': 'Daniel'}), '{"name": "Daniel"}\n')
+
+    def test_round_trip_msgpack(self):
+        serializer = Serializer()
+        sample_data = self.get_sample2()
+        sample_data['created'] = datetime.datetime(2010, 3, 30, 20, 5, 0, 123456)
+        sample_data['somestring'] = u'\u2603'
+        serialized = serializer.to_msgpack(sample_data)
+        self.assertEqual(serializer.from_msgpack(serialized), sample_data)
+        
+        # Dates without a time don't have a native type.
+        self.assertEqual(serializer.from_msgpack(serializer.to_msgpack({'date_joined': datetime.date(2010, 3, 27)})), {'date_joined': u'2010-03-27'})
+
+    def test_to_csv(self):
+        serializer = Serializer()
+        sample_data = {
+            'meta': {'total_count': 2},
+            'objects': [
+                {'name': u'Daniel, \u2603', 'age': 27, 'links': ['/api/v1/notes/1/', '/api/v1/notes/2/'], 'editor': None},
+                {'name': u'Joe', 'age': 31, 'links': [], 'editor': {'resource_uri': '/api/v1/users/1/', 'username': 'johndoe'}},
+            ],
+        }
+        serialized = serializer.to_csv(sample_data)
+        self.assertEqual(serialized, 'age,editor,links,name\r\n27,,"/api/v1/notes/1/,/api/v1/notes/2/","Daniel, \xe2\x98\x83"\r\n31,/api/v1/users/1/,,Joe\r\n')
+        # Not something that can be read back in.
+        self.assertRaises(UnsupportedFormat, serializer.deserialize, serialized, format='text/csv')
+        self.assertEqual(serializer.to_csv([]), '')
 
 class RepresentationSerializationTestCase(TestCase):
     fixtures = ['note_testdata.json']
@@ -116,12 +151,12 @@ class RepresentationSerializationTestCase(TestCase):
     def test_to_xml_multirepr(self):
         serializer = Serializer()
         representations = NoteRepresentation.get_list()
-        self.assertEqual(serializer.to_xml(representations), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<objects><object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>Tue, 30 Mar 2010 20:05:00 -0500</updated><created>Tue, 30 Mar 2010 20:05:00 -0500</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object><object><content>The dog ate my cat today. He looks seriously uncomfortable.</content><updated>Wed, 31 Mar 2010 20:05:00 -0500</updated><created>Wed, 31 Mar 2010 20:05:00 -0500</created><title>Another Post</title><is_active type="boolean">True</is_active><slug>another-post</slug><resource_uri></resource_uri></object><object><content>My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.</content><updated>Thu, 1 Apr 2010 20:05:00 -0500</updated><created>Thu, 1 Apr 2010 20:05:00 -0500</created><title>Recent Volcanic Activity.</title><is_active type="boolean">True</is_active><slug>recent-volcanic-activity</slug><resource_uri></resource_uri></object><object><content>Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!</content><updated>Fri, 2 Apr 2010 10:05:00 -0500</updated><created>Fri, 2 Apr 2010 10:05:00 -0500</created><title>Granny\'s Gone</title><is_active type="boolean">True</is_active><slug>grannys-gone</slug><resource_uri></resource_uri></object></objects>')
+        self.assertEqual(serializer.to_xml(representations), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<objects><object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>2010-03-30T20:05:00-05:00</updated><created>2010-03-30T20:05:00-05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object><object><content>The dog ate my cat today. He looks seriously uncomfortable.</content><updated>2010-03-31T20:05:00-05:00</updated><created>2010-03-31T20:05:00-05:00</created><title>Another Post</title><is_active type="boolean">True</is_active><slug>another-post</slug><resource_uri></resource_uri></object><object><content>My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.</content><updated>2010-04-01T20:05:00-05:00</updated><created>2010-04-01T20:05:00-05:00</created><title>Recent Volcanic Activity.</title><is_active type="boolean">True</is_active><slug>recent-volcanic-activity</slug><resource_uri></resource_uri></object><object><content>Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!</content><updated>2010-04-02T10:05:00-05:00</updated><created>2010-04-02T10:05:00-05:00</created><title>Granny\'s Gone</title><is_active type="boolean">True</is_active><slug>grannys-gone</slug><resource_uri></resource_uri></object></objects>')
 
     def test_to_xml_single(self):
         serializer = Serializer()
         representation = NoteRepresentation.get_list()[0]
-        self.assertEqual(serializer.to_xml(representation), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>Tue, 30 Mar 2010 20:05:00 -0500</updated><created>Tue, 30 Mar 2010 20:05:00 -0500</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object>')
+        self.assertEqual(serializer.to_xml(representation), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>2010-03-30T20:05:00-05:00</updated><created>2010-03-30T20:05:00-05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object>')
 
     def test_to_xml_nested(self):
         serializer = Serializer()
@@ -132,17 +167,34 @@ class RepresentationSerializationTestCase(TestCase):
                 'object': representation,
             }
         }
-        self.assertEqual(serializer.to_xml(data), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><stuff type="hash"><foo>bar</foo><object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>Tue, 30 Mar 2010 20:05:00 -0500</updated><created>Tue, 30 Mar 2010 20:05:00 -0500</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object></stuff></response>')
+        self.assertEqual(serializer.to_xml(data), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><stuff type="hash"><foo>bar</foo><object><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><updated>2010-03-30T20:05:00-05:00</updated><created>2010-03-30T20:05:00-05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><resource_uri></resource_uri></object></stuff></response>')
+
+    def test_to_xml_stream(self):
+        serializer = Serializer()
+        page = {
+            'meta': {'limit': 0, 'offset': 0, 'total_count': 4},
+            'objects': NoteRepresentation.get_list().dehydrate_many(),
+        }
+        expected = serializer.to_xml(page)
+        
+        # The objects get consumed as they're written.
+        page['objects'] = iter(page['objects'])
+        chunks = list(serializer.to_xml_stream(page))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(''.join(chunks), expected)
+        
+        page = {'meta': {'total_count': 0}, 'objects': iter([])}
+        self.assertEqual(''.join(serializer.to_xml_stream(page)), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><meta type="hash"><total_count type="integer">0</total_count></meta><objects type="list"/></response>')
 
     def test_to_json_multirepr(self):
         serializer = Serializer()
         representations = NoteRepresentation.get_list()
-        self.assertEqual(serializer.to_json(representations), '[{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "Wed, 31 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "another-post", "title": "Another Post", "updated": "Wed, 31 Mar 2010 20:05:00 -0500"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "Thu, 1 Apr 2010 20:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "Thu, 1 Apr 2010 20:05:00 -0500"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "Fri, 2 Apr 2010 10:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "Fri, 2 Apr 2010 10:05:00 -0500"}]')
+        self.assertEqual(serializer.to_json(representations), '[{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00-05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00-05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00-05:00"}]')
 
     def test_to_json_single(self):
         serializer = Serializer()
         representation = NoteRepresentation.get_list()[0]
-        self.assertEqual(serializer.to_json(representation), '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}')
+        self.assertEqual(serializer.to_json(representation), '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}')
 
     def test_to_json_nested(self):
         serializer = Serializer()
@@ -153,4 +205,32 @@ class RepresentationSerializationTestCase(TestCase):
                 'object': representation,
             }
         }
-        self.assertEqual(serializer.to_json(data), '{"stuff": {"foo": "bar", "object": {"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "Tue, 30 Mar 2010 20:05:00 -0500", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "Tue, 30 Mar 2010 20:05:00 -0500"}}}')
+        self.assertEqual(serializer.to_json(data), '{"stuff": {"foo": "bar", "object": {"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00-05:00", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00-05:00"}}}')
+
+    def test_to_json_compiled(self):
+        serializer = Serializer()
+        objects = NoteRepresentation.get_list(options={'api_name': 'v1', 'resource_name': 'notes'}).dehydrate_many()
+        # A ``dehydrate`` hook may change what an object has.
+        objects[1]['extra'] = [1, u'caf\xe9', None, 3.5, datetime.date(2010, 3, 27)]
+        objects[2]['title'] = u'Recent Volcanic Activity \u2603'
+        page = {
+            'meta': {'limit': 20, 'offset': 0, 'previous': None, 'next': None, 'total_count': 4},
+            'objects': objects,
+        }
+        expected = serializer.to_json(page)
+        self.assertEqual(serializer.to_json(page, {'list_representation': NoteRepresentation}), expected)
+        self.assert_((NoteRepresentation, tuple(sorted(objects[0].keys()))) in serializer._json_encoders)
+        self.assertEqual(serializer.to_json(objects[3], {'detail_representation': NoteRepresentation}), serializer.to_json(objects[3]))
+        
+        # Custom ``to_simple`` methods are left in charge.
+        class UpperSerializer(Serializer):
+            def to_simple(self, data, options):
+                if isinstance(data, basestring):
+                    return data.upper()
+                
+                return super(UpperSerializer, self).to_simple(data, options)
+        
+        upper = UpperSerializer()
+        self.assertEqual(upper.to_json(page, {'list_representation': NoteRepresentation}), upper.to_json(page))
+        self.assert_('"FIRST POST!"' in upper.to_json(page, {'list_representation': NoteRepresentation}))
+        self.assertEqual(upper._json_encoders, {})
@@ -1,7 +1,13 @@
+import datetime
+from django.conf import settings
+from django.core.urlresolvers import NoReverseMatch, reverse
 from django.http import HttpRequest
 from django.test import TestCase
+from tastypie import fields
 from tastypie.serializers import Serializer
+from tastypie.utils.formatting import format_datetime, format_date, format_time, parse_date, parse_datetime
 from tastypie.utils.mime import determine_format, build_content_type
+from tastypie.utils.urls import get_detail_uri_template, reverse_detail_uri
 
 
 class MimeTestCase(TestCase):
@@ -54,3 +60,103 @@ class MimeTestCase(TestCase):
         
         request.META = {'HTTP_ACCEPT': 'text/plain,application/xml,application/json;q=0.9,*/*;q=0.8'}
         self.assertEqual(determine_format(request, serializer), 'application/xml')
+
+
+class FormattingTestCase(TestCase):
+    def test_format(self):
+        # Naive values are local time (``America/Chicago``), so they get its
+        # offset, as RFC 2822 did.
+        self.assertEqual(format_datetime(datetime.datetime(2010, 3, 30, 20, 5)), '2010-03-30T20:05:00-05:00')
+        self.assertEqual(format_datetime(datetime.datetime(2010, 1, 30, 20, 5, 0, 1234)), '2010-01-30T20:05:00.001234-06:00')
+        self.assertEqual(format_date(datetime.date(1812, 3, 27)), '1812-03-27')
+        self.assertEqual(format_time(datetime.time(20, 5, 1)), '20:05:01-06:00')
+        
+        for value in (datetime.datetime(2010, 3, 30, 20, 5), datetime.datetime(2010, 11, 7, 1, 30), datetime.datetime(2010, 12, 30, 20, 5, 0, 1234)):
+            self.assertEqual(parse_datetime(format_datetime(value)), value)
+            self.assertEqual(fields.DateTimeField().convert(format_datetime(value)), value)
+            self.assertEqual(fields.DateField().convert(format_date(value.date())), value.date())
+    
+    def test_format_rfc_2822(self):
+        old_formatting = getattr(settings, 'TASTYPIE_DATETIME_FORMATTING', None)
+        settings.TASTYPIE_DATETIME_FORMATTING = 'rfc-2822'
+        
+        try:
+            self.assertEqual(format_datetime(datetime.datetime(2010, 3, 30, 20, 5)), 'Tue, 30 Mar 2010 20:05:00 -0500')
+            self.assertEqual(format_date(datetime.date(2010, 3, 27)), '27 Mar 2010')
+            self.assertEqual(Serializer().to_json({'created': datetime.datetime(2010, 3, 30, 20, 5)}), '{"created": "Tue, 30 Mar 2010 20:05:00 -0500"}')
+            
+            # What goes out can be read back in.
+            self.assertEqual(parse_datetime('Tue, 30 Mar 2010 20:05:00 -0500'), datetime.datetime(2010, 3, 30, 20, 5))
+            self.assertEqual(parse_datetime('Tue, 30 Mar 2010 23:05:00 -0200'), datetime.datetime(2010, 3, 30, 20, 5))
+            self.assertEqual(parse_datetime('30 Mar 2010 20:05'), datetime.datetime(2010, 3, 30, 20, 5))
+            self.assertEqual(parse_date('27 Mar 2010'), datetime.date(2010, 3, 27))
+            # ISO 8601 is still understood.
+            self.assertEqual(parse_datetime('2010-04-02T01:11:00'), datetime.datetime(2010, 4, 2, 1, 11))
+            
+            for value in (datetime.datetime(2010, 3, 30, 20, 5), datetime.datetime(2010, 1, 30, 20, 5, 1), datetime.datetime(2010, 12, 30, 8, 5)):
+                self.assertEqual(parse_datetime(format_datetime(value)), value)
+                self.assertEqual(fields.DateTimeField().convert(format_datetime(value)), value)
+                self.assertEqual(parse_date(format_date(value.date())), value.date())
+                self.assertEqual(fields.DateField().convert(format_date(value.date())), value.date())
+            
+            for value in ('', '32 Mar 2010', 'Tue, 30 Mar 2010 junk'):
+                self.assertRaises(ValueError, parse_datetime, value)
+                self.assertRaises(ValueError, parse_date, value)
+        finally:
+            settings.TASTYPIE_DATETIME_FORMATTING = old_formatting
+            
+            if old_formatting is None:
+                del settings._wrapped.TASTYPIE_DATETIME_FORMATTING
+    
+    def test_parse_date(self):
+        self.assertEqual(parse_date('2010-04-02'), datetime.date(2010, 4, 2))
+        self.assertEqual(parse_date('2010-04-02T01:11:00'), datetime.date(2010, 4, 2))
+        
+        for value in ('', '2010-4-2', '2010-04-xx', '2010-02-30', '+010-04-02'):
+            self.assertRaises(ValueError, parse_date, value)
+    
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime('2010-04-02 01:11:00'), datetime.datetime(2010, 4, 2, 1, 11))
+        self.assertEqual(parse_datetime('2010-04-02T01:11'), datetime.datetime(2010, 4, 2, 1, 11))
+        self.assertEqual(parse_datetime('2010-04-02T01:11:05.25'), datetime.datetime(2010, 4, 2, 1, 11, 5, 250000))
+        self.assertEqual(parse_datetime(format_datetime(datetime.datetime(1812, 3, 30, 20, 5, 0, 1234))), datetime.datetime(1812, 3, 30, 20, 5, 0, 1234))
+        
+        # Offsets end up in local time (``America/Chicago``, CDT here).
+        self.assertEqual(parse_datetime('2010-04-02T06:11:00Z'), datetime.datetime(2010, 4, 2, 1, 11))
+        self.assertEqual(parse_datetime('2010-04-02T08:11:00+02:00'), datetime.datetime(2010, 4, 2, 1, 11))
+        self.assertEqual(parse_datetime('2010-04-02T01:11:00-0500'), datetime.datetime(2010, 4, 2, 1, 11))
+        self.assertEqual(parse_datetime('2010-04-02T08:11:00+02'), datetime.datetime(2010, 4, 2, 1, 11))
+        
+        for value in ('2010-04-02', '2010-04-02T1:11:00', '2010-04-02T01:11:00.', '2010-04-02T01:11:00 junk', '2010-04-02T01:11:00+5', '2010-04-02T01:11:00\n'):
+            self.assertRaises(ValueError, parse_datetime, value)
+
+
+class UrlsTestCase(TestCase):
+    urls = 'core.tests.api_urls'
+    
+    def test_get_detail_uri_template(self):
+        self.assertEqual(get_detail_uri_template('v1', 'notes'), ('/api/v1/notes/', '/'))
+        self.assertEqual(get_detail_uri_template('v1', 'unknown'), None)
+        self.assertEqual(get_detail_uri_template('v2', 'notes'), None)
+    
+    def test_reverse_detail_uri(self):
+        for api_name, resource_name, pk in (('v1', 'notes', 1), ('v1', 'notes', 12345L), ('v1', 'users', 0), ('v1', 'users', u'johndoe'), ('v1', 'notes', u'caf\xe9')):
+            self.assertEqual(reverse_detail_uri(pk, api_name, resource_name), reverse('api_dispatch_detail', kwargs={'api_name': api_name, 'resource_name': resource_name, 'obj_id': pk}))
+        
+        self.assertRaises(NoReverseMatch, reverse_detail_uri, 1, 'v1', 'unknown')
+
+
+class DigitUrlsTestCase(TestCase):
+    urls = 'core.tests.digit_urls'
+    
+    def test_get_detail_uri_template(self):
+        self.assertEqual(get_detail_uri_template(None, 'notes'), ('/notes/', '/'))
+        # Too long a placeholder for ``\d{1,3}``, so no template...
+        self.assertEqual(get_detail_uri_template(None, 'users'), None)
+    
+    def test_reverse_detail_uri(self):
+        self.assertEqual(reverse_detail_uri(7, None, 'notes'), '/notes/7/')
+        # ... & ``reverse`` still works for the real pks.
+        self.assertEqual(reverse_detail_uri(7, None, 'users'), '/users/7/')
+        self.assertRaises(NoReverseMatch, reverse_detail_uri, 1234, None, 'users')
+        self.assertRaises(NoReverseMatch, reverse_detail_uri, u'johndoe', None, 'notes')